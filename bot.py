@@ -1,14 +1,40 @@
+from typing import Optional
+
+import aiohttp
 import discord
 from discord.ext import commands
 
+import config
+from ui.components import GameButton
+
 intents = discord.Intents.all()
 intents.messages = True
 intents.guilds = True
 intents.members = True
 intents.message_content = True
 
-bot = commands.Bot(
+
+class CasinoBot(commands.Bot):
+    """HTTPセッションを1つだけ持ち、全ての外部リクエストで使い回すBot"""
+
+    http_session: Optional[aiohttp.ClientSession] = None
+
+    async def setup_hook(self) -> None:
+        self.http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=config.HTTP_POOL_LIMIT, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=config.HTTP_TIMEOUT)
+        )
+        # ゲームのボタンは custom_id から処理を引くので、再起動前のメッセージのボタンも受け付ける
+        self.add_dynamic_items(GameButton)
+
+    async def close(self) -> None:
+        if self.http_session is not None and not self.http_session.closed:
+            await self.http_session.close()
+        await super().close()
+
+
+bot = CasinoBot(
     command_prefix="!",
     intents=intents,
     help_command=None
-)
\ No newline at end of file
+)
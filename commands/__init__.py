@@ -1,7 +1,18 @@
-from typing import Callable, Awaitable
+"""`?` で始まるテキストコマンドのルーター。
+
+先頭の語を TEXT_COMMANDS から1回の辞書引きで探し、宣言した引数の型で残りの語を一度だけ解析して
+ハンドラに (message, *引数) で渡す。`?` で始まらないメッセージは分割もせずに通常のコマンド処理へ回す。
+終了処理中（start_draining() の後）は新しいコマンドを断り、実行中のものは in_flight() で数える。
+"""
+import re
+from collections import Counter
+from typing import Any, Awaitable, Callable, NamedTuple
 
 import discord
 
+from ui import components
+from utils.embed import create_embed
+
 from .balance import on_balance_command
 from .transfer import on_transfer_command
 from .mines import on_mines_command
@@ -10,27 +21,123 @@ from .blackjack import on_blackjack_command
 from .dice import on_dice_command
 from .rps import on_rps_command
 
-TEXT_COMMANDS: dict[str, Callable[[discord.Message], Awaitable[None]]] = {
-    "?残高": on_balance_command,
-    "?送金": on_transfer_command,
-    "?マインズ": on_mines_command,
-    "?フリップ": on_coinflip_command,
-    "?ダイス": on_dice_command,
-    "?bj": on_blackjack_command,
-    "?じゃんけん": on_rps_command
+COMMAND_PREFIX = "?"
+MENTION_PATTERN = re.compile(r"<@!?(\d+)>")
+MINE_COUNT_RANGE = range(1, 25)
+DRAINING_MESSAGE = "メンテナンスのため、まもなく再起動します。少し待ってからもう一度お試しください。"
+
+
+class ArgError(ValueError):
+    """引数が不正。メッセージがあれば使い方の代わりにそれを返す"""
+
+
+def amount(token: str) -> int:
+    if not (token.isascii() and token.isdigit()) or int(token) <= 0:
+        raise ArgError()
+    return int(token)
+
+
+def mine_count(token: str) -> int:
+    if not (token.isascii() and token.isdigit()):
+        raise ArgError()
+    value = int(token)
+    if value not in MINE_COUNT_RANGE:
+        raise ArgError("地雷数は 1〜24 の範囲で指定してください。")
+    return value
+
+
+def mention(token: str) -> int:
+    match = MENTION_PATTERN.fullmatch(token)
+    if match is None:
+        raise ArgError()
+    return int(match.group(1))
+
+
+class TextCommand(NamedTuple):
+    handler: Callable[..., Awaitable[None]]
+    params: tuple[Callable[[str], Any], ...] = ()
+    usage: str = ""
+
+
+TEXT_COMMANDS: dict[str, TextCommand] = {
+    "?残高": TextCommand(on_balance_command, (), "`?残高`の形式で入力してください。"),
+    "?送金": TextCommand(on_transfer_command, (mention, amount), "`?送金 @ユーザー 金額` の形式で入力してください。"),
+    "?マインズ": TextCommand(on_mines_command, (amount, mine_count), "`?マインズ 金額 地雷数`の形式で入力してください。"),
+    "?フリップ": TextCommand(on_coinflip_command, (amount,), "`?フリップ <掛け金>`の形式で入力してください。"),
+    "?ダイス": TextCommand(on_dice_command, (amount,), "`?ダイス <掛け金>`の形式で入力してください。"),
+    "?bj": TextCommand(on_blackjack_command, (amount,), "`?bj <掛け金>`の形式で入力してください。"),
+    "?じゃんけん": TextCommand(on_rps_command, (amount,), "`?じゃんけん <掛け金>`の形式で入力してください。"),
 }
 
+# コマンドごとの実行回数と、引数が不正だった回数
+dispatch_counts: Counter[str] = Counter()
+usage_errors: Counter[str] = Counter()
+
+_draining = False
+_in_flight = 0
+
+
+def start_draining() -> None:
+    """以後の `?` コマンドとボタン操作を断る（終了処理から呼ぶ）"""
+    global _draining
+    _draining = True
+    components.start_draining()
+
+
+def in_flight() -> int:
+    """実行中のテキストコマンドの数"""
+    return _in_flight
+
+
+def parse_args(command: TextCommand, tokens: list[str]) -> list[Any]:
+    if len(tokens) != len(command.params):
+        raise ArgError()
+    return [parse(token) for parse, token in zip(command.params, tokens)]
+
+
+async def dispatch_text_command(message: discord.Message) -> bool:
+    """テキストコマンドなら実行して True を返す"""
+    content = message.content
+    if not content.startswith(COMMAND_PREFIX):
+        content = content.lstrip()
+        if not content.startswith(COMMAND_PREFIX):
+            return False
+
+    name, *tokens = content.split()
+    command = TEXT_COMMANDS.get(name)
+    if command is None:
+        return False
+
+    try:
+        args = parse_args(command, tokens)
+    except ArgError as e:
+        usage_errors[name] += 1
+        embed = create_embed("", str(e) or command.usage, discord.Color.red())
+        await message.channel.send(embed=embed)
+        return True
+
+    if _draining:
+        embed = create_embed("", DRAINING_MESSAGE, discord.Color.red())
+        await message.channel.send(embed=embed)
+        return True
+
+    global _in_flight
+    dispatch_counts[name] += 1
+    _in_flight += 1
+    try:
+        await command.handler(message, *args)
+    finally:
+        _in_flight -= 1
+    return True
+
+
 async def register_all_text_commands(bot) -> None:
     @bot.event
     async def on_message(message: discord.Message) -> None:
         if message.author.bot:
             return
 
-        content = message.content.strip()
-
-        for cmd_prefix, handler in TEXT_COMMANDS.items():
-            if content.startswith(cmd_prefix):
-                await handler(message)
-                return
+        if await dispatch_text_command(message):
+            return
 
-        await bot.process_commands(message)
\ No newline at end of file
+        await bot.process_commands(message)
@@ -3,18 +3,18 @@ from decimal import Decimal
 import discord
 
 from config import MIN_INITIAL_DEPOSIT
-from database.db import (
+from database.async_db import (
     update_user_balance,
-    get_user_balance,
+    credit_balance,
+    get_user,
+    get_active_user,
     register_user,
-    users_collection,
-    active_users_collection,
 )
 from utils.embed import create_embed
 from utils.emojis import PNC_EMOJI_STR
 from utils.pnc import jpy_to_pnc
 from utils.embed_factory import EmbedFactory
-from utils.logs import log_transaction
+from utils.logs import log_transaction_async
 
 
 class AccountView(discord.ui.View):
@@ -31,7 +31,7 @@ class RegisterButton(discord.ui.Button):
     async def callback(self, interaction: discord.Interaction):
         user_id = interaction.user.id
 
-        if users_collection.find_one({"user_id": user_id}):
+        if await get_user(user_id):
             await interaction.response.send_message(
                 embed=create_embed("登録済みです", "あなたはすでにアカウントを登録しています。", discord.Color.red()),
                 ephemeral=True
@@ -39,7 +39,7 @@ class RegisterButton(discord.ui.Button):
             return
 
         sender_id = f"user_{user_id}"
-        existing = users_collection.find_one({"user_id": user_id})
+        existing = await get_user(user_id)
 
         if existing:
             await interaction.response.send_message(
@@ -48,11 +48,11 @@ class RegisterButton(discord.ui.Button):
             )
             return
 
-        active_data = active_users_collection.find_one({"user_id": user_id})
+        active_data = await get_active_user(user_id)
         restored_balance = int(active_data["balance"]) if active_data and "balance" in active_data else 0
 
-        register_user(user_id, sender_id)
-        update_user_balance(user_id, restored_balance)
+        await register_user(user_id, sender_id)
+        await update_user_balance(user_id, restored_balance)
 
         await interaction.response.send_message(
             embed=create_embed("[✓] 登録完了", "登録が正常に完了しました。", discord.Color.green()),
@@ -85,7 +85,7 @@ class PayinModal(discord.ui.Modal):
         user_id = interaction.user.id
         await interaction.response.defer(ephemeral=True)
 
-        user_info = users_collection.find_one({"user_id": user_id})
+        user_info = await get_user(user_id)
         if not user_info:
             embed = EmbedFactory.require_registration_prompt()
             await interaction.followup.send(embed=embed, ephemeral=True)
@@ -121,11 +121,11 @@ class PayinModal(discord.ui.Modal):
             await interaction.followup.send(embed=embed, ephemeral=True)
             return
 
-        update_user_balance(user_id, int(net_pnc))
-        log_transaction(user_id=user_id, type="payin", amount=int(jpy_amount), payout=int(net_pnc))
+        new_balance = await credit_balance(user_id, int(net_pnc))
+        await log_transaction_async(user_id=user_id, type="payin", amount=int(jpy_amount), payout=int(net_pnc))
 
         embed = discord.Embed(title="[✓] 入金完了", color=discord.Color.green())
         embed.add_field(name="入金額", value=f"`¥{int(jpy_amount):,}` → {PNC_EMOJI_STR} `{int(total_pnc):,}`", inline=True)
-        embed.add_field(name="現在の残高", value=f"{PNC_EMOJI_STR}`{get_user_balance(user_id):,}`", inline=False)
+        embed.add_field(name="現在の残高", value=f"{PNC_EMOJI_STR}`{new_balance:,}`", inline=False)
 
         await interaction.followup.send(embed=embed, ephemeral=True)
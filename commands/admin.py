@@ -0,0 +1,232 @@
+import discord
+
+from commands import TEXT_COMMANDS, dispatch_counts, usage_errors
+from database import async_db
+from database.cache import user_cache
+from database.db import get_database
+from database.indexes import audit_query_shapes, format_audit_report
+from ui.avatars import avatar_cache
+from ui.components import actor_stats
+from ui.encoding import encoder_snapshots
+from ui.media import media_registry
+from ui.render import render_service
+from ui.render_cache import frame_cache, layer_cache
+from ui.sessions import session_store
+from utils.blackjack_ev import CURRENT_RULES, analyze, format_strategy
+
+async def setup_admin_commands(bot):
+    @bot.tree.command(name="インデックス監査", description="各クエリをexplainし、コレクションスキャンになるものを報告（管理者専用）")
+    async def audit_indexes(interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message(
+                "このコマンドは管理者のみ実行できます。",
+                ephemeral=True
+            )
+            return
+
+        await interaction.response.defer(ephemeral=True)
+
+        try:
+            report = await async_db.run_sync(audit_query_shapes, get_database())
+        except Exception as e:
+            await interaction.followup.send(
+                f"監査中にエラーが発生しました: `{type(e).__name__}: {str(e)}`",
+                ephemeral=True
+            )
+            return
+
+        collscans = [entry for entry in report if entry["collscan"]]
+        embed = discord.Embed(
+            title="インデックス監査",
+            description=f"```{format_audit_report(report)[:3900]}```",
+            color=discord.Color.red() if collscans else discord.Color.green()
+        )
+        embed.set_footer(text=f"{len(report)}件中 {len(collscans)}件がコレクションスキャン")
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+    @bot.tree.command(name="キャッシュ統計", description="プロセス内キャッシュのヒット率を表示（管理者専用）")
+    async def cache_stats(interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message(
+                "このコマンドは管理者のみ実行できます。",
+                ephemeral=True
+            )
+            return
+
+        embed = discord.Embed(title="キャッシュ統計", color=discord.Color.blue())
+        stats = user_cache.stats()
+        embed.add_field(
+            name="ユーザープロフィール",
+            value=(
+                f"件数: `{stats['size']:,}/{stats['max_size']:,}`\n"
+                f"ヒット: `{stats['hits']:,}` / ミス: `{stats['misses']:,}`\n"
+                f"ヒット率: `{stats['hit_rate']:.1%}`"
+            ),
+            inline=False
+        )
+        avatar_stats = avatar_cache.stats()
+        embed.add_field(
+            name="アバター",
+            value=(
+                f"件数: `{avatar_stats['size']:,}/{avatar_stats['max_size']:,}`\n"
+                f"ヒット: `{avatar_stats['hits']:,}` / ディスク: `{avatar_stats['disk_hits']:,}` / "
+                f"取得: `{avatar_stats['misses']:,}`"
+            ),
+            inline=False
+        )
+        media_stats = media_registry.stats()
+        embed.add_field(
+            name="静的メディア",
+            value=(
+                f"登録: `{media_stats['registered']}/{media_stats['sources']}`\n"
+                f"アップロード: `{media_stats['uploads']:,}` / URL更新: `{media_stats['refreshes']:,}`"
+            ),
+            inline=False
+        )
+        for label, cache in (("描画レイヤー", layer_cache), ("エンコード済み画像", frame_cache)):
+            render_stats = cache.stats()
+            embed.add_field(
+                name=label,
+                value=(
+                    f"件数: `{render_stats['entries']:,}` / `{render_stats['size_mb']:.1f}/{render_stats['max_mb']:.0f}MB`\n"
+                    f"ヒット: `{render_stats['hits']:,}` / ミス: `{render_stats['misses']:,}` / "
+                    f"追い出し: `{render_stats['evictions']:,}`\n"
+                    f"ヒット率: `{render_stats['hit_rate']:.1%}`"
+                ),
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @bot.tree.command(name="描画統計", description="画像描画ワーカーの処理時間と待ち状況を表示（管理者専用）")
+    async def render_stats(interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message(
+                "このコマンドは管理者のみ実行できます。",
+                ephemeral=True
+            )
+            return
+
+        snapshot = render_service.snapshot()
+        embed = discord.Embed(
+            title="描画統計",
+            description=(
+                f"モード: `{snapshot['mode']}` × `{snapshot['workers']}`\n"
+                f"待ち: `{snapshot['pending']}/{snapshot['max_pending']}` / 溢れ: `{snapshot['rejected']:,}`"
+            ),
+            color=discord.Color.blue()
+        )
+        for name, stats in snapshot["renders"].items():
+            embed.add_field(
+                name=name,
+                value=(
+                    f"回数: `{stats['count']:,}`\n"
+                    f"平均: `{stats['avg_ms']:.1f}ms` / 最大: `{stats['max_ms']:.1f}ms`\n"
+                    f"平均待ち: `{stats['avg_wait_ms']:.1f}ms`"
+                ),
+                inline=True
+            )
+        for name, stats in encoder_snapshots().items():
+            settings = stats["settings"]
+            embed.add_field(
+                name=f"{name} エンコード",
+                value=(
+                    f"設定: `{settings['format']} q{settings['quality']} x{settings['scale']}` "
+                    f"(段 {stats['level'] + 1}/{stats['levels']})\n"
+                    f"平均: `{stats['avg_kb']:.0f}KB` `{stats['avg_ms']:.1f}ms` / "
+                    f"最大: `{stats['max_kb']:.0f}KB` `{stats['max_ms']:.1f}ms`\n"
+                    f"予算: `{stats['budget_kb']:.0f}KB` `{stats['budget_ms']:.0f}ms` / "
+                    f"超過: `{stats['over_budget']:,}/{stats['frames']:,}`"
+                ),
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @bot.tree.command(name="セッション統計", description="進行中のゲームの件数とメモリ使用量を表示（管理者専用）")
+    async def session_stats(interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message(
+                "このコマンドは管理者のみ実行できます。",
+                ephemeral=True
+            )
+            return
+
+        stats = session_store.stats()
+        actors = actor_stats()
+        embed = discord.Embed(
+            title="セッション統計",
+            description=(
+                f"進行中: `{sum(s['live'] for s in stats.values()):,}` / "
+                f"約 `{sum(s['bytes'] for s in stats.values()) / 1024:.1f}KB`\n"
+                f"処理中のメールボックス: `{actors['active']}` / 処理: `{actors['processed']:,}` / "
+                f"連打の破棄: `{actors['coalesced']:,}` / 期限切れ: `{actors['stale']:,}` / "
+                f"終了後: `{actors['after_end']:,}`\n"
+                f"保存: `{session_store.writes:,}`件 / 削除: `{session_store.deletes:,}`件 / 未保存: `{session_store.unsaved:,}`件"
+            ),
+            color=discord.Color.blue()
+        )
+        for game, game_stats in stats.items():
+            embed.add_field(
+                name=game,
+                value=(
+                    f"進行中: `{game_stats['live']:,}` / 約 `{game_stats['bytes'] / 1024:.1f}KB`\n"
+                    f"期限切れ: `{game_stats['expired']:,}` / 期限: `{game_stats['ttl']}秒`"
+                ),
+                inline=True
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @bot.tree.command(name="コマンド統計", description="テキストコマンドの実行回数を表示（管理者専用）")
+    async def command_stats(interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message(
+                "このコマンドは管理者のみ実行できます。",
+                ephemeral=True
+            )
+            return
+
+        lines = [
+            f"`{name}` 実行: `{dispatch_counts[name]:,}` / 引数エラー: `{usage_errors[name]:,}`"
+            for name in TEXT_COMMANDS
+        ]
+        embed = discord.Embed(title="コマンド統計", description="\n".join(lines), color=discord.Color.blue())
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @bot.tree.command(name="ブラックジャック期待値", description="現在の規則（または変更案）での厳密な期待値と基本戦略を表示（管理者専用）")
+    @discord.app_commands.describe(
+        hit_soft_17="ディーラーがソフト17でヒットする",
+        blackjack_payout="ブラックジャックの配当（3:2 なら 1.5）"
+    )
+    async def blackjack_ev(
+        interaction: discord.Interaction,
+        hit_soft_17: bool = CURRENT_RULES.hit_soft_17,
+        blackjack_payout: float = CURRENT_RULES.blackjack_payout
+    ):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message(
+                "このコマンドは管理者のみ実行できます。",
+                ephemeral=True
+            )
+            return
+
+        rules = CURRENT_RULES._replace(hit_soft_17=hit_soft_17, blackjack_payout=blackjack_payout)
+        result = analyze(rules)
+        embed = discord.Embed(
+            title="ブラックジャック期待値",
+            description=(
+                f"期待値: `{result['ev']:+.5f}` / ハウスエッジ: `{result['house_edge'] * 100:.3f}%` / "
+                f"RTP: `{result['rtp'] * 100:.3f}%`\n"
+                f"```{format_strategy(result['strategy'])}```"
+            ),
+            color=discord.Color.blue()
+        )
+        embed.add_field(
+            name="ディーラーのバースト率",
+            value=" ".join(f"{label}:`{p * 100:.1f}%`" for label, p in result["dealer_bust"].items()),
+            inline=False
+        )
+        changed = "（変更案）" if rules != CURRENT_RULES else ""
+        embed.set_footer(
+            text=f"S17{'ヒット' if rules.hit_soft_17 else 'スタンド'} / BJ {rules.blackjack_payout}倍{changed} / "
+                 f"H=ヒット S=スタンド / {result['elapsed_ms']:.1f}ms"
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
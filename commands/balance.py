@@ -1,19 +1,19 @@
 import discord
 
-from database.db import get_user_balance, users_collection
+from database.async_db import get_user
 from utils.embed_factory import EmbedFactory
 
 async def on_balance_command(message: discord.Message) -> None:
     user_id = message.author.id
 
     try:
-        user_info = users_collection.find_one({"user_id": user_id})
+        user_info = await get_user(user_id)
         if not user_info:
             embed = EmbedFactory.require_registration_prompt()
             await message.channel.send(embed=embed)
             return
 
-        balance = get_user_balance(user_id)
+        balance = user_info.get("balance", 0)
         embed = EmbedFactory.balance_display(balance=balance)
         embed.set_author(name=f"{message.author.display_name} | {message.author.name}")
         embed.set_thumbnail(url=message.author.display_avatar.url)
@@ -1,29 +1,21 @@
 import discord
 import re
-import io
-from io import BytesIO
 import secrets
-import aiohttp
 
-from database.db import get_user_balance, update_user_balance, load_pf_params, save_pf_params
+from database.async_db import try_debit_balance, load_pf_params, save_pf_params
 
 from utils.embed import create_embed
 from utils.embed_factory import EmbedFactory
 from utils.emojis import PNC_EMOJI_STR
 from utils.color import BLACKJACK_COLOR
 
-from ui.game.blackjack import BlackjackGame, BlackjackView, blackjack_games
+from ui.game.blackjack import BlackjackGame, blackjack_view, render_table_file, attach_table
+from ui.media import media_url
+from ui.sessions import session_store
 from config import CURRENCY_NAME, MIN_BET
 
-async def on_blackjack_command(message: discord.Message) -> None:
+async def on_blackjack_command(message: discord.Message, bet: int) -> None:
     try:
-        args = message.content.strip().split()
-        if len(args) != 2 or not args[1].isdigit():
-            embed = create_embed("", "`?bj <掛け金>`の形式で入力してください。", discord.Color.red())
-            await message.channel.send(embed=embed)
-            return
-
-        bet = int(args[1])
         user = message.author
         user_id = user.id
         min_bet = MIN_BET["blackjack"]
@@ -33,19 +25,17 @@ async def on_blackjack_command(message: discord.Message) -> None:
             await message.channel.send(embed=embed)
             return
 
-        balance = get_user_balance(user_id)
+        debited, balance = await try_debit_balance(user_id, bet)
         if balance is None:
             embed = EmbedFactory.not_registered()
             await message.channel.send(embed=embed)
             return
-        if balance < bet:
+        if not debited:
             embed = EmbedFactory.insufficient_balance(balance=balance)
             await message.channel.send(embed=embed)
             return
-        
-        update_user_balance(user_id, -bet)
 
-        params = load_pf_params(user_id)
+        params = await load_pf_params(user_id)
         if params and len(params) == 3:
             client_seed, server_seed, nonce = params
         else:
@@ -53,33 +43,28 @@ async def on_blackjack_command(message: discord.Message) -> None:
             server_seed = secrets.token_hex(32)
             nonce = 0
 
-        game = BlackjackGame(bet=bet, client_seed=client_seed, nonce=nonce)
+        game = BlackjackGame(user_id, bet=bet, client_seed=client_seed, nonce=nonce)
         game.deal_initial()
-        blackjack_games[user_id] = game
+        session_store.add("blackjack", game)
 
-        save_pf_params(user_id, client_seed, server_seed, nonce + 1)
+        await save_pf_params(user_id, client_seed, server_seed, nonce + 1)
 
         await message.channel.send(f"[🔐] hash: `{game.pf.server_seed_hash}`")
 
         async with message.channel.typing():
-            async with aiohttp.ClientSession() as session:
-                async with session.get(user.display_avatar.url) as resp:
-                    avatar_bytes = BytesIO(await resp.read())
-
-            img = game.render_image(user_displayname=user.display_name, user_avatar_data=avatar_bytes)
-            buf = io.BytesIO()
-            img.save(buf, format='PNG')
-            buf.seek(0)
-            file = discord.File(buf, filename="blackjack.png")
+            file = await render_table_file(game, user)
 
             embed = create_embed(f"{CURRENCY_NAME}ブラックジャック", f"{user.mention}", BLACKJACK_COLOR)
-            embed.set_image(url="attachment://blackjack.png")
+            attach_table(embed, game, file)
             embed.add_field(name="掛け金", value=f"{PNC_EMOJI_STR}`{bet:,}`", inline=False)
             embed.set_author(name=user.display_name, icon_url=user.display_avatar.url)
-            embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1219916908485283880/1386317663231414272/ChatGPT_Image_2025622_21_11_08.png?ex=6859446f&is=6857f2ef&hm=19507da3f6ae2ea49377b1112e687a6690cd37bb229cc4ebcd5a1fef2c5965e6&")
+            embed.set_thumbnail(url=media_url("thumb/blackjack"))
 
-            view = BlackjackView(user_id)
-            await message.channel.send(embed=embed, view=view, file=file)
+            view = blackjack_view(game)
+            if file is None:
+                await message.channel.send(embed=embed, view=view)
+            else:
+                await message.channel.send(embed=embed, view=view, file=file)
 
     except Exception as e:
         print(f"[ERROR] on_blackjack_command: {e}")
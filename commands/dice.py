@@ -1,32 +1,21 @@
 import discord
-from discord import File
 import random
 import asyncio
 
-from database.db import get_user_balance, update_user_balance
+from database.async_db import try_debit_balance, credit_balance
 from utils.embed import create_embed
 from utils.logs import send_casino_log
 from utils.color import BASE_COLOR_CODE
 from utils.emojis import PNC_EMOJI_STR, WIN_EMOJI
 from utils.embed_factory import EmbedFactory
 
-from ui.game.dice import ongoing_games
-from ui.game.dice import ContinueButton
-from config import DICE_FOLDER, CURRENCY_NAME, MIN_BET
+from ui.game.dice import DiceSession, attach_dice, continue_view
+from ui.media import media_url
+from ui.sessions import session_store
+from config import CURRENCY_NAME, MIN_BET
 
-async def on_dice_command(message: discord.Message) -> None:
+async def on_dice_command(message: discord.Message, bet: int) -> None:
     try:
-        args = message.content.strip().split()
-        if len(args) != 2 or not args[1].isdigit():
-            embed = create_embed("", "`?ダイス <掛け金>`の形式で入力してください。", discord.Color.red())
-            embed.set_author(
-                name=f"{message.author.name}",
-                icon_url=message.author.display_avatar.url
-            )
-        
-            return await message.channel.send(embed=embed)
-
-        bet = int(args[1])
         min_bet = MIN_BET["dice"]
         if bet < min_bet:
             embed = EmbedFactory.bet_too_low(min_bet=min_bet)
@@ -37,19 +26,18 @@ async def on_dice_command(message: discord.Message) -> None:
             return await message.channel.send(embed=embed)
 
         user_id = message.author.id
-        balance = get_user_balance(user_id)
+        debited, balance = await try_debit_balance(user_id, bet)
         if balance is None:
             embed = EmbedFactory.not_registered()
             await message.channel.send(embed=embed)
             return
-        if bet > balance:
+        if not debited:
             embed = EmbedFactory.insufficient_balance(balance=balance)
             embed.set_author(
                 name=f"{message.author.name}",
                 icon_url=message.author.display_avatar.url
             )
             return await message.channel.send(embed=embed)
-        update_user_balance(user_id, -bet)
 
         def roll():
             return random.randint(1, 6), random.randint(1, 6)
@@ -57,44 +45,25 @@ async def on_dice_command(message: discord.Message) -> None:
         die1, die2 = roll()
         total = die1 + die2
 
-        gif_path1 = f"{DICE_FOLDER}/gif/{die1}.gif"
-        gif_path2 = f"{DICE_FOLDER}/gif/{die2}.gif"
-        files = [File(gif_path1, filename="dice1.gif"), File(gif_path2, filename="dice2.gif")]
         embed = create_embed(f"{CURRENCY_NAME}ダイス", f"{PNC_EMOJI_STR}`{bet}`を賭けてサイコロを振っています...", BASE_COLOR_CODE)
-        embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1219916908485283880/1389815902278647818/ChatGPT_Image_202572_12_51_52.png?ex=6865fe6c&is=6864acec&hm=1532507b0941122a27dbc8859aa83321cad484328bd9f310d43c3b7ed63a2fcc&")
+        embed.set_thumbnail(url=media_url("thumb/dice"))
         embed.set_author(
             name=f"{message.author.name}",
             icon_url=message.author.display_avatar.url
         )
+        file = attach_dice(embed, "roll", die1, die2)
         rolling_msg = await message.channel.send(
             embed=embed,
-            files=files
+            files=[file] if file else []
         )
 
         await asyncio.sleep(1.5)
 
-        result_path1 = f"{DICE_FOLDER}/png/{die1}.png"
-        result_path2 = f"{DICE_FOLDER}/png/{die2}.png"
-        files = [File(result_path1, filename="die1.png"), File(result_path2, filename="die2.png")]
-
-        result_embed = create_embed(
-            title=f"{CURRENCY_NAME}ダイス結果",
-            description=f"# {die1} + {die2} = **{total}**",
-            color=discord.Color.from_str("#26ffd4")
-        )
-        result_embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1219916908485283880/1389815902278647818/ChatGPT_Image_202572_12_51_52.png?ex=6865fe6c&is=6864acec&hm=1532507b0941122a27dbc8859aa83321cad484328bd9f310d43c3b7ed63a2fcc&")
-        result_embed.set_author(
-                name=f"{message.author.name}",
-                icon_url=message.author.display_avatar.url
-            )
-        await rolling_msg.edit(embed=result_embed, attachments=files)
-
+        next_view = None
         if total in [7, 11]:
             winnings = bet * 2
-            update_user_balance(user_id, winnings)
+            await credit_balance(user_id, winnings)
             result_text = f"### {PNC_EMOJI_STR}`{winnings}` **WIN**"
-            summary_embed = create_embed("", result_text, BASE_COLOR_CODE)
-            await message.channel.send(embed=summary_embed)
 
             class FakeInteraction:
                 user = message.author
@@ -110,14 +79,26 @@ async def on_dice_command(message: discord.Message) -> None:
 
         elif total in [2, 3, 12]:
             result_text = f"### クラップス！\n# {PNC_EMOJI_STR}`{bet}` **LOSE**"
-            summary_embed = create_embed("", result_text, BASE_COLOR_CODE)
-            await message.channel.send(embed=summary_embed)
 
         else:
             result_text = f"### ポイント: {total}\n# {PNC_EMOJI_STR}`{bet}` 継続可能！"
-            summary_embed = create_embed("", result_text, BASE_COLOR_CODE)
-            await message.channel.send(embed=summary_embed, view=ContinueButton(user_id, bet, total))
-            ongoing_games[user_id] = {"bet": bet, "point": total}
+            session = DiceSession(user_id, bet, total)
+            session_store.add("dice", session)
+            next_view = continue_view(session)
+
+        # 結果と勝敗は1回の編集で出す（別メッセージは送らない）
+        result_embed = create_embed(
+            title=f"{CURRENCY_NAME}ダイス結果",
+            description=f"# {die1} + {die2} = **{total}**\n\n{result_text}",
+            color=discord.Color.from_str("#26ffd4")
+        )
+        result_embed.set_thumbnail(url=media_url("thumb/dice"))
+        result_embed.set_author(
+                name=f"{message.author.name}",
+                icon_url=message.author.display_avatar.url
+            )
+        file = attach_dice(result_embed, "result", die1, die2)
+        await rolling_msg.edit(embed=result_embed, attachments=[file] if file else [], view=next_view)
 
     except Exception as e:
         print("Dice error:", e)
@@ -1,35 +1,27 @@
 import discord
 
-from database.db import get_user_balance
+from database.async_db import try_debit_balance
 from utils.emojis import PNC_EMOJI_STR
 from utils.embed_factory import EmbedFactory
-from ui.game.flip import CoinFlipView
-from config import MIN_BET, THUMBNAIL_URL, FLIP_GIF_URL, CURRENCY_NAME
-
-async def on_coinflip_command(message: discord.Message) -> None:
-    try:
-        bet = int(message.content.split()[1])
-    except (IndexError, ValueError):
-        embed = discord.Embed(
-            description="`?フリップ <掛け金>`の形式で入力してください。",
-            color=discord.Color.red()
-        )
-        await message.channel.send(embed=embed)
-        return
+from ui.game.flip import FlipSession, coin_flip_view
+from config import MIN_BET, CURRENCY_NAME
+from ui.media import media_url
+from ui.sessions import session_store
 
+async def on_coinflip_command(message: discord.Message, bet: int) -> None:
     min_bet = MIN_BET["flip"]    
     if bet < min_bet:
-        embed = EmbedFactory.bet_too_low(min_bet=MIN_BET)
+        embed = EmbedFactory.bet_too_low(min_bet=min_bet)
         await message.channel.send(embed=embed)
         return
     
-    balance = get_user_balance(message.author.id)
+    debited, balance = await try_debit_balance(message.author.id, bet)
     if balance is None:
         embed = EmbedFactory.not_registered()
         await message.channel.send(embed=embed)
         return
         
-    if bet > balance:
+    if not debited:
         embed = EmbedFactory.insufficient_balance(balance=balance)
         await message.channel.send(embed=embed)
         return
@@ -40,8 +32,9 @@ async def on_coinflip_command(message: discord.Message) -> None:
         color=0x393a41
     )
     embed.set_author(name=f"{message.author.name}", icon_url=message.author.display_avatar.url)
-    embed.set_thumbnail(url=THUMBNAIL_URL)
-    embed.set_image(url=FLIP_GIF_URL)
+    embed.set_thumbnail(url=media_url("thumb/flip"))
+    embed.set_image(url=media_url("flip/gif"))
 
-    view = CoinFlipView(message.author, bet)
-    await message.channel.send(embed=embed, view=view)
\ No newline at end of file
+    session = FlipSession(message.author.id, bet)
+    session_store.add("flip", session)
+    await message.channel.send(embed=embed, view=coin_flip_view(session))
\ No newline at end of file
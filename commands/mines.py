@@ -1,29 +1,18 @@
 import discord
-import re
 import secrets
 
 from config import MIN_BET
-from database.db import get_user_balance, update_user_balance, load_pf_params
+from database.async_db import try_debit_balance, load_pf_params
 
 from utils.embed import create_embed
 from utils.color import BASE_COLOR_CODE
 from utils.embed_factory import EmbedFactory
 
-from ui.game.mines import MinesGame, MinesView, CashoutButton, create_mines_embed
+from ui.game.mines import MinesGame, mines_view, cashout_view, create_mines_embed
+from ui.sessions import session_store
 
-MINE_OPTIONS = list[int](range(1, 25))
-
-games = {}
-async def on_mines_command(message: discord.Message):
+async def on_mines_command(message: discord.Message, amount: int, mine_count: int):
     try:
-        args = message.content.strip().split()
-        if len(args) != 2 or (not args[1].isdigit() or not args[2].isdigit()):
-            embed = create_embed("", "`?マインズ 金額 地雷数`の形式で入力してください。", discord.Color.red())
-            await message.channel.send(embed=embed)
-            return
-
-        amount = int(args[1])
-        mine_count = int(args[2])
         user = message.author
         user_id = user.id
         
@@ -33,41 +22,32 @@ async def on_mines_command(message: discord.Message):
             await message.channel.send(embed=embed)
             return
 
-        if mine_count not in MINE_OPTIONS:
-            embed = create_embed("", "地雷数は 1〜24 の範囲で指定してください。", discord.Color.red())
-            await message.channel.send(embed=embed)
-            return
-
-        balance = get_user_balance(user_id)
+        debited, balance = await try_debit_balance(user_id, amount)
         if balance is None:
             embed = EmbedFactory.not_registered()
             await message.channel.send(embed=embed)
             return
-        if balance < amount:
+        if not debited:
             embed = EmbedFactory.insufficient_balance(balance=balance)
             await message.channel.send(embed=embed)
             return
 
-        update_user_balance(user_id, -amount)
-        client_seed, nonce = load_pf_params(user_id)
+        client_seed, nonce = await load_pf_params(user_id)
         if client_seed is None:
             client_seed = secrets.token_hex(8)
             nonce = 0
 
-        game = MinesGame(user, bet=amount, mine_count=mine_count,
+        game = MinesGame(user_id, bet=amount, mine_count=mine_count,
                         client_seed=client_seed, nonce=nonce)
-        games[user_id] = game
+        session_store.add("mines", game)
         await message.channel.send(f"[🔐] hash: `{game.server_seed_hash}`")
         
-        game_embed = create_mines_embed(game)
-        game_view = MinesView(user_id, game)
-        game_message = await message.channel.send(embed=game_embed, view=game_view)
+        game_embed = create_mines_embed(game, user)
+        game_message = await message.channel.send(embed=game_embed, view=mines_view(game))
         game.message_id = game_message.id
 
         cashout_embed = create_embed("", "現在の報酬を引き出すにはボタンを押してください。", color=BASE_COLOR_CODE)
-        cashout_view = discord.ui.View()
-        cashout_view.add_item(CashoutButton(user_id, game, disabled=False))
-        cashout_message = await message.channel.send(embed=cashout_embed, view=cashout_view)
+        cashout_message = await message.channel.send(embed=cashout_embed, view=cashout_view(game))
         game.cashout_message_id = cashout_message.id
     except Exception as e:
         print(f"[ERROR] on_mines_command: {e}")
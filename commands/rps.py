@@ -1,45 +1,31 @@
 import discord
 import random
 import re
-import hmac
-import hashlib
-import secrets
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 from io import BytesIO
 from utils.embed import create_embed
+from utils.embed_factory import EmbedFactory
 from utils.emojis import PNC_EMOJI_STR, WIN_EMOJI, ROCK_HAND_EMOJI, SCISSOR_HAND_EMOJI, PAPER_HAND_EMOJI
 from utils.logs import send_casino_log
 from utils.color import RPS_COLOR, SUCCESS_COLOR, DRAW_COLOR
-from database.db import get_user_balance, update_user_balance, load_pf_params
+from database.async_db import try_debit_balance, credit_balance, load_pf_params
 from config import CURRENCY_NAME, MIN_BET
-import aiohttp
+from ui.assets import RPS_CARD_WIDTH, RPS_THUMB_SIZE, get_rps_assets
+from ui.avatars import avatar_cache
+from ui.components import GameButton, game_view, route
+from ui.encoding import EncodedImage, encode_within, get_encoder
+from ui.media import media_url
+from ui.pf import ProvablyFairParams
+from ui.render import RenderQueueFull, render_service
+from ui.render_cache import frame_cache, image_nbytes, layer_cache
+from ui.sessions import session_store
 import traceback
 
-FONT_PATH = "assets/font/NotoSansJP-VariableFont_wght.ttf"
-SLOT_CARD_BACK = "assets/rps/slot_back.png"
-
-class ProvablyFairParams:
-    def __init__(self, client_seed=None, server_seed=None, nonce=0):
-        self.client_seed = client_seed or secrets.token_hex(8)
-        self.server_seed = server_seed or secrets.token_hex(32)
-        self.server_seed_hash = hashlib.sha256(self.server_seed.encode()).hexdigest()
-        self.nonce = nonce
-
-    def generate_number(self):
-        msg = f"{self.client_seed}:{self.nonce}".encode()
-        h = hmac.new(self.server_seed.encode(), msg, hashlib.sha256).hexdigest()
-        r = int(h[:8], 16)
-        return r / 0xFFFFFFFF
-
-    def get_opponent_hand(self):  
-        num = self.generate_number()
-        hands = ["rock", "paper", "scissors"]
-        return hands[int(num * 3)]
-
-    def get_pf_info(self):
-        return f"ServerSeed: `{self.server_seed}`\nClientSeed: `{self.client_seed}`\nNonce: `{self.nonce}`"
+AVATAR_SIZE = 60
 
 class RPSGameSession:
+    __slots__ = ("user_id", "bet_amount", "base_multiplier", "round", "pf", "history", "session_id")
+
     def __init__(self, user_id, bet_amount, client_seed=None, server_seed=None, nonce=0):
         self.user_id = user_id
         self.bet_amount = bet_amount
@@ -47,6 +33,7 @@ class RPSGameSession:
         self.round = 0
         self.pf = ProvablyFairParams(client_seed, server_seed, nonce)
         self.history = []
+        self.session_id = None
 
     def next_round(self):
         self.round += 1
@@ -62,7 +49,31 @@ class RPSGameSession:
         multiplier = self.base_multiplier * (2 ** (win_count - 1))
         return int(self.bet_amount * multiplier)
 
-game_sessions = {}
+    def cashout_amount(self):
+        if self.round == 0:
+            return self.bet_amount
+        return self.calc_win_amount()
+
+    @property
+    def bet(self):
+        return self.bet_amount
+
+    def to_state(self):
+        """保存用。相手の手はシードと nonce から導き直せる"""
+        return {
+            "user_id": self.user_id, "bet": self.bet_amount, "round": self.round,
+            "client_seed": self.pf.client_seed, "server_seed": self.pf.server_seed, "nonce": self.pf.nonce,
+            "history": [[entry["player"], entry["opponent"], entry["result"]] for entry in self.history],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        session = cls(state["user_id"], state["bet"], state["client_seed"], state["server_seed"], state["nonce"])
+        session.round = state["round"]
+        session.history = [{"player": p, "opponent": o, "result": r} for p, o, r in state["history"]]
+        return session
+
+session_store.register_type("rps", RPSGameSession)
 
 def determine_result(player, opponent):
     if player == opponent:
@@ -74,93 +85,69 @@ def determine_result(player, opponent):
     else:
         return "lose"
 
-def resize_by_width(image: Image.Image, target_width: int) -> Image.Image:
-    w, h = image.size
-    aspect_ratio = h / w
-    new_height = int(target_width * aspect_ratio)
-    return image.resize((target_width, new_height))
-
-def resize_keep_aspect(image: Image.Image, target_width: int) -> Image.Image:
-    w, h = image.size
-    scale = target_width / w
-    return image.resize((int(w * scale), int(h * scale)))
-
-
-async def generate_rps_progress_image(session, user_avatar, username):
-    width = 1280
-    height = 500
-    bg = Image.new("RGBA", (width, height), (20, 20, 30, 255))
-    draw = ImageDraw.Draw(bg)
-    font = ImageFont.truetype(FONT_PATH, 20)
-
-    # カードと手のサイズ
-    focus_card_w = 120
-    focus_card_h = int(focus_card_w * 1.45)
-
-    # 手の最大幅
-    hand_target_width = int(focus_card_w * 0.89)
-    
-    # 中央のカード位置（右寄せ）
-    card_x = width - focus_card_w - 100
-    center_y = height // 2
-    opponent_card_y = center_y - focus_card_h - 20
-    player_card_y = center_y + 20
+RPS_WIDTH = 1280
+RPS_HEIGHT = 500
+RPS_BG_COLOR = (20, 20, 30, 255)
+RESULT_COLORS = {"win": (0, 255, 0), "draw": (255, 255, 0), "lose": (255, 0, 0)}
 
-    card_back = resize_by_width(Image.open(SLOT_CARD_BACK), focus_card_w)
+# 中央のカード位置（右寄せ）
+FOCUS_CARD_H = int(RPS_CARD_WIDTH * 1.45)
+FOCUS_CARD_X = RPS_WIDTH - RPS_CARD_WIDTH - 100
+OPPONENT_CARD_Y = RPS_HEIGHT // 2 - FOCUS_CARD_H - 20
+PLAYER_CARD_Y = RPS_HEIGHT // 2 + 20
 
-    if session.history:
-        latest = session.history[-1]
-        player_hand = latest["player"]
-        opponent_hand = latest["opponent"]
+# 左上の履歴表示
+HISTORY_OFFSET_X = 30
+HISTORY_SPACING = 50
+HISTORY_BOT_Y = 50
+HISTORY_PLAYER_Y = HISTORY_BOT_Y + 60
 
-        bg.paste(card_back, (card_x, opponent_card_y), card_back)
-        bg.paste(card_back, (card_x, player_card_y), card_back)
+def _new_background():
+    return Image.new("RGBA", (RPS_WIDTH, RPS_HEIGHT), RPS_BG_COLOR)
 
-        player_img = resize_keep_aspect(Image.open(f"assets/rps/{player_hand}.1.png").convert("RGBA"), hand_target_width)
-        opponent_img = resize_keep_aspect(Image.open(f"assets/rps/{opponent_hand}.2.png").convert("RGBA"), hand_target_width)
+def _focus_images(atlas, latest):
+    return atlas[f"{latest['player']}.1"], atlas[f"{latest['opponent']}.2"]
 
-        opponent_hand_x = card_x - opponent_img.width - 10
-        player_hand_x = card_x - player_img.width - 10
+def _draw_focus(bg, atlas, latest):
+    """直近の手を中央のカードに描く"""
+    card_back = atlas["card_back"]
+    player_img, opponent_img = _focus_images(atlas, latest)
 
-        # 正しいX座標を後から設定
-        opponent_hand_x = card_x - opponent_img.width - 10
-        player_hand_x = card_x - player_img.width - 10
+    bg.paste(card_back, (FOCUS_CARD_X, OPPONENT_CARD_Y), card_back)
+    bg.paste(card_back, (FOCUS_CARD_X, PLAYER_CARD_Y), card_back)
 
-        # Y座標（中央合わせ）
-        oy = opponent_card_y + (focus_card_h - opponent_img.height) // 2 + 5
-        py = player_card_y + (focus_card_h - player_img.height) // 2 + 5
+    opponent_hand_x = FOCUS_CARD_X - opponent_img.width - 10
+    player_hand_x = FOCUS_CARD_X - player_img.width - 10
 
-        # 手を描画
-        bg.paste(opponent_img, (opponent_hand_x, oy), opponent_img)
-        bg.paste(player_img, (player_hand_x, py), player_img)
+    # Y座標（中央合わせ）
+    oy = OPPONENT_CARD_Y + (FOCUS_CARD_H - opponent_img.height) // 2 + 5
+    py = PLAYER_CARD_Y + (FOCUS_CARD_H - player_img.height) // 2 + 5
 
+    bg.paste(opponent_img, (opponent_hand_x, oy), opponent_img)
+    bg.paste(player_img, (player_hand_x, py), player_img)
 
-    # 左下の履歴表示
-    card_w = 40
-    spacing = 50
-    offset_x = 30
-    bot_y = 50
-    player_y = bot_y + 60
-    multiplier_y = player_y + card_w + 5
-    win_count = 0
+def _draw_history(bg, atlas, font, history, start, win_count):
+    """history[start:] の履歴セルを描き、(勝ち数, 描いた範囲の右端) を返す"""
+    draw = ImageDraw.Draw(bg)
+    card_w = RPS_THUMB_SIZE[0]
+    multiplier_y = HISTORY_PLAYER_Y + card_w + 5
+    right = 0
 
-    for i, entry in enumerate(session.history):
-        x = offset_x + i * spacing
+    for i in range(start, len(history)):
+        entry = history[i]
+        x = HISTORY_OFFSET_X + i * HISTORY_SPACING
         result = entry["result"]
-        player_hand = entry["player"]
-        opponent_hand = entry["opponent"]
-
-        p_img = Image.open(f"assets/rps/{player_hand}.1.thumb.png").resize((card_w, card_w))
-        o_img = Image.open(f"assets/rps/{opponent_hand}.2.thumb.png").resize((card_w, card_w))
 
+        p_img = atlas[f"{entry['player']}.1.thumb"]
+        o_img = atlas[f"{entry['opponent']}.2.thumb"]
 
-        border_color = {"win": (0, 255, 0), "draw": (255, 255, 0), "lose": (255, 0, 0)}[result]
+        border_color = RESULT_COLORS[result]
 
-        draw.rectangle([x - 2, player_y - 2, x + card_w + 2, player_y + card_w + 2], outline=border_color, width=2)
-        draw.rectangle([x - 2, bot_y - 2, x + card_w + 2, bot_y + card_w + 2], outline=border_color, width=2)
+        draw.rectangle([x - 2, HISTORY_PLAYER_Y - 2, x + card_w + 2, HISTORY_PLAYER_Y + card_w + 2], outline=border_color, width=2)
+        draw.rectangle([x - 2, HISTORY_BOT_Y - 2, x + card_w + 2, HISTORY_BOT_Y + card_w + 2], outline=border_color, width=2)
 
-        bg.paste(p_img, (x, player_y), p_img)
-        bg.paste(o_img, (x, bot_y), o_img)
+        bg.paste(p_img, (x, HISTORY_PLAYER_Y), p_img)
+        bg.paste(o_img, (x, HISTORY_BOT_Y), o_img)
 
         # 倍率計算
         if result == "win":
@@ -171,44 +158,139 @@ async def generate_rps_progress_image(session, user_avatar, username):
         else:
             multiplier = 0
 
-        color = border_color
         multiplier_str = f"{multiplier:.2f}x"
         text_width = draw.textlength(multiplier_str, font=font)
-        draw.text((x + (card_w - text_width) / 2, multiplier_y), multiplier_str, font=font, fill=color)
-
-    # プレイヤー情報
-    avatar = Image.open(user_avatar).resize((60, 60)).convert("RGBA")
-    mask = Image.new("L", (60, 60), 0)
-    ImageDraw.Draw(mask).ellipse((0, 0, 60, 60), fill=255)
-    avatar = Image.composite(avatar, Image.new("RGBA", avatar.size), mask)
-    bg.paste(avatar, (20, height - 70), avatar)
-    draw.text((90, height - 60), username, font=font, fill=(255, 255, 255))
+        text_x = x + (card_w - text_width) / 2
+        draw.text((text_x, multiplier_y), multiplier_str, font=font, fill=border_color)
+        right = max(right, x + card_w + 2, int(text_x + text_width) + 2)
+
+    return win_count, right
+
+def _history_key(history):
+    return tuple((entry["player"], entry["opponent"], entry["result"]) for entry in history)
+
+def _history_strip(history):
+    """背景に履歴を描いた層を (画像, 勝ち数, 描いた範囲の右端) で返す。
+    層は履歴ごとに layer_cache に置き、1つ短い履歴の層が残っていれば新しいセルだけを描き足す"""
+    key = ("rps", "strip", _history_key(history))
+    layer = layer_cache.get(key)
+    if layer is not None:
+        return layer
+
+    assets = get_rps_assets()
+    previous = layer_cache.get(("rps", "strip", _history_key(history[:-1]))) if history else None
+    if previous is not None:
+        base, win_count, right = previous
+        strip = base.copy()
+        start = len(history) - 1
+    else:
+        strip, win_count, right, start = _new_background(), 0, 0, 0
+
+    win_count, drawn_right = _draw_history(strip, assets.atlas, assets.font, history, start, win_count)
+    layer = (strip, win_count, max(right, drawn_right))
+    layer_cache.put(key, layer, image_nbytes(strip))
+    return layer
+
+def rps_render_key(session):
+    """画像の内容を決める状態。アバターと名前以外は履歴だけで決まる"""
+    return ("rps", _history_key(session.history))
+
+def generate_rps_progress_image(session, user_avatar: Image.Image, username):
+    key = rps_render_key(session)
+    shared = layer_cache.get(key)
+    if shared is None:
+        shared = _render_shared(session)
+        layer_cache.put(key, shared, image_nbytes(shared))
+
+    # プレイヤー情報（左下）は他の要素と重ならないので最後に描く
+    bg = shared.copy()
+    bg.paste(user_avatar, (20, RPS_HEIGHT - 70), user_avatar)
+    ImageDraw.Draw(bg).text((90, RPS_HEIGHT - 60), username, font=get_rps_assets().font, fill=(255, 255, 255))
+    return bg
 
+def _render_shared(session):
+    """アバターと名前以外を描く。履歴は _history_strip() の層に中央のカードを重ねる"""
+    assets = get_rps_assets()
+    atlas = assets.atlas
+    history = session.history
+    strip, _, strip_right = _history_strip(history)
+    if not history:
+        return strip.copy()
+
+    player_img, opponent_img = _focus_images(atlas, history[-1])
+    focus_left = FOCUS_CARD_X - max(player_img.width, opponent_img.width) - 10
+    if strip_right < focus_left:
+        bg = strip.copy()
+        _draw_focus(bg, atlas, history[-1])
+        return bg
+
+    # 履歴が中央のカードまで伸びた場合は、履歴を上に重ねるため全体を描き直す
+    bg = _new_background()
+    _draw_focus(bg, atlas, history[-1])
+    _draw_history(bg, atlas, assets.font, history, 0, 0)
     return bg
 
-async def on_rps_command(message: discord.Message):
-    try: 
-        args = message.content.strip().split()
-        if len(args) != 2 or not args[1].isdigit():
-            embed = create_embed("コマンドの使い方", "`?じゃんけん <掛け金>`の形式で入力してください。", discord.Color.red())
-            await message.channel.send(embed=embed)
-            return
+def render_rps_frame(session, user_avatar: Image.Image, username: str, candidates, max_bytes) -> EncodedImage:
+    """描画ワーカーで実行される。進行状況の画像を描いてエンコードする"""
+    image = generate_rps_progress_image(session, user_avatar, username)
+    return encode_within(image, candidates, max_bytes)
+
+async def render_progress_file(session, user):
+    """進行状況画像の discord.File を返す。描画待ちが溢れていれば None"""
+    encoder = get_encoder("rps")
+    candidates = encoder.candidates()
+    frame_key = (rps_render_key(session), user.display_avatar.key, user.display_name, tuple(candidates))
+    encoded = frame_cache.get(frame_key)
 
-        amount = int(args[1])
+    if encoded is None:
+        user_avatar = await avatar_cache.get(user, AVATAR_SIZE)
+        try:
+            encoded = await render_service.run(
+                "rps", render_rps_frame, session, user_avatar, user.display_name,
+                candidates, encoder.budget.max_bytes
+            )
+        except RenderQueueFull:
+            print("[WARN] 描画待ちが上限に達したため、じゃんけんをテキストで表示します")
+            return None
+        encoder.record(encoded)
+        if not avatar_cache.is_placeholder(user_avatar):
+            frame_cache.put(frame_key, encoded, len(encoded.data))
+    return discord.File(BytesIO(encoded.data), filename=f"rps_result.{encoded.extension}")
+
+HAND_EMOJIS = {"rock": ROCK_HAND_EMOJI, "scissors": SCISSOR_HAND_EMOJI, "paper": PAPER_HAND_EMOJI}
+RESULT_MARKS = {"win": "🟩", "draw": "🟨", "lose": "🟥"}
+
+def attach_progress(embed, session, file):
+    """画像があれば埋め込みに設定し、無ければ履歴をテキストで追加する"""
+    if file is not None:
+        embed.set_image(url=f"attachment://{file.filename}")
+    elif session.history:
+        lines = [
+            f"{RESULT_MARKS[entry['result']]} {HAND_EMOJIS[entry['player']]} vs {HAND_EMOJIS[entry['opponent']]}"
+            for entry in session.history[-10:]
+        ]
+        embed.add_field(name="履歴", value="\n".join(lines), inline=False)
+
+async def on_rps_command(message: discord.Message, amount: int):
+    try: 
         uid = message.author.id
-        balance = get_user_balance(uid)
         min_bet = MIN_BET["rps"]
         if amount < min_bet:
             embed = create_embed("", f"掛け金は最低{PNC_EMOJI_STR}`100`以上にしてください。", discord.Color.red())
             await message.channel.send(embed=embed)
             return
 
-        if amount > balance:
+        debited, balance = await try_debit_balance(uid, amount)
+        if balance is None:
+            embed = EmbedFactory.not_registered()
+            await message.channel.send(embed=embed)
+            return
+        if not debited:
             embed = create_embed("", f"残高が足りません。\n現在の残高: {PNC_EMOJI_STR}`{balance}`", discord.Color.red())
             await message.channel.send(embed=embed)
             return
 
-        pf_data = load_pf_params(uid)
+        pf_data = await load_pf_params(uid)
         if pf_data and len(pf_data) == 3:
             client_seed, server_seed, nonce = pf_data
         else:
@@ -216,211 +298,133 @@ async def on_rps_command(message: discord.Message):
             server_seed = None
             nonce = 0
         session = RPSGameSession(uid, amount, client_seed, server_seed, nonce)
-        game_sessions[uid] = session
+        session_store.add("rps", session)
 
-        update_user_balance(uid, -amount)
         await message.channel.send(f"[🔐] hash: `{session.pf.server_seed_hash}`")
 
-        async with aiohttp.ClientSession() as session_http:
-            async with session_http.get(message.author.display_avatar.url) as resp:
-                avatar_bytes = BytesIO(await resp.read())
-
-        image = await generate_rps_progress_image(session, avatar_bytes, message.author.display_name)
-        buf = BytesIO()
-        image.save(buf, format="PNG")
-        buf.seek(0)
-        file = discord.File(buf, filename="rps_result.png")
+        file = await render_progress_file(session, message.author)
 
         embed = create_embed(f"{CURRENCY_NAME}じゃんけん", "じゃんけんぽん！", discord.Color(RPS_COLOR))
-        embed.set_image(url="attachment://rps_result.png")
-        embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1219916908485283880/1387141204604620918/ChatGPT_Image_2025625_03_43_31.png")
+        attach_progress(embed, session, file)
+        embed.set_thumbnail(url=media_url("thumb/rps"))
         embed.set_author(name=message.author.display_name, icon_url=message.author.display_avatar.url)
 
-        await message.channel.send(embed=embed, view=RPSPlayView(session), file=file)
+        if file is None:
+            await message.channel.send(embed=embed, view=rps_play_view(session))
+        else:
+            await message.channel.send(embed=embed, view=rps_play_view(session), file=file)
 
     except Exception as e:
         traceback.print_exc() 
         await message.channel.send(f"内部エラーが発生しました: `{type(e).__name__}: {str(e)}`")
 
 
-class RPSResultView(discord.ui.View):
-    def __init__(self, session, player_choice, opponent_choice, result):
-        super().__init__(timeout=60)
-        self.session = session
-
-    @discord.ui.button(label="継続", style=discord.ButtonStyle.success)
-    async def continue_button(self, interaction, button):
-        self.session.next_round(True)
-        await send_rps_prompt(interaction, self.session)
-
-    @discord.ui.button(label="キャッシュアウト", style=discord.ButtonStyle.secondary)
-    async def cashout_button(self, interaction, button):
-        amount = self.session.calc_win_amount()
-        if self.session.round == 0:
-            amount = self.session.bet_amount 
-        profit = amount - self.session.bet_amount  
-
-        update_user_balance(self.session.user_id, amount)
-        embed = create_embed(
-            "キャッシュアウト成功！",
-            f"{PNC_EMOJI_STR}`{amount}` **WIN**\n＋{PNC_EMOJI_STR}`{profit}`",
+RPS_CHOICES = ("rock", "scissors", "paper")
+
+def rps_play_view(session, disabled=False) -> discord.ui.View:
+    hands = (
+        GameButton("rps", session.session_id, "hand", i, emoji=HAND_EMOJIS[hand], style=discord.ButtonStyle.success, disabled=disabled)
+        for i, hand in enumerate(RPS_CHOICES)
+    )
+    cashout = GameButton("rps", session.session_id, "cashout", label="キャッシュアウト", style=discord.ButtonStyle.secondary, disabled=disabled, row=1)
+    return game_view(*hands, cashout)
+
+@route("rps", "cashout")
+async def on_cashout(interaction: discord.Interaction, session: RPSGameSession, _arg):
+    if await session_store.finish("rps", session.session_id) is None:
+        await interaction.response.send_message("このゲームは終了しています。", ephemeral=True)
+        return
+
+    amount = session.cashout_amount()
+    profit = amount - session.bet_amount
+
+    await credit_balance(session.user_id, amount)
+
+    file = await render_progress_file(session, interaction.user)
+
+    embed = create_embed(
+        "キャッシュアウト成功！",
+        f"{PNC_EMOJI_STR}`{amount}` **WIN**\n＋{PNC_EMOJI_STR}`{profit}`",
+        color=discord.Color(SUCCESS_COLOR)
+    )
+    embed.set_thumbnail(url=media_url("thumb/rps"))
+    attach_progress(embed, session, file)
+
+    await interaction.response.edit_message(embed=embed, attachments=[file] if file else [], view=rps_play_view(session, disabled=True))
+    if profit > 0:
+        await send_casino_log(
+            interaction,
+            "WIN",
+            WIN_EMOJI,
+            profit,
+            "",
             color=discord.Color(SUCCESS_COLOR)
         )
-        embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1219916908485283880/1387141204604620918/ChatGPT_Image_2025625_03_43_31.png")
-       
-        await interaction.response.send_message(embed=embed)
-        if profit > 0:
-            await send_casino_log(  
-                interaction,
-                "WIN",
-                WIN_EMOJI,
-                profit,
-                "",
-                color=discord.Color(SUCCESS_COLOR)
-            )
-        game_sessions.pop(self.session.user_id, None)
-
-
-async def send_rps_prompt(interaction, session):
-    view = RPSPlayView(session)
-    await interaction.edit_original_response(view=view)
-
-class RPSPlayView(discord.ui.View):
-    def __init__(self, session):
-        super().__init__(timeout=None) 
-        self.session = session
-
-    async def interaction_check(self, interaction: discord.Interaction) -> bool:
-        if interaction.user.id != self.session.user_id:
-            await interaction.response.send_message("これはあなたのゲームではありません。", ephemeral=True)
-            return False
-        return True
-
-    @discord.ui.button(emoji=ROCK_HAND_EMOJI, style=discord.ButtonStyle.success)
-    async def rock(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await self.resolve(interaction, "rock")
-
-    @discord.ui.button(emoji=SCISSOR_HAND_EMOJI, style=discord.ButtonStyle.success)
-    async def scissors(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await self.resolve(interaction, "scissors")
 
-    @discord.ui.button(emoji=PAPER_HAND_EMOJI, style=discord.ButtonStyle.success)
-    async def paper(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await self.resolve(interaction, "paper")
-
-
-    @discord.ui.button(label="キャッシュアウト", style=discord.ButtonStyle.secondary, row=1)
-    async def cashout(self, interaction: discord.Interaction, button: discord.ui.Button):
-        amount = self.session.calc_win_amount()
-        profit = amount - self.session.bet_amount
-        if self.session.round == 0:
-            amount = self.session.bet_amount
-            profit = 0
-
-        update_user_balance(self.session.user_id, amount)
-
-        async with aiohttp.ClientSession() as session_http:
-            async with session_http.get(interaction.user.display_avatar.url) as resp:
-                avatar_bytes = BytesIO(await resp.read())
-
-        image = await generate_rps_progress_image(self.session, avatar_bytes, interaction.user.display_name)
-        buf = BytesIO()
-        image.save(buf, format="PNG")
-        buf.seek(0)
-        file = discord.File(buf, filename="rps_result.png")
-
-        embed = create_embed(
-            "キャッシュアウト成功！",
-            f"{PNC_EMOJI_STR}`{amount}` **WIN**\n＋{PNC_EMOJI_STR}`{profit}`",
-            color=discord.Color(SUCCESS_COLOR)
-        )
-        embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1219916908485283880/1387141204604620918/ChatGPT_Image_2025625_03_43_31.png")
-        embed.set_image(url="attachment://rps_result.png")
-
-        disabled_view = RPSPlayView(self.session)
-        for item in disabled_view.children:
-            item.disabled = True
-
-        await interaction.response.edit_message(embed=embed, attachments=[file], view=disabled_view)
-        if profit > 0:
-            await send_casino_log(
-                interaction,
-                "WIN",
-                WIN_EMOJI,
-                profit,
-                "",
-                color=discord.Color(SUCCESS_COLOR)
-            )
-
-        game_sessions.pop(self.session.user_id, None)
-        self.stop()
+@route("rps", "hand")
+async def resolve(interaction: discord.Interaction, session: RPSGameSession, choice):
+    try:
+        if choice not in range(len(RPS_CHOICES)):
+            await interaction.response.send_message("⚠️ 無効な操作です。", ephemeral=True)
+            return
+        player_choice = RPS_CHOICES[choice]
+        pf = session.pf
+        opponent_choice = pf.get_opponent_hand()
+        result = determine_result(player_choice, opponent_choice)
+
+        session.history.append({
+            "player": player_choice,
+            "opponent": opponent_choice,
+            "result": result
+        })
+
+        file = await render_progress_file(session, interaction.user)
+
+        result_str = {"win": "WIN", "lose": "LOSE", "draw": "DRAW"}[result]
+        color = discord.Color.green() if result == "win" else discord.Color.red() if result == "lose" else discord.Color(DRAW_COLOR)
+
+        embed = create_embed(f"{CURRENCY_NAME}じゃんけん", f"### {PNC_EMOJI_STR}`{session.calc_win_amount()}` **{result_str}**", color)
+        attach_progress(embed, session, file)
+        embed.set_thumbnail(url=media_url("thumb/rps"))
+        embed.add_field(name="🔐 Provably Fair", value=pf.get_pf_info(), inline=False)
+        embed.set_author(name=interaction.user.display_name, icon_url=interaction.user.display_avatar.url)
+
+        if result == "lose":
+            await session_store.finish("rps", session.session_id)
+            await interaction.response.edit_message(embed=embed, attachments=[file] if file else [], view=None)
+        elif result == "win":
+            if len(session.history) >= 20:
+                amount = session.calc_win_amount()
+                profit = amount - session.bet_amount
+                await session_store.finish("rps", session.session_id)
+                await credit_balance(session.user_id, amount)
+
+                await interaction.response.edit_message(embed=embed, attachments=[file] if file else [], view=None)
+                await interaction.followup.send(
+                    f"20連勝達成！自動キャッシュアウトで {PNC_EMOJI_STR}`{amount}`\n＋{PNC_EMOJI_STR}`{profit}`",
+                    ephemeral=True
+                )
+                await send_casino_log(
+                    interaction,
+                    "MAX WIN",
+                    WIN_EMOJI,
+                    profit,
+                    f"",
+                    color=discord.Color(SUCCESS_COLOR)
+                )
+                return
+            session.next_round()
+            # 相手の手は nonce から決まるので、見せた後に古い状態から戻されないよう先に書く
+            await session_store.save("rps", session.session_id)
+            await interaction.response.edit_message(embed=embed, attachments=[file] if file else [], view=rps_play_view(session))
+        else:
+            await session_store.save("rps", session.session_id)
+            await interaction.response.edit_message(embed=embed, attachments=[file] if file else [], view=rps_play_view(session))
 
-    async def resolve(self, interaction, player_choice):
+    except Exception as e:
+        print("[ERROR] resolve 内で例外が発生:", e)
+        traceback.print_exc()
         try:
-            session = self.session
-            pf = session.pf
-            opponent_choice = pf.get_opponent_hand()
-            result = determine_result(player_choice, opponent_choice)
-
-            session.history.append({
-                "player": player_choice,
-                "opponent": opponent_choice,
-                "result": result
-            })
-
-            async with aiohttp.ClientSession() as session_http:
-                async with session_http.get(interaction.user.display_avatar.url) as resp:
-                    avatar_bytes = BytesIO(await resp.read())
-
-            image = await generate_rps_progress_image(session, avatar_bytes, interaction.user.display_name)
-            buf = BytesIO()
-            image.save(buf, format="PNG")
-            buf.seek(0)
-            file = discord.File(buf, filename="rps_result.png")
-
-            result_str = {"win": "WIN", "lose": "LOSE", "draw": "DRAW"}[result]
-            color = discord.Color.green() if result == "win" else discord.Color.red() if result == "lose" else discord.Color(DRAW_COLOR)
-
-            embed = create_embed(f"{CURRENCY_NAME}じゃんけん", f"### {PNC_EMOJI_STR}`{session.calc_win_amount()}` **{result_str}**", color)
-            embed.set_image(url="attachment://rps_result.png")
-            embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1219916908485283880/1387141204604620918/ChatGPT_Image_2025625_03_43_31.png?ex=685c436b&is=685af1eb&hm=ee447640b7d37905669af4ea5364e84788e9a0874a010b2fb5a13205968b4154&")
-            embed.add_field(name="🔐 Provably Fair", value=pf.get_pf_info(), inline=False)
-            embed.set_author(name=interaction.user.display_name, icon_url=interaction.user.display_avatar.url)
-
-            if result == "lose":
-                game_sessions.pop(session.user_id, None)
-                await interaction.response.edit_message(embed=embed, attachments=[file], view=None)
-                self.stop()
-            elif result == "win":
-                if len(session.history) >= 20:
-                    amount = session.calc_win_amount()
-                    profit = amount - session.bet_amount
-                    update_user_balance(session.user_id, amount)
-
-                    await interaction.followup.send(
-                        f"20連勝達成！自動キャッシュアウトで {PNC_EMOJI_STR}`{amount}`n＋{PNC_EMOJI_STR}`{profit}`",
-                        ephemeral=True
-                    )
-                    await send_casino_log(
-                        interaction,
-                        "MAX WIN",
-                        WIN_EMOJI,
-                        profit,
-                        f"",
-                        color=discord.Color(SUCCESS_COLOR)
-                    )
-                    game_sessions.pop(session.user_id, None)
-                    self.stop()
-                    return
-                session.next_round()
-                await interaction.response.edit_message(embed=embed, attachments=[file], view=self)
-            else:
-                await interaction.response.edit_message(embed=embed, attachments=[file], view=self)
-
-        except Exception as e:
-            print("[ERROR] resolve 内で例外が発生:", e)
-            traceback.print_exc()
-            try:
-                await interaction.response.send_message("⚠️ 内部エラーが発生しました。", ephemeral=True)
-            except discord.InteractionResponded:
-                pass
\ No newline at end of file
+            await interaction.response.send_message("⚠️ 内部エラーが発生しました。", ephemeral=True)
+        except discord.InteractionResponded:
+            pass
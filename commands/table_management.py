@@ -4,7 +4,7 @@ import discord
 from discord import app_commands
 
 from config import GUILD_ID
-from database.db import (
+from database.async_db import (
     save_casino_table,
     get_all_casino_tables,
     delete_casino_table,
@@ -129,7 +129,7 @@ async def setup_table_commands(bot):
         try:
             guild = interaction.guild
             
-            existing_tables = get_casino_table_count()
+            existing_tables = await get_casino_table_count()
             
             categories = await get_casino_categories(guild)
             
@@ -159,7 +159,7 @@ async def setup_table_commands(bot):
                 channel = await create_table_channel(current_category, table_number)
                 created_channels.append(channel)
                 
-                save_casino_table(
+                await save_casino_table(
                     channel_id=channel.id,
                     category_id=current_category.id,
                     table_number=table_number,
@@ -242,7 +242,7 @@ async def setup_table_commands(bot):
         try:
             guild = interaction.guild
             
-            all_tables = get_all_casino_tables()
+            all_tables = await get_all_casino_tables()
             
             if not all_tables:
                 progress_embed.title = "削除対象なし"
@@ -271,7 +271,7 @@ async def setup_table_commands(bot):
                     else:
                         failed_channels.append(f"{channel_name} (ID: {channel_id}) - 既に削除済み")
                     
-                    delete_casino_table(channel_id)
+                    await delete_casino_table(channel_id)
                     
                 except discord.Forbidden:
                     failed_channels.append(f"{channel_name} - 権限不足")
@@ -350,7 +350,7 @@ async def setup_table_commands(bot):
         await interaction.response.defer(ephemeral=True)
         
         try:
-            all_tables = get_all_casino_tables()
+            all_tables = await get_all_casino_tables()
             
             if not all_tables:
                 await interaction.followup.send(
@@ -52,11 +52,47 @@ CASINO_STATS_COLLECTION: Final[str] = os.getenv("CASINO_STATS_COLLECTION", "casi
 MODELS_COLLECTION: Final[str] = os.getenv("MODELS_COLLECTION", "models")
 BLACKJACK_LOGS_COLLECTION: Final[str] = os.getenv("BLACKJACK_LOGS_COLLECTION", "blackjack_logs")
 FINANCIAL_TRANSACTIONS_COLLECTION: Final[str] = os.getenv("FINANCIAL_TRANSACTIONS_COLLECTION", "financial_transactions")
+TRANSACTION_BUCKETS_COLLECTION: Final[str] = os.getenv("TRANSACTION_BUCKETS_COLLECTION", "transaction_buckets")
 CASINO_TRANSACTION_COLLECTION: Final[str] = os.getenv("CASINO_TRANSACTION_COLLECTION", "casino_transactions")
 BET_HISTORY_COLLECTION: Final[str] = os.getenv("BET_HISTORY_COLLECTION", "bet_history")
 BOT_STATE_COLLECTION: Final[str] = os.getenv("BOT_STATE_COLLECTION", "bot_state")
+LIVE_SESSIONS_COLLECTION: Final[str] = os.getenv("LIVE_SESSIONS_COLLECTION", "live_sessions")
 BLACKLIST_COLLECTION: Final[str] = os.getenv("BLACKLIST_COLLECTION", "blacklist")
 
+# データベースバックエンド（"sync": pymongoを専用スレッドで実行 / "async": motor）
+DB_BACKEND: Final[str] = os.getenv("DB_BACKEND", "sync").strip().lower()
+DB_THREAD_POOL_SIZE: Final[int] = int(os.getenv("DB_THREAD_POOL_SIZE", "16"))
+
+TRANSACTION_BUCKET_SIZE: Final[int] = 200  # 1バケットあたりの最大トランザクション数
+
+# ユーザープロフィールキャッシュ（0で無効）
+USER_CACHE_SIZE: Final[int] = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL: Final[float] = float(os.getenv("USER_CACHE_TTL", "30"))
+
+# 画像描画ワーカー（"thread" / "process"）
+RENDER_MODE: Final[str] = os.getenv("RENDER_MODE", "thread").strip().lower()
+RENDER_WORKERS: Final[int] = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_MAX_PENDING: Final[int] = int(os.getenv("RENDER_MAX_PENDING", "32"))  # これを超えるとテキスト表示に切り替え
+ASSET_CACHE_DIR: Final[str] = os.getenv("ASSET_CACHE_DIR", "cache/assets")  # スプライトアトラスの保存先（空文字で保存しない）
+
+# 画像エンコード（auto の場合は予算に収まるよう形式と画質を自動で選ぶ）
+IMAGE_FORMAT: Final[str] = os.getenv("IMAGE_FORMAT", "auto").strip().lower()  # auto / png / png8 / webp / jpeg
+IMAGE_QUALITY: Final[int] = int(os.getenv("IMAGE_QUALITY", "80"))  # webp / jpeg
+IMAGE_PNG_COMPRESS_LEVEL: Final[int] = int(os.getenv("IMAGE_PNG_COMPRESS_LEVEL", "1"))  # 0-9
+IMAGE_SCALE: Final[float] = float(os.getenv("IMAGE_SCALE", "1.0"))
+BLACKJACK_IMAGE_MAX_KB: Final[int] = int(os.getenv("BLACKJACK_IMAGE_MAX_KB", "300"))
+BLACKJACK_IMAGE_MAX_MS: Final[float] = float(os.getenv("BLACKJACK_IMAGE_MAX_MS", "120"))
+RPS_IMAGE_MAX_KB: Final[int] = int(os.getenv("RPS_IMAGE_MAX_KB", "150"))
+RPS_IMAGE_MAX_MS: Final[float] = float(os.getenv("RPS_IMAGE_MAX_MS", "60"))
+RENDER_LAYER_CACHE_MB: Final[int] = int(os.getenv("RENDER_LAYER_CACHE_MB", "128"))  # アバター抜きの描画結果（ワーカーごと）
+RENDER_FRAME_CACHE_MB: Final[int] = int(os.getenv("RENDER_FRAME_CACHE_MB", "32"))  # エンコード済みの画像
+
+# HTTP接続とアバターキャッシュ
+HTTP_POOL_LIMIT: Final[int] = int(os.getenv("HTTP_POOL_LIMIT", "32"))
+HTTP_TIMEOUT: Final[float] = float(os.getenv("HTTP_TIMEOUT", "10"))
+AVATAR_CACHE_SIZE: Final[int] = int(os.getenv("AVATAR_CACHE_SIZE", "512"))
+AVATAR_CACHE_DIR: Final[str] = os.getenv("AVATAR_CACHE_DIR", "cache/avatars")  # 空文字でディスクキャッシュ無効
+
 CURRENCY_NAME: Final[str] = safe_get_str_env("CURRENCY_NAME", "COIN") or "COIN"  # 通貨名（デフォルト: COIN）
 
 MIN_INITIAL_DEPOSIT: Final[int] = 100  # 入金の最低金額
@@ -71,6 +107,30 @@ MIN_BET: Final[dict[str, int]] = {
     "rps": 100,
 }
 
+# 放置されたゲームの有効期限（秒）。最後の操作からこれを過ぎたセッションは清算して終了する
+SESSION_TTL_SECONDS: Final[dict[str, float]] = {
+    "blackjack": 600,
+    "dice": 600,
+    "flip": 300,
+    "mines": 1800,
+    "rps": 1800,
+}
+SESSION_DEFAULT_TTL_SECONDS: Final[float] = 600
+# 期限切れの清算方法。refund: 掛け金を返す / cashout: その時点の払い戻し額を返す / forfeit: 没収
+# 結果を見てから放置すれば得をするゲーム（ブラックジャック・ダイス）は没収にする
+SESSION_EXPIRY_POLICY: Final[dict[str, str]] = {
+    "blackjack": "forfeit",
+    "dice": "forfeit",
+    "flip": "refund",
+    "mines": "cashout",
+    "rps": "cashout",
+}
+SESSION_SWEEP_INTERVAL_SECONDS: Final[float] = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "60"))
+# 盤面の変化をまとめて保存する間隔（開始・終了はすぐに保存する）
+SESSION_SNAPSHOT_INTERVAL_SECONDS: Final[float] = float(os.getenv("SESSION_SNAPSHOT_INTERVAL_SECONDS", "5"))
+# SIGTERM/SIGINT を受けてから処理中のコマンド・ボタン操作を待つ最大秒数
+SHUTDOWN_DRAIN_SECONDS: Final[float] = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "8"))
+
 DICE_FOLDER: Final[str] = "assets/dice"
 
 GUILD_ID: Final[int] = safe_get_int_env("GUILD_ID", 0)
@@ -85,6 +145,15 @@ FLIP_GIF_URL: Final[str] = "https://cdn.discordapp.com/attachments/1219916908485
 THUMBNAIL_URL: Final[str] = "https://cdn.discordapp.com/attachments/1219916908485283880/1386322194111533147/ChatGPT_Image_2025622_21_28_04.png?ex=685948a7&is=6857f727&hm=548ff6d889653c59ec69f641efc2c21192c6cdb2c0798ae2c5d2d3cc289a38dd&"
 FRONT_IMG: Final[str] = "https://cdn.discordapp.com/attachments/1219916908485283880/1383915331185020989/0.png?ex=68508716&is=684f3596&hm=1da630e3b7a3447d7c72e434c2b8626775063a1b2b4f58abbb595f2d2bafa3ee&"
 BACK_IMG: Final[str] = "https://cdn.discordapp.com/attachments/1219916908485283880/1383915330933620796/23.png?ex=68508716&is=684f3596&hm=ba04bb357d7656faf58734b0f94af17e2463cd00a356bb74e0a338044ea47bd5&"
+DICE_THUMBNAIL_URL: Final[str] = "https://cdn.discordapp.com/attachments/1219916908485283880/1389815902278647818/ChatGPT_Image_202572_12_51_52.png?ex=6865fe6c&is=6864acec&hm=1532507b0941122a27dbc8859aa83321cad484328bd9f310d43c3b7ed63a2fcc&"
+BLACKJACK_THUMBNAIL_URL: Final[str] = "https://cdn.discordapp.com/attachments/1219916908485283880/1386317663231414272/ChatGPT_Image_2025622_21_11_08.png?ex=6859446f&is=6857f2ef&hm=19507da3f6ae2ea49377b1112e687a6690cd37bb229cc4ebcd5a1fef2c5965e6&"
+MINES_THUMBNAIL_URL: Final[str] = "https://cdn.discordapp.com/attachments/1219916908485283880/1386292653318209647/ChatGPT_Image_2025622_19_31_53.png?ex=68592d24&is=6857dba4&hm=b8949b8e92394ebf1d2ef1f159fa408153e462c6c519eead391d8bfc52fb6740&"
+RPS_THUMBNAIL_URL: Final[str] = "https://cdn.discordapp.com/attachments/1219916908485283880/1387141204604620918/ChatGPT_Image_2025625_03_43_31.png?ex=685c436b&is=685af1eb&hm=ee447640b7d37905669af4ea5364e84788e9a0874a010b2fb5a13205968b4154&"
+
+# 静的メディアの保存先（0の場合はアップロードせず、ファイル添付と上記URLをそのまま使う）
+MEDIA_CHANNEL_ID: Final[int] = safe_get_int_env("MEDIA_CHANNEL_ID", 0)
+MEDIA_REFRESH_MARGIN_HOURS: Final[float] = float(os.getenv("MEDIA_REFRESH_MARGIN_HOURS", "3"))  # 期限までこれを切ったらURLを取り直す（URLの有効期限は約24時間。更新間隔より長くする）
+MEDIA_REFRESH_INTERVAL_MINUTES: Final[float] = float(os.getenv("MEDIA_REFRESH_INTERVAL_MINUTES", "60"))
 
 JST: Final = pytz.timezone("Asia/Tokyo")
 
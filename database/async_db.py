@@ -0,0 +1,397 @@
+"""database.db の非同期版。
+
+関数名・引数・戻り値は database.db と同じ。DB_BACKEND=async なら motor で直接
+非同期に問い合わせ、sync なら pymongo のヘルパーを専用スレッドプールで実行する。
+どちらのバックエンドでもイベントループは MongoDB の往復を待たない。
+"""
+import asyncio
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+from typing import Any, Callable, Iterable, Optional, TypeVar
+
+from pymongo import ReplaceOne, ReturnDocument
+
+import config
+from database import db, transactions
+from database.cache import MISSING, user_cache
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+except ImportError:  # motor は任意依存
+    AsyncIOMotorClient = None
+    AsyncIOMotorDatabase = None
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_motor_client: Optional["AsyncIOMotorClient"] = None
+_motor_db: Optional["AsyncIOMotorDatabase"] = None
+
+if config.DB_BACKEND not in ("sync", "async"):
+    print(f"[WARN] DB_BACKEND の値 '{config.DB_BACKEND}' が無効です。sync バックエンドを使用します。")
+elif config.DB_BACKEND == "async" and AsyncIOMotorClient is None:
+    print("[WARN] DB_BACKEND=async ですが motor がインストールされていません。sync バックエンドを使用します。")
+
+
+def get_backend() -> str:
+    """実際に使用されるバックエンド名（"sync" / "async"）"""
+    if config.DB_BACKEND == "async" and AsyncIOMotorClient is not None:
+        return "async"
+    return "sync"
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=max(1, config.DB_THREAD_POOL_SIZE),
+            thread_name_prefix="db"
+        )
+    return _executor
+
+
+def _get_motor_database() -> "AsyncIOMotorDatabase":
+    global _motor_client, _motor_db
+    if _motor_db is None:
+        _motor_client = AsyncIOMotorClient(config.MONGO_URI)
+        _motor_db = _motor_client[config.DB_NAME]
+    return _motor_db
+
+
+def _motor(collection_name: str):
+    """asyncバックエンドならmotorのコレクション、syncならNoneを返す"""
+    if get_backend() != "async":
+        return None
+    return _get_motor_database()[collection_name]
+
+
+async def run_sync(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """同期関数をDB用スレッドプールで実行する"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), partial(func, *args, **kwargs))
+
+
+async def load_pf_params(user_id: int) -> tuple[Optional[str], int]:
+    coll = _motor("pf_params")
+    if coll is None:
+        return await run_sync(db.load_pf_params, user_id)
+    doc = await coll.find_one({"user_id": user_id})
+    if doc:
+        return doc.get("client_seed"), doc.get("nonce", 0)
+    return None, 0
+
+
+async def save_pf_params(user_id: int, client_seed: str, server_seed: str, nonce: int) -> None:
+    coll = _motor("pf_params")
+    if coll is None:
+        return await run_sync(db.save_pf_params, user_id, client_seed, server_seed, nonce)
+    await coll.update_one(
+        {"user_id": user_id},
+        {
+            "$set": {
+                "client_seed": client_seed,
+                "server_seed": server_seed,
+                "nonce": nonce
+            }
+        },
+        upsert=True
+    )
+
+
+async def get_user(user_id: int) -> Optional[dict[str, Any]]:
+    """ユーザードキュメントを取得（キャッシュ経由）"""
+    cached = user_cache.get(user_id)
+    if cached is not MISSING:
+        return cached
+    coll = _motor(config.USERS_COLLECTION)
+    if coll is None:
+        return await run_sync(db.fetch_user, user_id)
+    read_started = user_cache.begin_read()
+    user = await coll.find_one({"user_id": user_id})
+    user_cache.put(user_id, user, read_started)
+    return user
+
+
+async def get_active_user(user_id: int) -> Optional[dict[str, Any]]:
+    coll = _motor("active_users")
+    if coll is None:
+        return await run_sync(db.get_active_user, user_id)
+    return await coll.find_one({"user_id": user_id})
+
+
+async def get_user_balance(user_id: int) -> Optional[int]:
+    """残高を取得"""
+    user = await get_user(user_id)
+    return user["balance"] if user else None
+
+
+async def update_user_balance(user_id: int, amount: int) -> None:
+    coll = _motor(config.USERS_COLLECTION)
+    if coll is None:
+        return await run_sync(db.update_user_balance, user_id, amount)
+    user_cache.begin_write(user_id)
+    try:
+        await coll.update_one(
+            {"user_id": user_id},
+            {"$inc": {"balance": amount}},
+            upsert=True
+        )
+    finally:
+        user_cache.end_write(user_id)
+
+
+async def try_debit_balance(user_id: int, amount: int) -> tuple[bool, Optional[int]]:
+    """残高が amount 以上のときだけ引き落とす。(成功したか, 残高) を返す"""
+    coll = _motor(config.USERS_COLLECTION)
+    if coll is None:
+        return await run_sync(db.try_debit_balance, user_id, amount)
+    balance = None
+    user_cache.begin_write(user_id)
+    try:
+        doc = await coll.find_one_and_update(
+            {"user_id": user_id, "balance": {"$gte": amount}},
+            {"$inc": {"balance": -amount}},
+            projection={"balance": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if doc:
+            balance = doc["balance"]
+    finally:
+        user_cache.end_write(user_id, balance)
+    if balance is not None:
+        return True, balance
+    return False, await get_user_balance(user_id)
+
+
+async def credit_balance(user_id: int, amount: int) -> int:
+    """払い戻しを加算し、加算後の残高を返す"""
+    coll = _motor(config.USERS_COLLECTION)
+    if coll is None:
+        return await run_sync(db.credit_balance, user_id, amount)
+    balance = None
+    user_cache.begin_write(user_id)
+    try:
+        doc = await coll.find_one_and_update(
+            {"user_id": user_id},
+            {"$inc": {"balance": amount}},
+            projection={"balance": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        balance = doc["balance"]
+    finally:
+        user_cache.end_write(user_id, balance)
+    return balance
+
+
+async def get_user_streaks(user_id: int, game_type: str) -> tuple[int, int]:
+    """ゲームタイプごとのユーザーの連勝・連敗記録を取得"""
+    user = await get_user(user_id)
+
+    if not user or "streaks" not in user:
+        return 0, 0
+
+    game_streaks = user.get("streaks", {}).get(game_type, {})
+    return game_streaks.get("win_streak", 0), game_streaks.get("lose_streak", 0)
+
+
+async def register_user(user_id: int, sender_external_id: str) -> None:
+    """新規ユーザーを登録"""
+    coll = _motor(config.USERS_COLLECTION)
+    if coll is None:
+        return await run_sync(db.register_user, user_id, sender_external_id)
+    user_cache.begin_write(user_id)
+    try:
+        await coll.update_one(
+            {"user_id": user_id},
+            {"$set": {
+                "sender_external_id": sender_external_id,
+                "balance": 0
+            }},
+            upsert=True
+        )
+    finally:
+        user_cache.end_write(user_id)
+
+
+async def get_user_transactions(
+    user_id: int,
+    game_type: Optional[str] = None,
+    days: Optional[int] = None
+) -> list[dict[str, Any]]:
+    since = datetime.datetime.now() - timedelta(days=days) if days else None
+    return await get_user_transactions_range(
+        user_id,
+        types=[game_type] if game_type else None,
+        since=since
+    )
+
+
+async def get_user_transactions_range(
+    user_id: int,
+    types: Optional[Iterable[str]] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None
+) -> list[dict[str, Any]]:
+    """[since, until) のトランザクションを種類で絞り込んで古い順に取得"""
+    coll = _motor(config.TRANSACTION_BUCKETS_COLLECTION)
+    if coll is None:
+        return await run_sync(db.get_user_transactions_range, user_id, types, since, until)
+    pipeline = transactions.build_history_pipeline(user_id, types, since, until)
+    return await coll.aggregate(pipeline).to_list(length=None)
+
+
+async def push_financial_transaction(user_id: int, transaction: dict[str, Any]) -> None:
+    coll = _motor(config.TRANSACTION_BUCKETS_COLLECTION)
+    if coll is None:
+        return await run_sync(db.push_financial_transaction, user_id, transaction)
+    query, update = transactions.build_bucket_push(user_id, transaction)
+    await coll.update_one(query, update, upsert=True)
+
+
+async def save_account_panel_message_id(message_id: int) -> None:
+    coll = _motor(config.BOT_STATE_COLLECTION)
+    if coll is None:
+        return await run_sync(
+            db.bot_state_collection.update_one,
+            {"_id": "account_panel"},
+            {"$set": {"message_id": message_id}},
+            upsert=True
+        )
+    await coll.update_one(
+        {"_id": "account_panel"},
+        {"$set": {"message_id": message_id}},
+        upsert=True
+    )
+
+
+async def get_account_panel_message_id() -> Optional[int]:
+    coll = _motor(config.BOT_STATE_COLLECTION)
+    if coll is None:
+        doc = await run_sync(db.bot_state_collection.find_one, {"_id": "account_panel"})
+    else:
+        doc = await coll.find_one({"_id": "account_panel"})
+    return doc["message_id"] if doc and "message_id" in doc else None
+
+
+async def get_media_records() -> dict[str, dict[str, Any]]:
+    coll = _motor(config.BOT_STATE_COLLECTION)
+    if coll is None:
+        return await run_sync(db.get_media_records)
+    doc = await coll.find_one({"_id": "media_registry"})
+    return doc.get("items", {}) if doc else {}
+
+
+async def save_media_record(name: str, record: dict[str, Any]) -> None:
+    coll = _motor(config.BOT_STATE_COLLECTION)
+    if coll is None:
+        return await run_sync(db.save_media_record, name, record)
+    await coll.update_one(
+        {"_id": "media_registry"},
+        {"$set": {f"items.{name}": record}},
+        upsert=True
+    )
+
+
+async def delete_media_record(name: str) -> None:
+    coll = _motor(config.BOT_STATE_COLLECTION)
+    if coll is None:
+        return await run_sync(db.delete_media_record, name)
+    await coll.update_one({"_id": "media_registry"}, {"$unset": {f"items.{name}": ""}})
+
+
+async def get_live_sessions() -> list[dict[str, Any]]:
+    coll = _motor(config.LIVE_SESSIONS_COLLECTION)
+    if coll is None:
+        return await run_sync(db.get_live_sessions)
+    return [doc async for doc in coll.find({})]
+
+
+async def save_live_sessions(docs: list[dict[str, Any]]) -> None:
+    coll = _motor(config.LIVE_SESSIONS_COLLECTION)
+    if coll is None:
+        return await run_sync(db.save_live_sessions, docs)
+    if docs:
+        await coll.bulk_write([ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs], ordered=False)
+
+
+async def delete_live_sessions(session_ids: list[str]) -> None:
+    coll = _motor(config.LIVE_SESSIONS_COLLECTION)
+    if coll is None:
+        return await run_sync(db.delete_live_sessions, session_ids)
+    if session_ids:
+        await coll.delete_many({"_id": {"$in": session_ids}})
+
+
+async def get_all_user_balances() -> list[tuple[int, int]]:
+    """全ユーザーのuser_idと残高を取得する"""
+    coll = _motor(config.USERS_COLLECTION)
+    if coll is None:
+        return await run_sync(db.get_all_user_balances)
+    cursor = coll.find({}, {"user_id": 1, "balance": 1})
+    return [(doc["user_id"], doc.get("balance", 0)) async for doc in cursor]
+
+# カジノテーブル
+async def save_casino_table(
+    channel_id: int,
+    category_id: int,
+    table_number: int,
+    channel_name: str,
+    category_name: str
+) -> None:
+    coll = _motor("casino_tables")
+    if coll is None:
+        return await run_sync(
+            db.save_casino_table, channel_id, category_id, table_number, channel_name, category_name
+        )
+    await coll.insert_one({
+        "channel_id": channel_id,
+        "category_id": category_id,
+        "table_number": table_number,
+        "channel_name": channel_name,
+        "category_name": category_name,
+        "created_at": datetime.datetime.now()
+    })
+
+
+async def get_all_casino_tables() -> list[dict[str, Any]]:
+    coll = _motor("casino_tables")
+    if coll is None:
+        return await run_sync(db.get_all_casino_tables)
+    return await coll.find({}).to_list(length=None)
+
+
+async def delete_casino_table(channel_id: int) -> None:
+    coll = _motor("casino_tables")
+    if coll is None:
+        return await run_sync(db.delete_casino_table, channel_id)
+    await coll.delete_one({"channel_id": channel_id})
+
+
+async def clear_all_casino_tables() -> int:
+    coll = _motor("casino_tables")
+    if coll is None:
+        return await run_sync(db.clear_all_casino_tables)
+    result = await coll.delete_many({})
+    return result.deleted_count
+
+
+async def get_casino_table_count() -> int:
+    coll = _motor("casino_tables")
+    if coll is None:
+        return await run_sync(db.get_casino_table_count)
+    return await coll.count_documents({})
+
+
+def close() -> None:
+    """クライアントとスレッドプールを閉じる"""
+    global _executor, _motor_client, _motor_db
+    if _motor_client is not None:
+        _motor_client.close()
+        _motor_client = None
+        _motor_db = None
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
@@ -0,0 +1,127 @@
+"""users コレクションの前段に置くプロセス内キャッシュ。
+
+件数上限つきのLRUで、各エントリはTTLを過ぎると読み直す。残高を変更する
+ヘルパーは必ずエントリを更新するか無効化するので、ボット経由の変更はすぐ反映される。
+TTLはボット外（管理ツールなど）からの直接変更が見えるまでの上限になる。
+
+sync バックエンドではDB用スレッドから同時に呼ばれるため、操作はロックで保護する。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import config
+
+MISSING = object()
+
+
+class UserProfileCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, tuple[float, Optional[dict[str, Any]]]] = OrderedDict()
+        # 書き込みの論理時刻。読み込み中に書き込まれた古い値を put しないために使う
+        self._clock = 0
+        self._last_write: OrderedDict[int, int] = OrderedDict()
+        self._cleared_at = 0
+        self._pending: dict[int, int] = {}
+        self._overlapped: set[int] = set()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Any:
+        """キャッシュ済みのドキュメント（未登録なら None）、無ければ MISSING を返す"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            doc = entry[1]
+            return dict(doc) if doc is not None else None
+
+    def begin_read(self) -> int:
+        with self._lock:
+            return self._clock
+
+    def put(self, user_id: int, doc: Optional[dict[str, Any]], read_started: int) -> None:
+        """DBから読んだドキュメントを格納する。読み込み開始後に書き込みがあれば捨てる"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if (
+                read_started < self._cleared_at
+                or user_id in self._pending
+                or self._last_write.get(user_id, 0) > read_started
+            ):
+                return
+            self._entries[user_id] = (time.monotonic() + self.ttl, dict(doc) if doc is not None else None)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def begin_write(self, user_id: int) -> None:
+        """残高を変更するDB操作の直前に呼ぶ"""
+        with self._lock:
+            self._clock += 1
+            self._last_write[user_id] = self._clock
+            self._last_write.move_to_end(user_id)
+            while len(self._last_write) > max(self.max_size, 1) * 4:
+                oldest = next(iter(self._last_write))
+                if oldest in self._pending:
+                    break
+                self._last_write.popitem(last=False)
+            self._pending[user_id] = self._pending.get(user_id, 0) + 1
+            if self._pending[user_id] > 1:
+                self._overlapped.add(user_id)
+
+    def end_write(self, user_id: int, balance: Optional[int] = None) -> None:
+        """DB操作の完了後に呼ぶ。更新後の残高が分かればエントリを書き換え、分からなければ無効化する
+
+        同じユーザーへの書き込みが重なった場合、どちらの結果が最新か分からないので無効化する。
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if balance is None or user_id in self._overlapped or entry is None or entry[1] is None:
+                self._entries.pop(user_id, None)
+            else:
+                doc = dict(entry[1])
+                doc["balance"] = balance
+                self._entries[user_id] = (entry[0], doc)
+
+            remaining = self._pending.get(user_id, 1) - 1
+            if remaining > 0:
+                self._pending[user_id] = remaining
+            else:
+                self._pending.pop(user_id, None)
+                self._overlapped.discard(user_id)
+
+    def invalidate(self, user_id: int) -> None:
+        self.begin_write(user_id)
+        self.end_write(user_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clock += 1
+            self._cleared_at = self._clock
+            self._entries.clear()
+            self._last_write.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+user_cache = UserProfileCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL)
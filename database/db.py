@@ -1,12 +1,15 @@
 import datetime
 from datetime import timedelta
-from typing import Optional, Any
+from typing import Optional, Any, Iterable
 
 import pymongo
+from pymongo import ReplaceOne, ReturnDocument
 from pymongo.collection import Collection
 from pymongo.database import Database
 
 import config
+from database import transactions
+from database.cache import MISSING, user_cache
 
 _client: Optional[pymongo.MongoClient] = None
 _db: Optional[Database] = None
@@ -25,18 +28,28 @@ def get_database() -> Database:
         _db = get_client()[config.DB_NAME]
     return _db
 
+def close() -> None:
+    """MongoClient を閉じる（終了時に呼ぶ）"""
+    global _client, _db
+    if _client is not None:
+        _client.close()
+        _client = None
+        _db = None
+
 def get_collection(collection_name: str) -> Collection:
     return get_database()[collection_name]
 
 tokens_collection = get_collection(config.TOKENS_COLLECTION)
 blacklist_collection = get_collection(config.BLACKLIST_COLLECTION)
 financial_transactions_collection = get_collection(config.FINANCIAL_TRANSACTIONS_COLLECTION)
+transaction_buckets_collection = get_collection(config.TRANSACTION_BUCKETS_COLLECTION)
 casino_transactions_collection = get_collection(config.CASINO_TRANSACTION_COLLECTION)
 users_collection = get_collection(config.USERS_COLLECTION)
 casino_stats_collection = get_collection(config.CASINO_STATS_COLLECTION)
 models_collection = get_collection(config.MODELS_COLLECTION)
 bet_history_collection = get_collection(config.BET_HISTORY_COLLECTION)
 bot_state_collection = get_collection(config.BOT_STATE_COLLECTION)
+live_sessions_collection = get_collection(config.LIVE_SESSIONS_COLLECTION)
 
 payin_settings_collection = get_collection("payin_settings")
 invited_users_collection = get_collection("invited_users")
@@ -70,22 +83,87 @@ def save_pf_params(user_id: int, client_seed: str, server_seed: str, nonce: int)
         upsert=True
     )
 
+def get_user(user_id: int) -> Optional[dict[str, Any]]:
+    """ユーザードキュメントを取得（キャッシュ経由）"""
+    cached = user_cache.get(user_id)
+    if cached is not MISSING:
+        return cached
+    return fetch_user(user_id)
+
+
+def fetch_user(user_id: int) -> Optional[dict[str, Any]]:
+    """キャッシュを見ずにDBから取得し、結果をキャッシュに格納する"""
+    read_started = user_cache.begin_read()
+    user = users_collection.find_one({"user_id": user_id})
+    user_cache.put(user_id, user, read_started)
+    return user
+
+
+def get_active_user(user_id: int) -> Optional[dict[str, Any]]:
+    return active_users_collection.find_one({"user_id": user_id})
+
+
 def get_user_balance(user_id: int) -> Optional[int]:
     """残高を取得"""
-    user = users_collection.find_one({"user_id": user_id})
+    user = get_user(user_id)
     return user["balance"] if user else None
 
 
 def update_user_balance(user_id: int, amount: int) -> None:
-    users_collection.update_one(
-        {"user_id": user_id},
-        {"$inc": {"balance": amount}},
-        upsert=True
-    )
+    user_cache.begin_write(user_id)
+    try:
+        users_collection.update_one(
+            {"user_id": user_id},
+            {"$inc": {"balance": amount}},
+            upsert=True
+        )
+    finally:
+        user_cache.end_write(user_id)
+
+def try_debit_balance(user_id: int, amount: int) -> tuple[bool, Optional[int]]:
+    """残高が amount 以上のときだけ引き落とす。(成功したか, 残高) を返す
+
+    成功時は1回の find_one_and_update で引き落とし後の残高を返す。
+    失敗時の残高は現在の残高で、未登録なら None。
+    """
+    balance = None
+    user_cache.begin_write(user_id)
+    try:
+        doc = users_collection.find_one_and_update(
+            {"user_id": user_id, "balance": {"$gte": amount}},
+            {"$inc": {"balance": -amount}},
+            projection={"balance": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if doc:
+            balance = doc["balance"]
+    finally:
+        user_cache.end_write(user_id, balance)
+    if balance is not None:
+        return True, balance
+    return False, get_user_balance(user_id)
+
+
+def credit_balance(user_id: int, amount: int) -> int:
+    """払い戻しを加算し、加算後の残高を返す"""
+    balance = None
+    user_cache.begin_write(user_id)
+    try:
+        doc = users_collection.find_one_and_update(
+            {"user_id": user_id},
+            {"$inc": {"balance": amount}},
+            projection={"balance": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        balance = doc["balance"]
+    finally:
+        user_cache.end_write(user_id, balance)
+    return balance
 
 def get_user_streaks(user_id: int, game_type: str) -> tuple[int, int]:
     """ゲームタイプごとのユーザーの連勝・連敗記録を取得"""
-    user = users_collection.find_one({"user_id": user_id}, {"streaks": 1})
+    user = get_user(user_id)
     
     if not user or "streaks" not in user:
         return 0, 0
@@ -95,35 +173,43 @@ def get_user_streaks(user_id: int, game_type: str) -> tuple[int, int]:
 
 def register_user(user_id: int, sender_external_id: str) -> None:
     """新規ユーザーを登録"""
-    users_collection.update_one(
-        {"user_id": user_id},
-        {"$set": {
-            "sender_external_id": sender_external_id,
-            "balance": 0
-        }},
-        upsert=True
-    )
+    user_cache.begin_write(user_id)
+    try:
+        users_collection.update_one(
+            {"user_id": user_id},
+            {"$set": {
+                "sender_external_id": sender_external_id,
+                "balance": 0
+            }},
+            upsert=True
+        )
+    finally:
+        user_cache.end_write(user_id)
 
 def get_user_transactions(
     user_id: int,
     game_type: Optional[str] = None,
     days: Optional[int] = None
 ) -> list[dict[str, Any]]:
-    doc = financial_transactions_collection.find_one({"user_id": user_id})
-
-    if not doc or "transactions" not in doc:
-        return []
-
-    transactions = doc["transactions"]
+    since = datetime.datetime.now() - timedelta(days=days) if days else None
+    return get_user_transactions_range(
+        user_id,
+        types=[game_type] if game_type else None,
+        since=since
+    )
 
-    if game_type:
-        transactions = [t for t in transactions if t.get("type") == game_type]
 
-    if days:
-        threshold = datetime.datetime.now() - timedelta(days=days)
-        transactions = [t for t in transactions if t.get("timestamp") and t["timestamp"] >= threshold]
+def get_user_transactions_range(
+    user_id: int,
+    types: Optional[Iterable[str]] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None
+) -> list[dict[str, Any]]:
+    """[since, until) のトランザクションを種類で絞り込んで古い順に取得"""
+    return transactions.find_transactions(transaction_buckets_collection, user_id, types, since, until)
 
-    return transactions
+def push_financial_transaction(user_id: int, transaction: dict[str, Any]) -> None:
+    transactions.push_transaction(transaction_buckets_collection, user_id, transaction)
 
 async def save_account_panel_message_id(message_id: int) -> None:
     bot_state_collection.update_one(
@@ -137,6 +223,32 @@ async def get_account_panel_message_id() -> Optional[int]:
     doc = bot_state_collection.find_one({"_id": "account_panel"})
     return doc["message_id"] if doc and "message_id" in doc else None
 
+def get_media_records() -> dict[str, dict[str, Any]]:
+    doc = bot_state_collection.find_one({"_id": "media_registry"})
+    return doc.get("items", {}) if doc else {}
+
+def save_media_record(name: str, record: dict[str, Any]) -> None:
+    bot_state_collection.update_one(
+        {"_id": "media_registry"},
+        {"$set": {f"items.{name}": record}},
+        upsert=True
+    )
+
+def delete_media_record(name: str) -> None:
+    bot_state_collection.update_one({"_id": "media_registry"}, {"$unset": {f"items.{name}": ""}})
+
+def get_live_sessions() -> list[dict[str, Any]]:
+    return list(live_sessions_collection.find({}))
+
+def save_live_sessions(docs: list[dict[str, Any]]) -> None:
+    """セッションを1件1ドキュメント（_id はセッションID）で上書き保存する"""
+    if docs:
+        live_sessions_collection.bulk_write([ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs], ordered=False)
+
+def delete_live_sessions(session_ids: list[str]) -> None:
+    if session_ids:
+        live_sessions_collection.delete_many({"_id": {"$in": session_ids}})
+
 def get_all_user_balances() -> list[tuple[int, int]]:
     """全ユーザーのuser_idと残高を取得する"""
     cursor = users_collection.find({}, {"user_id": 1, "balance": 1})
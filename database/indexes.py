@@ -0,0 +1,185 @@
+"""コレクションごとのインデックス定義と、クエリ形状の監査。
+
+INDEX_SPECS は起動時に ensure_indexes() で作成される（既存なら何もしない）。
+QUERY_SHAPES はコードが実際に発行するクエリの形で、audit_query_shapes() が
+それぞれ explain してコレクションスキャンになるものを報告する。
+
+    python -m database.indexes ensure
+    python -m database.indexes audit
+"""
+import argparse
+import datetime
+from typing import Any, NamedTuple, Optional
+
+from pymongo import ASCENDING
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+
+import config
+from database.transactions import BUCKET_INDEXES, build_history_pipeline
+
+IndexSpec = tuple[list[tuple[str, int]], dict[str, Any]]
+
+INDEX_SPECS: dict[str, list[IndexSpec]] = {
+    config.USERS_COLLECTION: [
+        ([("user_id", ASCENDING)], {"name": "user_id_unique", "unique": True}),
+    ],
+    "pf_params": [
+        ([("user_id", ASCENDING)], {"name": "user_id_unique", "unique": True}),
+    ],
+    "active_users": [
+        ([("user_id", ASCENDING)], {"name": "user_id_unique", "unique": True}),
+    ],
+    "casino_tables": [
+        ([("channel_id", ASCENDING)], {"name": "channel_id_unique", "unique": True}),
+    ],
+    config.FINANCIAL_TRANSACTIONS_COLLECTION: [
+        ([("user_id", ASCENDING)], {"name": "user_id_unique", "unique": True}),
+    ],
+    config.TRANSACTION_BUCKETS_COLLECTION: BUCKET_INDEXES,
+}
+
+
+class QueryShape(NamedTuple):
+    name: str
+    collection: str
+    filter: Optional[dict[str, Any]] = None
+    pipeline: Optional[list[dict[str, Any]]] = None
+
+
+def _query_shapes() -> list[QueryShape]:
+    since = datetime.datetime.now() - datetime.timedelta(days=7)
+    return [
+        QueryShape("users.by_user_id", config.USERS_COLLECTION, filter={"user_id": 0}),
+        QueryShape(
+            "users.debit_if_enough", config.USERS_COLLECTION,
+            filter={"user_id": 0, "balance": {"$gte": 0}}
+        ),
+        QueryShape("pf_params.by_user_id", "pf_params", filter={"user_id": 0}),
+        QueryShape("active_users.by_user_id", "active_users", filter={"user_id": 0}),
+        QueryShape("casino_tables.by_channel_id", "casino_tables", filter={"channel_id": 0}),
+        QueryShape("bot_state.by_id", config.BOT_STATE_COLLECTION, filter={"_id": "account_panel"}),
+        QueryShape(
+            "transaction_buckets.push", config.TRANSACTION_BUCKETS_COLLECTION,
+            filter={"user_id": 0, "day": since, "count": {"$lt": config.TRANSACTION_BUCKET_SIZE}}
+        ),
+        QueryShape(
+            "transaction_buckets.history", config.TRANSACTION_BUCKETS_COLLECTION,
+            pipeline=build_history_pipeline(0, ["payin"], since=since)
+        ),
+    ]
+
+
+QUERY_SHAPES: list[QueryShape] = _query_shapes()
+
+
+def ensure_indexes(database: Database) -> list[str]:
+    """INDEX_SPECS のインデックスを作成し、失敗したものの説明を返す"""
+    failures = []
+    for collection_name, specs in INDEX_SPECS.items():
+        collection = database[collection_name]
+        for keys, options in specs:
+            try:
+                collection.create_index(keys, **options)
+            except PyMongoError as e:
+                message = f"{collection_name}.{options.get('name')}: {e}"
+                print(f"[WARN] インデックス作成に失敗しました: {message}")
+                failures.append(message)
+    return failures
+
+
+def _plan_stages(node: Any) -> list[str]:
+    """explain 結果に含まれる全ての winningPlan のステージ名を集める"""
+    stages = []
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "stage" and isinstance(value, str):
+                stages.append(value)
+            else:
+                stages.extend(_plan_stages(value))
+    elif isinstance(node, list):
+        for item in node:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def _winning_plans(node: Any) -> list[Any]:
+    plans = []
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "winningPlan":
+                plans.append(value)
+            else:
+                plans.extend(_winning_plans(value))
+    elif isinstance(node, list):
+        for item in node:
+            plans.extend(_winning_plans(item))
+    return plans
+
+
+def explain_shape(database: Database, shape: QueryShape) -> dict[str, Any]:
+    if shape.pipeline is not None:
+        return database.command("aggregate", shape.collection, pipeline=shape.pipeline, explain=True)
+    return database[shape.collection].find(shape.filter or {}).explain()
+
+
+def audit_query_shapes(database: Database) -> list[dict[str, Any]]:
+    """各クエリ形状を explain し、{name, collection, stages, collscan, error} のリストを返す"""
+    report = []
+    for shape in QUERY_SHAPES:
+        entry: dict[str, Any] = {
+            "name": shape.name,
+            "collection": shape.collection,
+            "stages": [],
+            "collscan": False,
+            "error": None,
+        }
+        try:
+            explained = explain_shape(database, shape)
+            stages = []
+            for plan in _winning_plans(explained):
+                stages.extend(_plan_stages(plan))
+            entry["stages"] = stages
+            entry["collscan"] = "COLLSCAN" in stages
+        except PyMongoError as e:
+            entry["error"] = str(e)
+        report.append(entry)
+    return report
+
+
+def format_audit_report(report: list[dict[str, Any]]) -> str:
+    lines = []
+    for entry in report:
+        if entry["error"]:
+            status = "ERROR"
+            detail = entry["error"]
+        elif entry["collscan"]:
+            status = "COLLSCAN"
+            detail = " > ".join(entry["stages"])
+        else:
+            status = "OK"
+            detail = " > ".join(entry["stages"])
+        lines.append(f"[{status}] {entry['name']} ({detail})")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    from database.db import get_database
+
+    parser = argparse.ArgumentParser(description="インデックスの作成と監査")
+    parser.add_argument("command", choices=["ensure", "audit"])
+    args = parser.parse_args()
+
+    database = get_database()
+    if args.command == "ensure":
+        failures = ensure_indexes(database)
+        print("[✓] インデックスを作成しました" if not failures else f"[WARN] {len(failures)}件失敗しました")
+    else:
+        report = audit_query_shapes(database)
+        print(format_audit_report(report))
+        if any(entry["collscan"] for entry in report):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
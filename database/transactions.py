@@ -0,0 +1,206 @@
+"""トランザクション履歴のバケット形式。
+
+ユーザー×日ごとに最大 TRANSACTION_BUCKET_SIZE 件を1ドキュメントにまとめる。
+満杯になると同じ日の新しいバケットが作られるので、ドキュメントは一定サイズで止まる。
+
+    {
+        "user_id": int,
+        "day": datetime,          # その日の 0:00
+        "count": int,
+        "start": datetime,        # バケット内の最古の timestamp
+        "end": datetime,          # バケット内の最新の timestamp
+        "types": [str, ...],
+        "transactions": [{"type", "amount", "net_amount", "timestamp"}, ...]
+    }
+
+履歴の検索は集計パイプラインでサーバー側に絞り込ませ、期間に重なるバケットだけを読む。
+
+旧形式（ユーザーごとに1つの配列）からの移行:
+    python -m database.transactions migrate [--batch-size 100] [--dry-run]
+"""
+import argparse
+import datetime
+from typing import Any, Iterable, Iterator, Optional
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.collection import Collection
+
+import config
+
+BUCKET_INDEXES: list[tuple[list[tuple[str, int]], dict[str, Any]]] = [
+    ([("user_id", ASCENDING), ("day", ASCENDING)], {"name": "user_day"}),
+    ([("user_id", ASCENDING), ("types", ASCENDING), ("end", ASCENDING)], {"name": "user_types_end"}),
+]
+
+
+def bucket_day(timestamp: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    if timestamp is None:
+        return None
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def build_bucket_push(user_id: int, transaction: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    """空きのあるバケットに1件追加する (filter, update) を返す。upsert=True で使う"""
+    timestamp = transaction.get("timestamp")
+    query = {
+        "user_id": user_id,
+        "day": bucket_day(timestamp),
+        "count": {"$lt": config.TRANSACTION_BUCKET_SIZE},
+    }
+    update = {
+        "$push": {"transactions": transaction},
+        "$inc": {"count": 1},
+        "$min": {"start": timestamp},
+        "$max": {"end": timestamp},
+        "$addToSet": {"types": transaction.get("type")},
+    }
+    return query, update
+
+
+def build_history_pipeline(
+    user_id: int,
+    types: Optional[Iterable[str]] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None
+) -> list[dict[str, Any]]:
+    """期間・種類で絞り込んだトランザクションを古い順に返す集計パイプライン"""
+    bucket_match: dict[str, Any] = {"user_id": user_id}
+    tx_match: dict[str, Any] = {}
+
+    if types:
+        types = list(types)
+        bucket_match["types"] = {"$in": types}
+        tx_match["type"] = {"$in": types}
+
+    time_range: dict[str, Any] = {}
+    if since is not None:
+        bucket_match["end"] = {"$gte": since}
+        time_range["$gte"] = since
+    if until is not None:
+        bucket_match["start"] = {"$lt": until}
+        time_range["$lt"] = until
+    if time_range:
+        tx_match["timestamp"] = time_range
+
+    pipeline: list[dict[str, Any]] = [
+        {"$match": bucket_match},
+        {"$sort": {"day": 1, "start": 1}},
+        {"$unwind": "$transactions"},
+        {"$replaceRoot": {"newRoot": "$transactions"}},
+    ]
+    if tx_match:
+        pipeline.append({"$match": tx_match})
+    return pipeline
+
+
+def push_transaction(buckets: Collection, user_id: int, transaction: dict[str, Any]) -> None:
+    query, update = build_bucket_push(user_id, transaction)
+    buckets.update_one(query, update, upsert=True)
+
+
+def find_transactions(
+    buckets: Collection,
+    user_id: int,
+    types: Optional[Iterable[str]] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None
+) -> list[dict[str, Any]]:
+    return list(buckets.aggregate(build_history_pipeline(user_id, types, since, until)))
+
+
+def ensure_bucket_indexes(buckets: Collection) -> None:
+    for keys, options in BUCKET_INDEXES:
+        buckets.create_index(keys, **options)
+
+
+def split_into_buckets(user_id: int, transactions: list[dict[str, Any]]) -> Iterator[dict[str, Any]]:
+    """旧形式の配列をバケットドキュメントに分割する。
+
+    _id は (user_id, 日, 連番) から決まるので、移行を再実行しても重複しない。
+    """
+    by_day: dict[Optional[datetime.datetime], list[dict[str, Any]]] = {}
+    for tx in transactions:
+        by_day.setdefault(bucket_day(tx.get("timestamp")), []).append(tx)
+
+    size = config.TRANSACTION_BUCKET_SIZE
+    for day, day_txs in by_day.items():
+        day_key = day.strftime("%Y%m%d") if day else "none"
+        for seq, offset in enumerate(range(0, len(day_txs), size)):
+            chunk = day_txs[offset:offset + size]
+            stamps = [tx["timestamp"] for tx in chunk if tx.get("timestamp")]
+            yield {
+                "_id": f"m:{user_id}:{day_key}:{seq}",
+                "user_id": user_id,
+                "day": day,
+                "count": len(chunk),
+                "start": min(stamps) if stamps else None,
+                "end": max(stamps) if stamps else None,
+                "types": sorted({tx.get("type") for tx in chunk}),
+                "transactions": chunk,
+            }
+
+
+def migrate_legacy_transactions(
+    legacy: Collection,
+    buckets: Collection,
+    batch_size: int = 100,
+    dry_run: bool = False
+) -> tuple[int, int]:
+    """旧形式のドキュメントをカーソルで順に読み、バケットへ書き出す。
+
+    1ユーザーずつ処理するのでメモリ使用量は最大ドキュメント1件分で済む。
+    移行済みのドキュメントには bucketed_at を付け、再実行時は読み飛ばす。
+    バケットは無いときだけ作る ($setOnInsert) ので、bucketed_at を付ける前に中断して再実行しても、
+    その間に build_bucket_push で追記されたトランザクションを上書きしない。
+    戻り値は (移行したユーザー数, 書き出したバケット数)。
+    """
+    users = 0
+    written = 0
+    cursor = legacy.find(
+        {"transactions": {"$exists": True}, "bucketed_at": {"$exists": False}},
+        batch_size=batch_size
+    )
+    for doc in cursor:
+        requests = [
+            UpdateOne(
+                {"_id": bucket.pop("_id")},
+                {"$setOnInsert": bucket},
+                upsert=True
+            )
+            for bucket in split_into_buckets(doc["user_id"], doc.get("transactions", []))
+        ]
+        if not dry_run:
+            if requests:
+                buckets.bulk_write(requests, ordered=False)
+            legacy.update_one({"_id": doc["_id"]}, {"$set": {"bucketed_at": datetime.datetime.now()}})
+        users += 1
+        written += len(requests)
+        if users % batch_size == 0:
+            print(f"[LOG] トランザクション移行中: {users}ユーザー / {written}バケット")
+    return users, written
+
+
+def main() -> None:
+    from database.db import financial_transactions_collection, transaction_buckets_collection
+
+    parser = argparse.ArgumentParser(description="トランザクション履歴のバケット形式ツール")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="旧形式の配列ドキュメントをバケットへ移行")
+    migrate.add_argument("--batch-size", type=int, default=100)
+    migrate.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        ensure_bucket_indexes(transaction_buckets_collection)
+        users, written = migrate_legacy_transactions(
+            financial_transactions_collection,
+            transaction_buckets_collection,
+            batch_size=args.batch_size,
+            dry_run=args.dry_run
+        )
+        suffix = "（dry-run）" if args.dry_run else ""
+        print(f"[✓] 移行完了{suffix}: {users}ユーザー / {written}バケット")
+
+
+if __name__ == "__main__":
+    main()
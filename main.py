@@ -1,14 +1,26 @@
 import asyncio
 import random
+import signal
+import time
 
 from discord import app_commands
 from discord.ext import commands
 from matplotlib import font_manager as fm
 
 from bot import bot
-from commands import register_all_text_commands
+from commands import in_flight, register_all_text_commands, start_draining
+from commands.admin import setup_admin_commands
 from commands.table_management import setup_table_commands
 import config
+from database import async_db, db
+from database.db import get_database
+from database.indexes import ensure_indexes
+from ui.assets import preload_assets
+from ui.components import active_sessions
+from ui.dice_composites import build_dice_composites
+from ui.media import media_registry
+from ui.render import render_service
+from ui.sessions import session_store
 from utils.account_panel import setup_account_panel
 
 async def keep_alive() -> None:
@@ -24,21 +36,80 @@ async def on_ready() -> None:
     print("[DEBUG] on_ready 実行開始")
     
     await setup_table_commands(bot)
+    await setup_admin_commands(bot)
     
     await bot.tree.sync()
     print(f"[✓] ログインに成功しました [{bot.user}]")
 
     await setup_account_panel()
+    media_registry.start()
+    session_store.start()
+
+def _busy() -> int:
+    return in_flight() + active_sessions() + render_service.pending
+
+
+async def wait_idle(timeout: float) -> bool:
+    """処理中のコマンド・ボタン操作・描画が無くなるまで待つ。期限までに終われば True"""
+    deadline = time.monotonic() + timeout
+    while _busy():
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(0.1)
+    return True
+
+async def shutdown() -> None:
+    """新しいコマンドとボタン操作を止め、処理中の操作を待ってから保存し、接続を閉じる"""
+    print("[LOG] 終了処理を開始します（新しいコマンドとボタン操作の受付を停止しました）")
+    start_draining()
+    if not await wait_idle(config.SHUTDOWN_DRAIN_SECONDS):
+        print(f"[WARN] {config.SHUTDOWN_DRAIN_SECONDS}秒待っても処理中の操作が残っています（{_busy()}件）。このまま終了します")
+
+    # 保存した後に届いた操作で清算されると、再起動後に同じセッションが戻ってしまう。先にゲートウェイを閉じる
+    await bot.close()
+    try:
+        await session_store.stop()
+    except Exception as e:
+        print(f"[ERROR] セッションを保存できません: {e}")
+    await media_registry.stop()
+    await asyncio.to_thread(render_service.shutdown)
+    await asyncio.to_thread(async_db.close)
+    db.close()
+    print("[✓] 終了処理が完了しました")
 
 async def main() -> None:
     asyncio.create_task(keep_alive())
+
+    await async_db.run_sync(ensure_indexes, get_database())
+    await asyncio.to_thread(preload_assets)
+    await asyncio.to_thread(build_dice_composites)
     
     await register_all_text_commands(bot)
+
+    restored = await session_store.load()
+    if restored:
+        print(f"[✓] 進行中のゲームを{restored}件復元しました")
     
     if not config.TOKEN:
         raise ValueError("DISCORD_BOT_TOKEN が設定されていません")
     
-    await bot.start(config.TOKEN)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows ではシグナルハンドラを登録できない。Ctrl+C は KeyboardInterrupt のまま
+            pass
+
+    bot_task = asyncio.create_task(bot.start(config.TOKEN))
+    stop_task = asyncio.create_task(stop.wait())
+    try:
+        await asyncio.wait({bot_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stop_task.cancel()
+        await shutdown()
+    await bot_task
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,150 @@
+"""描画用アセットのレジストリ。
+
+画像とフォントは最初の1回だけ読み込み、デコード・変換・リサイズ済みの状態で保持する。
+描画処理はここからコピーまたは貼り付けるだけで、ファイルを開き直さない。
+起動時に preload_assets() を呼んでおけば最初のゲームでも読み込み待ちが発生しない。
+"""
+import os
+import threading
+from functools import partial
+from typing import Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+import config
+from ui.atlas import SpriteAtlas, SpriteSource, load_atlas
+
+CARD_PATH = "assets/bj/cards/"
+TABLE_IMAGE_PATH = "assets/bj/table.png"
+DEALER_PATH = "assets/bj/dealer/"
+FONT_PATH = "assets/font/NotoSansJP-VariableFont_wght.ttf"
+
+CARD_SIZE = (140, 200)
+ICON_SIZE = (120, 120)
+CARD_SHADOW_COLOR = (0, 0, 0, 100)
+
+RPS_PATH = "assets/rps/"
+RPS_CARD_WIDTH = 120
+RPS_HAND_WIDTH = int(RPS_CARD_WIDTH * 0.89)
+RPS_THUMB_SIZE = (40, 40)
+RPS_HANDS = ["rock", "scissors", "paper"]
+
+SUITS = ["S", "H", "D", "C"]
+RANKS = ["A"] + [str(n) for n in range(2, 11)] + ["J", "Q", "K"]
+
+
+def crop_circle(im: Image.Image) -> Image.Image:
+    mask = Image.new("L", im.size, 0)
+    draw = ImageDraw.Draw(mask)
+    draw.ellipse((0, 0, im.size[0], im.size[1]), fill=255)
+    result = Image.new("RGBA", im.size)
+    result.paste(im, (0, 0), mask)
+    return result
+
+
+def load_font(size: int) -> ImageFont.FreeTypeFont:
+    try:
+        return ImageFont.truetype(FONT_PATH, size)
+    except OSError:
+        print(f"[WARN] フォント {FONT_PATH} を読み込めません。デフォルトフォントを使用します。")
+        return ImageFont.load_default(size)
+
+
+def _load_rgba(path: str, size: Optional[tuple[int, int]] = None) -> Image.Image:
+    with Image.open(path) as im:
+        image = im.convert("RGBA")
+    if size is not None:
+        image = image.resize(size)
+    return image
+
+
+class BlackjackAssets:
+    """ブラックジャックの描画に使うアセット一式"""
+
+    def __init__(self):
+        self.table = _load_rgba(TABLE_IMAGE_PATH)
+        self.cards = {
+            f"{rank}{suit}": _load_rgba(f"{CARD_PATH}{rank}{suit}.png", CARD_SIZE)
+            for suit in SUITS for rank in RANKS
+        }
+        self.back = _load_rgba(f"{CARD_PATH}back.png", CARD_SIZE)
+        self.card_shadow = Image.new("RGBA", CARD_SIZE, CARD_SHADOW_COLOR)
+
+        self.dealer_files = sorted(f for f in os.listdir(DEALER_PATH) if f.endswith(".png"))
+        self.dealer_icons = {
+            dealer_file: crop_circle(_load_rgba(f"{DEALER_PATH}{dealer_file}", ICON_SIZE))
+            for dealer_file in self.dealer_files
+        }
+
+        self.score_font = load_font(40)
+        self.icon_font = load_font(36)
+
+
+def resize_by_width(image: Image.Image, target_width: int) -> Image.Image:
+    w, h = image.size
+    aspect_ratio = h / w
+    new_height = int(target_width * aspect_ratio)
+    return image.resize((target_width, new_height))
+
+
+def resize_keep_aspect(image: Image.Image, target_width: int) -> Image.Image:
+    w, h = image.size
+    scale = target_width / w
+    return image.resize((int(w * scale), int(h * scale)))
+
+
+def _rps_sprite_sources() -> dict[str, SpriteSource]:
+    """card_back, {hand}.{1|2}（中央の手）, {hand}.{1|2}.thumb（履歴）"""
+    sources = {
+        "card_back": SpriteSource(
+            f"{RPS_PATH}slot_back.png", partial(resize_by_width, target_width=RPS_CARD_WIDTH), f"w{RPS_CARD_WIDTH}"
+        ),
+    }
+    for hand in RPS_HANDS:
+        for side in (1, 2):
+            sources[f"{hand}.{side}"] = SpriteSource(
+                f"{RPS_PATH}{hand}.{side}.png", partial(resize_keep_aspect, target_width=RPS_HAND_WIDTH), f"w{RPS_HAND_WIDTH}"
+            )
+            sources[f"{hand}.{side}.thumb"] = SpriteSource(
+                f"{RPS_PATH}{hand}.{side}.thumb.png",
+                lambda image: image.resize(RPS_THUMB_SIZE),
+                f"{RPS_THUMB_SIZE[0]}x{RPS_THUMB_SIZE[1]}"
+            )
+    return sources
+
+
+class RPSAssets:
+    """じゃんけんの描画に使うアセット一式。スプライトは全てアトラスから切り出す"""
+
+    def __init__(self):
+        self.atlas: SpriteAtlas = load_atlas("rps", _rps_sprite_sources(), config.ASSET_CACHE_DIR)
+        self.font = load_font(20)
+
+
+_blackjack_assets: Optional[BlackjackAssets] = None
+_rps_assets: Optional[RPSAssets] = None
+_lock = threading.Lock()
+
+
+def get_blackjack_assets() -> BlackjackAssets:
+    global _blackjack_assets
+    if _blackjack_assets is None:
+        with _lock:
+            if _blackjack_assets is None:
+                _blackjack_assets = BlackjackAssets()
+    return _blackjack_assets
+
+
+def get_rps_assets() -> RPSAssets:
+    global _rps_assets
+    if _rps_assets is None:
+        with _lock:
+            if _rps_assets is None:
+                _rps_assets = RPSAssets()
+    return _rps_assets
+
+
+def preload_assets() -> None:
+    """全アセットを読み込む（起動時に呼ぶ）"""
+    get_blackjack_assets()
+    get_rps_assets()
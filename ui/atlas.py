@@ -0,0 +1,126 @@
+"""スプライトアトラス。
+
+最終サイズに縮小済みの小さな画像を1枚のシートに詰め、各スプライトの位置と一緒に
+ディスクへ保存する。元ファイルのパス・サイズ・更新時刻と縮小サイズから作った
+フィンガープリントが一致すればシートを読むだけで済み、アセットが変わると作り直す。
+"""
+import hashlib
+import json
+import os
+from typing import Callable, Optional
+
+from PIL import Image
+
+ATLAS_VERSION = 1
+ATLAS_MAX_WIDTH = 1024
+ATLAS_PADDING = 2
+
+Rect = tuple[int, int, int, int]
+
+
+class SpriteSource:
+    """path の画像を transform で最終サイズにしたものをスプライトにする"""
+
+    def __init__(self, path: str, transform: Callable[[Image.Image], Image.Image], size_key: str):
+        self.path = path
+        self.transform = transform
+        # フィンガープリントに含める縮小サイズの表現（サイズ変更時に作り直すため）
+        self.size_key = size_key
+
+    def load(self) -> Image.Image:
+        with Image.open(self.path) as im:
+            image = im.convert("RGBA")
+        return self.transform(image)
+
+
+def fingerprint(sources: dict[str, SpriteSource]) -> str:
+    digest = hashlib.sha256(f"v{ATLAS_VERSION}".encode())
+    for name in sorted(sources):
+        source = sources[name]
+        st = os.stat(source.path)
+        digest.update(f"{name}|{source.path}|{st.st_size}|{st.st_mtime_ns}|{source.size_key}\n".encode())
+    return digest.hexdigest()
+
+
+def pack(sprites: dict[str, Image.Image], max_width: int = ATLAS_MAX_WIDTH) -> tuple[Image.Image, dict[str, Rect]]:
+    """高さ順に棚詰めし、シート画像と {名前: (x, y, w, h)} を返す"""
+    rects: dict[str, Rect] = {}
+    x = y = shelf_height = 0
+    sheet_width = 0
+    for name in sorted(sprites, key=lambda n: (-sprites[n].height, n)):
+        w, h = sprites[name].size
+        if x > 0 and x + w > max_width:
+            x = 0
+            y += shelf_height + ATLAS_PADDING
+            shelf_height = 0
+        rects[name] = (x, y, w, h)
+        x += w + ATLAS_PADDING
+        shelf_height = max(shelf_height, h)
+        sheet_width = max(sheet_width, x)
+
+    sheet = Image.new("RGBA", (max(sheet_width, 1), max(y + shelf_height, 1)), (0, 0, 0, 0))
+    for name, (rx, ry, _, _) in rects.items():
+        sheet.paste(sprites[name], (rx, ry))
+    return sheet, rects
+
+
+class SpriteAtlas:
+    def __init__(self, sheet: Image.Image, rects: dict[str, Rect]):
+        self.sheet = sheet
+        self.rects = rects
+        self.sprites = {
+            name: sheet.crop((x, y, x + w, y + h))
+            for name, (x, y, w, h) in rects.items()
+        }
+
+    def __getitem__(self, name: str) -> Image.Image:
+        return self.sprites[name]
+
+
+def _read_cached(sheet_path: str, meta_path: str, expected: str) -> Optional[SpriteAtlas]:
+    if not (os.path.exists(sheet_path) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("fingerprint") != expected:
+            return None
+        with Image.open(sheet_path) as im:
+            sheet = im.convert("RGBA")
+        rects = {name: tuple(rect) for name, rect in meta["rects"].items()}
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[WARN] アトラスのキャッシュを読めません。再生成します: {e}")
+        return None
+    return SpriteAtlas(sheet, rects)
+
+
+def _write_cached(sheet_path: str, meta_path: str, sheet: Image.Image, rects: dict[str, Rect], fp: str) -> None:
+    try:
+        os.makedirs(os.path.dirname(sheet_path) or ".", exist_ok=True)
+        # 別プロセスが同時に作っても壊れたファイルを読まないよう、一時ファイルから置き換える
+        suffix = f".{os.getpid()}.tmp"
+        sheet.save(sheet_path + suffix, format="PNG")
+        with open(meta_path + suffix, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fp, "rects": rects}, f)
+        os.replace(sheet_path + suffix, sheet_path)
+        os.replace(meta_path + suffix, meta_path)
+    except OSError as e:
+        print(f"[WARN] アトラスのキャッシュ保存に失敗しました: {e}")
+
+
+def load_atlas(name: str, sources: dict[str, SpriteSource], cache_dir: Optional[str]) -> SpriteAtlas:
+    """キャッシュが最新ならそれを読み、そうでなければ元画像から作って保存する"""
+    fp = fingerprint(sources)
+    sheet_path = os.path.join(cache_dir, f"{name}.png") if cache_dir else None
+    meta_path = os.path.join(cache_dir, f"{name}.json") if cache_dir else None
+
+    if sheet_path and meta_path:
+        cached = _read_cached(sheet_path, meta_path, fp)
+        if cached is not None:
+            return cached
+
+    sheet, rects = pack({sprite: source.load() for sprite, source in sources.items()})
+    if sheet_path and meta_path:
+        _write_cached(sheet_path, meta_path, sheet, rects, fp)
+        print(f"[LOG] アトラス {name} を生成しました ({sheet.width}x{sheet.height}, {len(rects)}枚)")
+    return SpriteAtlas(sheet, rects)
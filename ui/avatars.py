@@ -0,0 +1,160 @@
+"""ゲーム画像に貼るアバターのキャッシュ。
+
+アバターのハッシュ（display_avatar.key）とサイズをキーに、円形に切り抜いて
+リサイズ済みの画像を保持する。メモリ上はLRUで AVATAR_CACHE_SIZE 件まで、
+AVATAR_CACHE_DIR が設定されていればディスクにも保存し、再起動後はそこから読む。
+ダウンロードは Bot が持つ共有 HTTP セッションで、必要なサイズだけを取得する。
+"""
+import asyncio
+import os
+from collections import OrderedDict
+from io import BytesIO
+from typing import Optional
+
+import aiohttp
+import discord
+from PIL import Image
+
+import config
+from bot import bot
+from ui.assets import crop_circle
+
+PLACEHOLDER_COLOR = (80, 80, 90, 255)
+
+
+def _fetch_size(size: int) -> int:
+    """Discord CDN が受け付ける2の累乗のうち size 以上の最小値"""
+    fetch = 16
+    while fetch < size and fetch < 4096:
+        fetch *= 2
+    return fetch
+
+
+def _decode_avatar(data: bytes, size: int) -> Image.Image:
+    with Image.open(BytesIO(data)) as im:
+        image = im.convert("RGBA")
+    return crop_circle(image.resize((size, size)))
+
+
+class AvatarCache:
+    def __init__(self, max_entries: int, disk_dir: Optional[str]):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir or None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._images: OrderedDict[tuple[str, int], Image.Image] = OrderedDict()
+        self._inflight: dict[tuple[str, int], asyncio.Future] = {}
+        self._placeholders: dict[int, Image.Image] = {}
+
+    def placeholder(self, size: int) -> Image.Image:
+        image = self._placeholders.get(size)
+        if image is None:
+            image = crop_circle(Image.new("RGBA", (size, size), PLACEHOLDER_COLOR))
+            self._placeholders[size] = image
+        return image
+
+    def is_placeholder(self, image: Image.Image) -> bool:
+        """取得に失敗したときの代わりの画像か（これを含む描画結果は保存しない）"""
+        return self._placeholders.get(image.width) is image
+
+    def _disk_path(self, key: tuple[str, int]) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        avatar_key, size = key
+        return os.path.join(self.disk_dir, f"{avatar_key}_{size}.png")
+
+    def _remember(self, key: tuple[str, int], image: Image.Image) -> None:
+        if self.max_entries <= 0:
+            return
+        self._images[key] = image
+        self._images.move_to_end(key)
+        while len(self._images) > self.max_entries:
+            self._images.popitem(last=False)
+
+    def _read_disk(self, key: tuple[str, int]) -> Optional[Image.Image]:
+        path = self._disk_path(key)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with Image.open(path) as im:
+                return im.convert("RGBA")
+        except OSError:
+            return None
+
+    def _write_disk(self, key: tuple[str, int], image: Image.Image) -> None:
+        path = self._disk_path(key)
+        if not path:
+            return
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            image.save(tmp_path, format="PNG")
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[WARN] アバターのディスクキャッシュ保存に失敗しました: {e}")
+
+    async def _load(self, asset: discord.Asset, key: tuple[str, int]) -> Optional[Image.Image]:
+        image = await asyncio.to_thread(self._read_disk, key)
+        if image is not None:
+            self.disk_hits += 1
+            return image
+
+        self.misses += 1
+        size = key[1]
+        url = asset.with_format("png").with_size(_fetch_size(size)).url
+        try:
+            async with bot.http_session.get(url) as resp:
+                resp.raise_for_status()
+                data = await resp.read()
+            image = await asyncio.to_thread(_decode_avatar, data, size)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            print(f"[WARN] アバターの取得に失敗しました: {e}")
+            return None
+
+        await asyncio.to_thread(self._write_disk, key, image)
+        return image
+
+    async def get(self, user: discord.abc.User, size: int) -> Image.Image:
+        """円形に切り抜いた size×size のアバター。返り値は共有されるので書き換えないこと"""
+        asset = user.display_avatar
+        key = (asset.key, size)
+
+        image = self._images.get(key)
+        if image is not None:
+            self._images.move_to_end(key)
+            self.hits += 1
+            return image
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            image = await self._load(asset, key)
+            if image is None:
+                image = self.placeholder(key[1])
+            else:
+                self._remember(key, image)
+            future.set_result(image)
+            return image
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # 待機者がいなくても警告を出さない
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._images),
+            "max_size": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+
+avatar_cache = AvatarCache(config.AVATAR_CACHE_SIZE, config.AVATAR_CACHE_DIR)
@@ -0,0 +1,193 @@
+"""ゲームのボタンを custom_id だけで処理するルーター。
+
+custom_id は "<ゲーム>:<セッションID>:<操作>[:<引数>]"（例: mines:1a2b3c4d5e6f:reveal:12）。
+全てのボタンを GameButton（DynamicItem）で作るので、discord.py はメッセージごとの View を
+保持せず、押されたときに custom_id から GameButton を作り直して dispatch する。
+操作ごとの処理は @route(ゲーム, 操作) で登録し、(interaction, session, 引数) で呼ばれる。
+
+同じセッションへの操作は、セッションごとのメールボックス（_Actor）に入れて1つずつ順に処理する。
+連打で同じ操作が処理中・待機中なら重ねて受け付けず、待っている間に応答期限が過ぎた操作や
+ゲームが終わった後の操作は捨てる。メールボックスは空になった時点で消えるので、
+放置されたゲームが何かを抱え続けることはなく、別のゲーム同士が待たされることもない。
+終了処理中（start_draining() の後）は新しい操作を受け付けない。セッションは保存されるので再起動後に続けられる。
+"""
+import re
+import time
+import traceback
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+import discord
+
+from ui.sessions import session_store
+
+CUSTOM_ID_PATTERN = r"(?P<game>[a-z]+):(?P<sid>[0-9a-f]+):(?P<action>[a-z_]+)(?::(?P<arg>-?\d+))?"
+
+EXPIRED_MESSAGE = "このゲームは終了しているか、見つかりません。"
+NOT_OWNER_MESSAGE = "このゲームはあなたのものではありません。"
+DRAINING_MESSAGE = "メンテナンスのため再起動しています。再起動後にもう一度ボタンを押してください。"
+
+# 待機できる操作の数（処理中のものを除く）
+MAILBOX_SIZE = 4
+# Discord への最初の応答は3秒以内。これを過ぎて順番が来た操作は応答できないので捨てる
+STALE_AFTER_SECONDS = 2.5
+
+Handler = Callable[[discord.Interaction, Any, Optional[int]], Awaitable[None]]
+_handlers: dict[tuple[str, str], Handler] = {}
+
+
+def route(game: str, action: str) -> Callable[[Handler], Handler]:
+    def decorator(handler: Handler) -> Handler:
+        _handlers[(game, action)] = handler
+        return handler
+    return decorator
+
+
+def make_custom_id(game: str, session_id: str, action: str, arg: Optional[int] = None) -> str:
+    custom_id = f"{game}:{session_id}:{action}"
+    return custom_id if arg is None else f"{custom_id}:{arg}"
+
+
+class GameButton(discord.ui.DynamicItem[discord.ui.Button], template=CUSTOM_ID_PATTERN):
+    def __init__(
+        self,
+        game: str,
+        session_id: str,
+        action: str,
+        arg: Optional[int] = None,
+        *,
+        style: discord.ButtonStyle = discord.ButtonStyle.secondary,
+        label: Optional[str] = None,
+        emoji=None,
+        disabled: bool = False,
+        row: Optional[int] = None,
+    ):
+        super().__init__(
+            discord.ui.Button(
+                style=style,
+                label=label,
+                emoji=emoji,
+                disabled=disabled,
+                row=row,
+                custom_id=make_custom_id(game, session_id, action, arg),
+            )
+        )
+        self.game = game
+        self.session_id = session_id
+        self.action = action
+        self.arg = arg
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match: re.Match[str]):
+        arg = match["arg"]
+        return cls(match["game"], match["sid"], match["action"], int(arg) if arg is not None else None)
+
+    async def callback(self, interaction: discord.Interaction) -> None:
+        await dispatch(interaction, self.game, self.session_id, self.action, self.arg)
+
+
+class _Actor:
+    """1つのセッションの操作を順に処理するメールボックス"""
+    __slots__ = ("mailbox", "current")
+
+    def __init__(self):
+        # (interaction, handler, 操作, 引数, 受け付けた時刻)
+        self.mailbox: deque[tuple[discord.Interaction, Handler, str, Optional[int], float]] = deque()
+        self.current: Optional[tuple[str, Optional[int]]] = None
+
+    def is_duplicate(self, action: str, arg: Optional[int]) -> bool:
+        op = (action, arg)
+        return op == self.current or any((a, g) == op for _, _, a, g, _ in self.mailbox)
+
+
+_actors: dict[tuple[str, str], _Actor] = {}
+actor_counters = {"processed": 0, "coalesced": 0, "stale": 0, "after_end": 0}
+_draining = False
+
+
+def start_draining() -> None:
+    """以後のボタン操作を断る（終了処理から呼ぶ）。処理中・待機中の操作はそのまま処理する"""
+    global _draining
+    _draining = True
+
+
+async def _acknowledge(interaction: discord.Interaction) -> None:
+    """何も変えずに応答だけ返す（クライアントに「インタラクションに失敗しました」を出さない）"""
+    try:
+        await interaction.response.defer()
+    except (discord.HTTPException, discord.InteractionResponded):
+        pass
+
+
+async def dispatch(interaction: discord.Interaction, game: str, session_id: str, action: str, arg: Optional[int]) -> None:
+    if _draining:
+        await interaction.response.send_message(DRAINING_MESSAGE, ephemeral=True)
+        return
+    handler = _handlers.get((game, action))
+    session = session_store.get(game, session_id) if handler is not None else None
+    if session is None:
+        await interaction.response.send_message(EXPIRED_MESSAGE, ephemeral=True)
+        return
+    if interaction.user.id != session.user_id:
+        await interaction.response.send_message(NOT_OWNER_MESSAGE, ephemeral=True)
+        return
+
+    key = (game, session_id)
+    actor = _actors.get(key)
+    if actor is not None:
+        # 処理中のものがいれば、その処理が順番にこの操作も実行する
+        if actor.is_duplicate(action, arg) or len(actor.mailbox) >= MAILBOX_SIZE:
+            actor_counters["coalesced"] += 1
+            await _acknowledge(interaction)
+            return
+        actor.mailbox.append((interaction, handler, action, arg, time.monotonic()))
+        return
+
+    actor = _actors[key] = _Actor()
+    actor.mailbox.append((interaction, handler, action, arg, time.monotonic()))
+    try:
+        await _drain(actor, game, session_id)
+    finally:
+        del _actors[key]
+
+
+async def _drain(actor: _Actor, game: str, session_id: str) -> None:
+    while actor.mailbox:
+        interaction, handler, action, arg, queued_at = actor.mailbox.popleft()
+        if time.monotonic() - queued_at > STALE_AFTER_SECONDS:
+            actor_counters["stale"] += 1
+            continue
+        session = session_store.get(game, session_id)
+        if session is None:
+            # 先に処理した操作でゲームが終わった。画面は更新済みなので黙って応答する
+            actor_counters["after_end"] += 1
+            await _acknowledge(interaction)
+            continue
+
+        actor.current = (action, arg)
+        try:
+            await handler(interaction, session, arg)
+        except Exception as e:
+            print(f"[ERROR] {game}:{action} の処理中に例外が発生しました: {e}")
+            traceback.print_exc()
+        finally:
+            actor.current = None
+            session_store.mark_changed(game, session_id)
+        actor_counters["processed"] += 1
+
+
+def active_sessions() -> int:
+    """操作を処理中のセッションの数"""
+    return len(_actors)
+
+
+def actor_stats() -> dict[str, int]:
+    return {"active": len(_actors), **actor_counters}
+
+
+def game_view(*buttons: GameButton) -> discord.ui.View:
+    """GameButton だけの View。discord.py は保持しない（全て DynamicItem のため）"""
+    view = discord.ui.View(timeout=None)
+    for button in buttons:
+        view.add_item(button)
+    return view
@@ -0,0 +1,117 @@
+"""2つのダイスを並べた合成画像（36通り）。
+
+出目の組み合わせは36通りしかないので、転がり中のGIFと結果のPNGを全て事前に作り、
+ASSET_CACHE_DIR/dice に保存しておく。元画像のフィンガープリントが変わったときだけ作り直す。
+ロール時はここのファイル（またはメディアレジストリに登録したURL）を1枚使うだけになる。
+"""
+import hashlib
+import json
+import os
+from typing import Optional
+
+from PIL import Image, ImageSequence
+
+import config
+
+DICE_FACES = range(1, 7)
+DICE_GAP = 40
+# 2つ目のダイスはアニメーションの位相をずらして、同じ動きに見えないようにする
+SECOND_DIE_FRAME_OFFSET = 7
+COMPOSITE_VERSION = 1
+
+COMPOSITE_DIR = os.path.join(config.ASSET_CACHE_DIR or "cache/assets", "dice")
+MANIFEST_PATH = os.path.join(COMPOSITE_DIR, "manifest.json")
+
+KIND_EXTENSIONS = {"roll": "gif", "result": "png"}
+
+
+def composite_name(kind: str, die1: int, die2: int) -> str:
+    """メディアレジストリでの名前（roll: 転がり中, result: 結果）"""
+    return f"dice/{kind}/{die1}{die2}"
+
+
+def composite_path(kind: str, die1: int, die2: int) -> str:
+    return os.path.join(COMPOSITE_DIR, f"{kind}_{die1}{die2}.{KIND_EXTENSIONS[kind]}")
+
+
+def _source_paths() -> list[str]:
+    return [f"{config.DICE_FOLDER}/{ext}/{face}.{ext}" for ext in ("gif", "png") for face in DICE_FACES]
+
+
+def _fingerprint() -> str:
+    digest = hashlib.sha256(f"v{COMPOSITE_VERSION}|{DICE_GAP}|{SECOND_DIE_FRAME_OFFSET}".encode())
+    for path in _source_paths():
+        st = os.stat(path)
+        digest.update(f"{path}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def _load_frames(path: str) -> tuple[list[Image.Image], list[int]]:
+    with Image.open(path) as im:
+        frames = []
+        durations = []
+        for frame in ImageSequence.Iterator(im):
+            frames.append(frame.convert("RGBA"))
+            durations.append(frame.info.get("duration", im.info.get("duration", 100)))
+    return frames, durations
+
+
+def _side_by_side(left: Image.Image, right: Image.Image) -> Image.Image:
+    canvas = Image.new("RGBA", (left.width + DICE_GAP + right.width, max(left.height, right.height)), (0, 0, 0, 0))
+    canvas.paste(left, (0, 0))
+    canvas.paste(right, (left.width + DICE_GAP, 0))
+    return canvas
+
+
+def _write_roll(path: str, first: tuple[list[Image.Image], list[int]], second: tuple[list[Image.Image], list[int]]) -> None:
+    first_frames, durations = first
+    second_frames, _ = second
+    frames = [
+        _side_by_side(frame, second_frames[(i + SECOND_DIE_FRAME_OFFSET) % len(second_frames)])
+        for i, frame in enumerate(first_frames)
+    ]
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    frames[0].save(
+        tmp_path, format="GIF", save_all=True, append_images=frames[1:],
+        duration=durations, loop=0, disposal=2
+    )
+    os.replace(tmp_path, path)
+
+
+def _write_result(path: str, first: Image.Image, second: Image.Image) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    _side_by_side(first, second).save(tmp_path, format="PNG")
+    os.replace(tmp_path, path)
+
+
+def _read_manifest() -> Optional[str]:
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            return json.load(f).get("fingerprint")
+    except (OSError, ValueError):
+        return None
+
+
+def build_dice_composites() -> None:
+    """36通りの合成画像を作る（最新なら何もしない）。起動時にスレッドで呼ぶ"""
+    fingerprint = _fingerprint()
+    if _read_manifest() == fingerprint and all(
+        os.path.exists(composite_path(kind, a, b)) for kind in KIND_EXTENSIONS for a in DICE_FACES for b in DICE_FACES
+    ):
+        return
+
+    os.makedirs(COMPOSITE_DIR, exist_ok=True)
+    rolls = {face: _load_frames(f"{config.DICE_FOLDER}/gif/{face}.gif") for face in DICE_FACES}
+    results = {}
+    for face in DICE_FACES:
+        with Image.open(f"{config.DICE_FOLDER}/png/{face}.png") as im:
+            results[face] = im.convert("RGBA")
+
+    for a in DICE_FACES:
+        for b in DICE_FACES:
+            _write_roll(composite_path("roll", a, b), rolls[a], rolls[b])
+            _write_result(composite_path("result", a, b), results[a], results[b])
+
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint}, f)
+    print(f"[LOG] ダイスの合成画像を生成しました ({COMPOSITE_DIR})")
@@ -0,0 +1,197 @@
+"""描画結果のエンコード。
+
+形式は png（圧縮レベル指定）、png8（パレット減色）、webp、jpeg から選べ、縮小率も指定できる。
+IMAGE_FORMAT=auto の場合は ENCODE_LADDER を上から順に使い、ゲームごとの予算
+（1枚あたりのバイト数とエンコード時間）を超えたら次のフレームから一段下げ、
+余裕が続けば一段戻す。バイト数の予算を超えたフレームはその場で下の段で作り直す。
+
+エンコードは描画ワーカーで行い、段の選択と統計はイベントループ側の ImageEncoder が持つ。
+"""
+import time
+from io import BytesIO
+from typing import Any, NamedTuple
+
+from PIL import Image
+
+import config
+
+FORMATS = ("png", "png8", "webp", "jpeg")
+EXTENSIONS = {"png": "png", "png8": "png", "webp": "webp", "jpeg": "jpg"}
+
+# 連続してこの回数だけ予算の半分以下なら一段上の画質を試す
+STEP_UP_AFTER = 20
+
+
+class EncodeSettings(NamedTuple):
+    format: str
+    quality: int = 80
+    compress_level: int = 6
+    scale: float = 1.0
+
+
+class EncodeBudget(NamedTuple):
+    max_bytes: int
+    max_ms: float
+
+
+class EncodedImage(NamedTuple):
+    data: bytes
+    extension: str
+    settings: EncodeSettings
+    encode_ms: float
+    width: int
+    height: int
+
+
+ENCODE_LADDER: list[EncodeSettings] = [
+    EncodeSettings("webp", quality=85, compress_level=4),
+    EncodeSettings("webp", quality=80, compress_level=0),
+    EncodeSettings("jpeg", quality=85),
+    EncodeSettings("jpeg", quality=75, scale=0.75),
+    EncodeSettings("jpeg", quality=65, scale=0.5),
+]
+
+BUDGETS: dict[str, EncodeBudget] = {
+    "blackjack": EncodeBudget(config.BLACKJACK_IMAGE_MAX_KB * 1024, config.BLACKJACK_IMAGE_MAX_MS),
+    "rps": EncodeBudget(config.RPS_IMAGE_MAX_KB * 1024, config.RPS_IMAGE_MAX_MS),
+}
+DEFAULT_BUDGET = EncodeBudget(512 * 1024, 200.0)
+
+
+def encode_image(image: Image.Image, settings: EncodeSettings) -> EncodedImage:
+    """settings で1回エンコードする。webp の compress_level は method（0が最速）として使う"""
+    start = time.perf_counter()
+    if settings.scale != 1.0:
+        size = (max(1, round(image.width * settings.scale)), max(1, round(image.height * settings.scale)))
+        image = image.resize(size, Image.Resampling.BILINEAR)
+
+    buf = BytesIO()
+    if settings.format == "png":
+        image.save(buf, format="PNG", compress_level=settings.compress_level)
+    elif settings.format == "png8":
+        image.quantize(256, method=Image.Quantize.FASTOCTREE).save(
+            buf, format="PNG", compress_level=settings.compress_level
+        )
+    elif settings.format == "webp":
+        image.convert("RGB").save(buf, format="WEBP", quality=settings.quality, method=settings.compress_level)
+    elif settings.format == "jpeg":
+        image.convert("RGB").save(buf, format="JPEG", quality=settings.quality)
+    else:
+        raise ValueError(f"未対応の画像形式です: {settings.format}")
+
+    return EncodedImage(
+        data=buf.getvalue(),
+        extension=EXTENSIONS[settings.format],
+        settings=settings,
+        encode_ms=(time.perf_counter() - start) * 1000,
+        width=image.width,
+        height=image.height,
+    )
+
+
+def encode_within(image: Image.Image, candidates: list[EncodeSettings], max_bytes: int) -> EncodedImage:
+    """candidates を順に試し、max_bytes 以下になった最初の結果を返す（全て超えたら最後の結果）"""
+    encoded = None
+    for settings in candidates:
+        encoded = encode_image(image, settings)
+        if len(encoded.data) <= max_bytes:
+            break
+    return encoded
+
+
+def _configured_ladder() -> list[EncodeSettings]:
+    fmt = config.IMAGE_FORMAT
+    if fmt == "auto":
+        return ENCODE_LADDER
+    if fmt not in FORMATS:
+        print(f"[WARN] IMAGE_FORMAT の値 '{fmt}' が無効です。auto を使用します。")
+        return ENCODE_LADDER
+    compress_level = config.IMAGE_PNG_COMPRESS_LEVEL if fmt in ("png", "png8") else 4
+    return [EncodeSettings(fmt, config.IMAGE_QUALITY, compress_level, config.IMAGE_SCALE)]
+
+
+class EncodeStats:
+    __slots__ = ("frames", "total_bytes", "max_bytes", "total_ms", "max_ms", "over_budget")
+
+    def __init__(self):
+        self.frames = 0
+        self.total_bytes = 0
+        self.max_bytes = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.over_budget = 0
+
+
+class ImageEncoder:
+    """ゲームごとの段の選択と統計"""
+
+    def __init__(self, name: str, ladder: list[EncodeSettings], budget: EncodeBudget):
+        self.name = name
+        self.ladder = ladder
+        self.budget = budget
+        self.level = 0
+        self.stats = EncodeStats()
+        self._under_half = 0
+
+    def candidates(self) -> list[EncodeSettings]:
+        """現在の段から下の候補（描画ワーカーに渡す）"""
+        return self.ladder[self.level:]
+
+    def record(self, encoded: EncodedImage) -> None:
+        size = len(encoded.data)
+        s = self.stats
+        s.frames += 1
+        s.total_bytes += size
+        s.max_bytes = max(s.max_bytes, size)
+        s.total_ms += encoded.encode_ms
+        s.max_ms = max(s.max_ms, encoded.encode_ms)
+
+        used = self.ladder.index(encoded.settings) if encoded.settings in self.ladder else self.level
+        over = size > self.budget.max_bytes or encoded.encode_ms > self.budget.max_ms
+        if over:
+            s.over_budget += 1
+            self._under_half = 0
+            self.level = min(max(used, self.level) + 1, len(self.ladder) - 1)
+            return
+
+        # バイト数で下の段に落ちた場合はその段を次の既定にする
+        self.level = max(used, self.level)
+        if size <= self.budget.max_bytes / 2 and encoded.encode_ms <= self.budget.max_ms / 2:
+            self._under_half += 1
+            if self._under_half >= STEP_UP_AFTER and self.level > 0:
+                self.level -= 1
+                self._under_half = 0
+        else:
+            self._under_half = 0
+
+    def snapshot(self) -> dict[str, Any]:
+        s = self.stats
+        current = self.ladder[self.level]
+        return {
+            "settings": current._asdict(),
+            "level": self.level,
+            "levels": len(self.ladder),
+            "frames": s.frames,
+            "avg_kb": s.total_bytes / s.frames / 1024 if s.frames else 0.0,
+            "max_kb": s.max_bytes / 1024,
+            "avg_ms": s.total_ms / s.frames if s.frames else 0.0,
+            "max_ms": s.max_ms,
+            "over_budget": s.over_budget,
+            "budget_kb": self.budget.max_bytes / 1024,
+            "budget_ms": self.budget.max_ms,
+        }
+
+
+_encoders: dict[str, ImageEncoder] = {}
+
+
+def get_encoder(name: str) -> ImageEncoder:
+    encoder = _encoders.get(name)
+    if encoder is None:
+        encoder = ImageEncoder(name, _configured_ladder(), BUDGETS.get(name, DEFAULT_BUDGET))
+        _encoders[name] = encoder
+    return encoder
+
+
+def encoder_snapshots() -> dict[str, dict[str, Any]]:
+    return {name: encoder.snapshot() for name, encoder in _encoders.items()}
@@ -1,25 +1,35 @@
 import discord
 import random
 import os
-import hmac
-import hashlib
-import aiohttp
 from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 
-from database.db import update_user_balance
+from database.async_db import credit_balance
 
+from config import CARD_EMOJIS
+from ui.assets import ICON_SIZE, RANKS, get_blackjack_assets
+from ui.avatars import avatar_cache
+from ui.components import GameButton, game_view, route
+from ui.encoding import EncodedImage, encode_within, get_encoder
+from ui.media import media_url
 from ui.pf import ProvablyFairParams
+from ui.render import RenderQueueFull, render_service
+from ui.render_cache import frame_cache, image_nbytes, layer_cache
+from ui.sessions import session_store
 from utils.emojis import PNC_EMOJI_STR, WIN_EMOJI
 from utils.embed import create_embed
 from utils.logs import send_casino_log
 from utils.color import BLACKJACK_COLOR
 
-CARD_PATH = "assets/bj/cards/"
-TABLE_IMAGE_PATH = f"assets/bj/table.png"
-FONT_PATH = "assets/font/NotoSansJP-VariableFont_wght.ttf"
-
-blackjack_games = {}
+CARD_BACK = "back"
+CARD_START_X = 320
+CARD_SPACING = 150
+CARD_SHADOW_OFFSET = (6, 6)
+DEALER_ROW_Y = 120
+PLAYER_ROW_Y = 400
+ICON_X = 130
+DEALER_ICON_Y = 150
+PLAYER_ICON_Y = 420
 
 def calculate_hand(hand):
     total = 0
@@ -37,12 +47,6 @@ def calculate_hand(hand):
         aces -= 1
     return total
 
-def get_card_index(server_seed, client_seed, nonce, cursor):
-    message = f"{client_seed}:{nonce}:{cursor}".encode()
-    digest = hmac.new(server_seed.encode(), message, hashlib.sha256).digest()
-    number = int.from_bytes(digest, 'big') / 2**256
-    return int(number * 52)
-
 def get_card():
     suits = ["S", "H", "D", "C"]
     ranks = ["A"] + [str(n) for n in range(2, 11)] + ["J", "Q", "K"]
@@ -50,146 +54,156 @@ def get_card():
     rank = random.choice(ranks)
     return f"{rank}{suit}", rank
 
-class BlackjackView(discord.ui.View):
-    def __init__(self, user_id):
-        super().__init__(timeout=60)
-        self.user_id = user_id
-
-    async def interaction_check(self, interaction: discord.Interaction) -> bool:
-        return interaction.user.id == self.user_id
-
-    @discord.ui.button(label="ヒット", style=discord.ButtonStyle.primary)
-    async def hit_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        user_id = self.user_id
-        game = blackjack_games.get(user_id)
-        if not game:
-            await interaction.response.send_message("ゲームが見つかりません。", ephemeral=True)
-            return
-
-        game.hit()
-        if game.is_busted(game.player_hand):
-            game.finished = True
-            game.dealer_play()
-            result = game.get_result()
-            del blackjack_games[user_id]
-
-            async with aiohttp.ClientSession() as session:
-                async with session.get(interaction.user.display_avatar.url) as resp:
-                    avatar_bytes = BytesIO(await resp.read())
-
-            if result == "負け":
-                outcome_text = f"### {PNC_EMOJI_STR}`{game.bet:,}` **LOSE**"
-                color = discord.Color.from_str("#ff3d74") 
-            else:
-                outcome_text = f"### {PNC_EMOJI_STR}`{game.bet:,}` **WIN**"
-                color = discord.Color.from_str("#26ffd4") 
-                update_user_balance(user_id, game.bet * 2)
-                await send_casino_log(
-                    interaction, winorlose="WIN", emoji=WIN_EMOJI, price=game.bet * 2,
-                    description="",
-                    color=discord.Color.from_str("#26ffd4"),
-                )
-            img = game.render_image(
-                reveal_dealer=True,
-                user_displayname=interaction.user.display_name,
-                user_avatar_data=avatar_bytes
+def render_blackjack_frame(game, reveal_dealer, user_displayname, user_icon: Image.Image, candidates, max_bytes) -> EncodedImage:
+    """描画ワーカーで実行される。テーブル画像を描いてエンコードする"""
+    img = game.render_image(
+        reveal_dealer=reveal_dealer,
+        user_displayname=user_displayname,
+        user_icon=user_icon
+    )
+    return encode_within(img, candidates, max_bytes)
+
+async def render_table_file(game, user, reveal_dealer=False):
+    """テーブル画像の discord.File を返す。描画待ちが溢れていれば None"""
+    encoder = get_encoder("blackjack")
+    candidates = encoder.candidates()
+    frame_key = (game.render_key(reveal_dealer), user.display_avatar.key, tuple(candidates))
+    encoded = frame_cache.get(frame_key)
+
+    if encoded is None:
+        user_icon = await avatar_cache.get(user, ICON_SIZE[0])
+        try:
+            encoded = await render_service.run(
+                "blackjack", render_blackjack_frame, game, reveal_dealer, user.display_name, user_icon,
+                candidates, encoder.budget.max_bytes
             )
-            buf = BytesIO()
-            img.save(buf, format='PNG')
-            buf.seek(0)
-            file = discord.File(buf, filename="blackjack.png")
-            embed = create_embed("バースト", outcome_text, color=color)
-            embed.set_image(url="attachment://blackjack.png")
-            embed.add_field(name="[🔐] Provably Fair", value=game.get_pf_embed_field(), inline=False)
-            embed.set_footer(text="検証方法：HMAC-SHA256(client:nonce:cursor)でカード順を再計算可能")
-            embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1219916908485283880/1386317663231414272/ChatGPT_Image_2025622_21_11_08.png?ex=6859446f&is=6857f2ef&hm=19507da3f6ae2ea49377b1112e687a6690cd37bb229cc4ebcd5a1fef2c5965e6&")
-            await interaction.response.edit_message(embed=embed, attachments=[file], view=None)
-            return
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(interaction.user.display_avatar.url) as resp:
-                avatar_bytes = BytesIO(await resp.read())
-
-        img = game.render_image(
-            user_displayname=interaction.user.display_name,
-            user_avatar_data=avatar_bytes
-        )
-        buf = BytesIO()
-        img.save(buf, format='PNG')
-        buf.seek(0)
-        file = discord.File(buf, filename="blackjack.png")
-        embed = create_embed("ヒット", f"{interaction.user.mention} の現在の手札です。", BLACKJACK_COLOR)
-        embed.set_image(url="attachment://blackjack.png")
-        await interaction.response.edit_message(embed=embed, attachments=[file], view=self)
-    
-    @discord.ui.button(label="スタンド", style=discord.ButtonStyle.secondary)
-    async def stand_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        user_id = self.user_id
-        game = blackjack_games.get(user_id)
-        if not game:
-            await interaction.response.send_message("ゲームが見つかりません。", ephemeral=True)
-            return
-
+        except RenderQueueFull:
+            print("[WARN] 描画待ちが上限に達したため、ブラックジャックをテキストで表示します")
+            return None
+        encoder.record(encoded)
+        if not avatar_cache.is_placeholder(user_icon):
+            frame_cache.put(frame_key, encoded, len(encoded.data))
+    return discord.File(BytesIO(encoded.data), filename=f"blackjack.{encoded.extension}")
+
+def attach_table(embed, game, file, reveal_dealer=False):
+    """画像があれば埋め込みに設定し、無ければ手札をテキストで追加する"""
+    if file is not None:
+        embed.set_image(url=f"attachment://{file.filename}")
+    else:
+        embed.add_field(name="手札", value=game.hands_text(reveal_dealer), inline=False)
+
+def blackjack_view(game) -> discord.ui.View:
+    return game_view(
+        GameButton("blackjack", game.session_id, "hit", label="ヒット", style=discord.ButtonStyle.primary),
+        GameButton("blackjack", game.session_id, "stand", label="スタンド", style=discord.ButtonStyle.secondary),
+    )
+
+@route("blackjack", "hit")
+async def hit_button(interaction: discord.Interaction, game, _arg):
+    game.hit()
+    if game.is_busted(game.player_hand):
+        game.finished = True
         game.dealer_play()
-        result = game.get_result()
-        del blackjack_games[user_id]
-
-        if result == "勝ち":
-            if game.is_blackjack(game.player_hand):
-                reward = int(game.bet * 2.5)  # 3:2 の配当
-                result_text = f"### {PNC_EMOJI_STR}`{reward - game.bet:,}` **WIN**"
-            else:
-                reward = game.bet * 2
-                result_text = f"### {PNC_EMOJI_STR}`{game.bet:,}` **WIN**"
-            update_user_balance(user_id, reward)
-            color = discord.Color.from_str("#26ffd4")
-
-            await send_casino_log(
-                interaction, winorlose="WIN", emoji=WIN_EMOJI, price=reward,
-                description="",
-                color=discord.Color.from_str("#26ffd4"),
-            )
-        elif result == "引き分け":
-            update_user_balance(user_id, game.bet)
-            result_text = f"### {PNC_EMOJI_STR}`{game.bet:,}` **DRAW**"
-            color = discord.Color.from_str("#aaaaaa")  # ← これを追加
-        else:
-            result_text = f"### {PNC_EMOJI_STR}`{game.bet:,}` **LOSE**"
-            color = discord.Color.from_str("#ff3d74") 
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(interaction.user.display_avatar.url) as resp:
-                avatar_bytes = BytesIO(await resp.read())
-
-        img = game.render_image(
-            reveal_dealer=True,
-            user_displayname=interaction.user.display_name,
-            user_avatar_data=avatar_bytes
-        )
-        buf = BytesIO()
-        img.save(buf, format='PNG')
-        buf.seek(0)
-        file = discord.File(buf, filename="blackjack.png")
-        embed = create_embed("結果", result_text, color=color)
-        embed.set_image(url="attachment://blackjack.png")
+        await session_store.finish("blackjack", game.session_id)
+
+        # バーストは get_result() でも常に「負け」（ディーラーの手に関係なく払い戻しはない）
+        outcome_text = f"### {PNC_EMOJI_STR}`{game.bet:,}` **LOSE**"
+        color = discord.Color.from_str("#ff3d74")
+        file = await render_table_file(game, interaction.user, reveal_dealer=True)
+        embed = create_embed("バースト", outcome_text, color=color)
+        attach_table(embed, game, file, reveal_dealer=True)
         embed.add_field(name="[🔐] Provably Fair", value=game.get_pf_embed_field(), inline=False)
         embed.set_footer(text="検証方法：HMAC-SHA256(client:nonce:cursor)でカード順を再計算可能")
-        embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1219916908485283880/1386317663231414272/ChatGPT_Image_2025622_21_11_08.png?ex=6859446f&is=6857f2ef&hm=19507da3f6ae2ea49377b1112e687a6690cd37bb229cc4ebcd5a1fef2c5965e6&")
-        await interaction.response.edit_message(embed=embed, attachments=[file], view=None)
+        embed.set_thumbnail(url=media_url("thumb/blackjack"))
+        await interaction.response.edit_message(embed=embed, attachments=[file] if file else [], view=None)
+        return
+
+    file = await render_table_file(game, interaction.user)
+    embed = create_embed("ヒット", f"{interaction.user.mention} の現在の手札です。", BLACKJACK_COLOR)
+    attach_table(embed, game, file)
+    await interaction.response.edit_message(embed=embed, attachments=[file] if file else [], view=blackjack_view(game))
+
+@route("blackjack", "stand")
+async def stand_button(interaction: discord.Interaction, game, _arg):
+    user_id = game.user_id
+    if await session_store.finish("blackjack", game.session_id) is None:
+        await interaction.response.send_message("ゲームが見つかりません。", ephemeral=True)
+        return
+
+    game.dealer_play()
+    result = game.get_result()
+
+    if result == "勝ち":
+        if game.is_blackjack(game.player_hand):
+            reward = int(game.bet * 2.5)  # 3:2 の配当
+            result_text = f"### {PNC_EMOJI_STR}`{reward - game.bet:,}` **WIN**"
+        else:
+            reward = game.bet * 2
+            result_text = f"### {PNC_EMOJI_STR}`{game.bet:,}` **WIN**"
+        await credit_balance(user_id, reward)
+        color = discord.Color.from_str("#26ffd4")
+
+        await send_casino_log(
+            interaction, winorlose="WIN", emoji=WIN_EMOJI, price=reward,
+            description="",
+            color=discord.Color.from_str("#26ffd4"),
+        )
+    elif result == "引き分け":
+        await credit_balance(user_id, game.bet)
+        result_text = f"### {PNC_EMOJI_STR}`{game.bet:,}` **DRAW**"
+        color = discord.Color.from_str("#aaaaaa")  # ← これを追加
+    else:
+        result_text = f"### {PNC_EMOJI_STR}`{game.bet:,}` **LOSE**"
+        color = discord.Color.from_str("#ff3d74") 
+
+    file = await render_table_file(game, interaction.user, reveal_dealer=True)
+    embed = create_embed("結果", result_text, color=color)
+    attach_table(embed, game, file, reveal_dealer=True)
+    embed.add_field(name="[🔐] Provably Fair", value=game.get_pf_embed_field(), inline=False)
+    embed.set_footer(text="検証方法：HMAC-SHA256(client:nonce:cursor)でカード順を再計算可能")
+    embed.set_thumbnail(url=media_url("thumb/blackjack"))
+    await interaction.response.edit_message(embed=embed, attachments=[file] if file else [], view=None)
 
 class BlackjackGame:
-    def __init__(self, bet, client_seed=None, server_seed=None, nonce=0):
+    __slots__ = (
+        "user_id", "session_id", "bet", "player_hand", "dealer_hand", "finished", "cursor", "pf",
+        "dealer_file", "dealer_name",
+    )
+
+    def __init__(self, user_id, bet, client_seed=None, server_seed=None, nonce=0):
+        self.user_id = user_id
+        self.session_id = None
         self.bet = bet
         self.player_hand = []
         self.dealer_hand = []
         self.finished = False
         self.cursor = 0
         self.pf = ProvablyFairParams(client_seed, server_seed, nonce)
-        dealer_files = [f for f in os.listdir("assets/bj/dealer") if f.endswith(".png")]
-        dealer_file = random.choice(dealer_files)
+        dealer_file = random.choice(get_blackjack_assets().dealer_files)
         self.dealer_file = dealer_file
         self.dealer_name = os.path.splitext(dealer_file)[0]
 
+    def to_state(self):
+        """保存用。カードはコード（"10H" など）で持ち、ランクは読み込み時に戻す"""
+        return {
+            "user_id": self.user_id, "bet": self.bet,
+            "client_seed": self.pf.client_seed, "server_seed": self.pf.server_seed, "nonce": self.pf.nonce,
+            "cursor": self.cursor, "dealer_file": self.dealer_file,
+            "player": [code for code, _ in self.player_hand],
+            "dealer": [code for code, _ in self.dealer_hand],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        game = cls(state["user_id"], state["bet"], state["client_seed"], state["server_seed"], state["nonce"])
+        game.cursor = state["cursor"]
+        game.player_hand = [(code, code[:-1]) for code in state["player"]]
+        game.dealer_hand = [(code, code[:-1]) for code in state["dealer"]]
+        if state["dealer_file"] in get_blackjack_assets().dealer_files:
+            game.dealer_file = state["dealer_file"]
+            game.dealer_name = os.path.splitext(game.dealer_file)[0]
+        return game
+
     def draw_card(self):
         card = self.pf.get_card(self.cursor)
         self.cursor += 1
@@ -234,45 +248,68 @@ class BlackjackGame:
 
     def get_pf_embed_field(self):
         return self.pf.get_pf_embed_field()
-    
-    def render_image(self, reveal_dealer=False, user_displayname="", user_avatar_data: BytesIO = None):
-        table = Image.open(TABLE_IMAGE_PATH).convert("RGBA")
-        draw = ImageDraw.Draw(table)
-        font = ImageFont.truetype(FONT_PATH, 40)
-
-        card_width, card_height = 140, 200
-        spacing = 150
-        x_offset = -40
-
-        def paste_cards(cards, y):
-            start_x = 320
-
-            for i, (code, _) in enumerate(cards):
-                card_img = Image.open(f"{CARD_PATH}{code}.png").convert("RGBA").resize((card_width, card_height))
-                shadow = Image.new("RGBA", card_img.size, (0, 0, 0, 100))
-                shadow_offset = (6, 6)
-                x = start_x + i * spacing
-                table.paste(shadow, (x + shadow_offset[0], y + shadow_offset[1]), shadow)
-                table.paste(card_img, (x, y), card_img)
-            return calculate_hand(cards)
 
-
-        player_total = paste_cards(self.player_hand, y=400)
+    def hands_text(self, reveal_dealer=False):
+        """画像を出せないときの手札表示"""
+        def cards_text(cards):
+            return " ".join(CARD_EMOJIS[code[-1]][RANKS.index(rank)] for code, rank in cards)
 
         if reveal_dealer:
-            dealer_total = paste_cards(self.dealer_hand, y=120)
+            dealer = f"{cards_text(self.dealer_hand)} (`{calculate_hand(self.dealer_hand)}`)"
         else:
-            dealer_total = calculate_hand([self.dealer_hand[0]])
-            first_card = Image.open(f"{CARD_PATH}{self.dealer_hand[0][0]}.png").convert("RGBA").resize((card_width, card_height))
-            back_card = Image.open(f"{CARD_PATH}back.png").convert("RGBA").resize((card_width, card_height))
-            
-            start_x = 320  
-            shadow = Image.new("RGBA", first_card.size, (0, 0, 0, 100))
-            table.paste(shadow, (start_x + 6, 120 + 6), shadow)
-            table.paste(first_card, (start_x, 120), first_card)
-            table.paste(shadow, (start_x + spacing + 6, 120 + 6), shadow)
-            table.paste(back_card, (start_x + spacing, 120), back_card)
+            dealer = f"{cards_text(self.dealer_hand[:1])} 🂠 (`{calculate_hand(self.dealer_hand[:1])}`)"
+        player = f"{cards_text(self.player_hand)} (`{calculate_hand(self.player_hand)}`)"
+        return f"ディーラー: {dealer}\nあなた: {player}"
+    
+    def visible_codes(self, reveal_dealer=False):
+        """(プレイヤーのカード, ディーラーの見えているカード) のコード"""
+        player_codes = [code for code, _ in self.player_hand]
+        if reveal_dealer:
+            dealer_codes = [code for code, _ in self.dealer_hand]
+        else:
+            dealer_codes = [self.dealer_hand[0][0], CARD_BACK]
+        return player_codes, dealer_codes
+
+    def render_key(self, reveal_dealer=False):
+        """画像の内容を決める状態。ユーザーのアイコン以外はこれだけで決まる"""
+        player_codes, dealer_codes = self.visible_codes(reveal_dealer)
+        return ("blackjack", self.dealer_file, tuple(player_codes), tuple(dealer_codes))
+
+    def render_image(self, reveal_dealer=False, user_displayname="", user_icon: Image.Image = None):
+        key = self.render_key(reveal_dealer)
+        shared = layer_cache.get(key)
+        if shared is None:
+            shared = self._render_shared(reveal_dealer)
+            layer_cache.put(key, shared, image_nbytes(shared))
+
+        # ユーザーのアイコンは他の要素と重ならないので最後に貼る
+        table = shared.copy()
+        table.paste(user_icon, (ICON_X, PLAYER_ICON_Y), user_icon)
+        return table
 
+    def _render_shared(self, reveal_dealer):
+        """ユーザーのアイコン以外を描く"""
+        assets = get_blackjack_assets()
+        # 背景（テーブルとディーラーのアイコン）はディーラーごとに1枚だけ作って共有する
+        background_key = ("blackjack", "background", self.dealer_file)
+        background = layer_cache.get(background_key)
+        if background is None:
+            background = assets.table.copy()
+            dealer_icon = assets.dealer_icons[self.dealer_file]
+            background.paste(dealer_icon, (ICON_X, DEALER_ICON_Y), dealer_icon)
+            layer_cache.put(background_key, background, image_nbytes(background))
+
+        player_codes, dealer_codes = self.visible_codes(reveal_dealer)
+        table = background.copy()
+        self._paste_cards(table, player_codes, PLAYER_ROW_Y, assets)
+        self._paste_cards(table, dealer_codes, DEALER_ROW_Y, assets)
+
+        dealer_total = calculate_hand(self.dealer_hand if reveal_dealer else self.dealer_hand[:1])
+        player_total = calculate_hand(self.player_hand)
+
+        # 文字はカードと重なることがあるので、毎フレーム最後に描く
+        draw = ImageDraw.Draw(table)
+        font = assets.score_font
         text_color = (255, 255, 255)
         shadow_color = (0, 0, 0)
         px, py = table.width - 250, 420
@@ -286,31 +323,21 @@ class BlackjackGame:
         draw_score(draw, dx, dy, "Dealer", dealer_total)
         draw_score(draw, px, py, "You", player_total)
 
-        icon_font = ImageFont.truetype(FONT_PATH, 36)
-        dealer_icon = Image.open(f"assets/bj/dealer/{self.dealer_file}").convert("RGBA").resize((120, 120))
-        dealer_name = self.dealer_name
-
-        user_icon = Image.open(user_avatar_data).convert("RGBA").resize((120, 120))
-
-        def crop_circle(im):
-            mask = Image.new("L", im.size, 0)
-            draw = ImageDraw.Draw(mask)
-            draw.ellipse((0, 0, im.size[0], im.size[1]), fill=255)
-            result = Image.new("RGBA", im.size)
-            result.paste(im, (0, 0), mask)
-            return result
-
-        icon_x = 130
-        dealer_icon_y = 150
-        player_icon_y = 420
-
-        table.paste(crop_circle(dealer_icon), (icon_x, dealer_icon_y), crop_circle(dealer_icon))
-        draw.text((icon_x, dealer_icon_y + 130), dealer_name, font=icon_font, fill=text_color)
-
-        table.paste(crop_circle(user_icon), (icon_x, player_icon_y), crop_circle(user_icon))
-        draw.text((icon_x + 3, player_icon_y + 130), "あなた" or "You", font=icon_font, fill=text_color)
+        icon_font = assets.icon_font
+        draw.text((ICON_X, DEALER_ICON_Y + 130), self.dealer_name, font=icon_font, fill=text_color)
+        draw.text((ICON_X + 3, PLAYER_ICON_Y + 130), "あなた" or "You", font=icon_font, fill=text_color)
 
         return table
+
+    @staticmethod
+    def _paste_cards(table, codes, y, assets):
+        """カードを影つきで左から順に貼る"""
+        shadow = assets.card_shadow
+        for i, code in enumerate(codes):
+            card_img = assets.back if code == CARD_BACK else assets.cards[code]
+            x = CARD_START_X + i * CARD_SPACING
+            table.paste(shadow, (x + CARD_SHADOW_OFFSET[0], y + CARD_SHADOW_OFFSET[1]), shadow)
+            table.paste(card_img, (x, y), card_img)
     
     def get_provably_fair_fields(self):
         return (
@@ -318,4 +345,6 @@ class BlackjackGame:
             f"ServerSeedHash: `{self.pf.server_seed_hash}`\n"
             f"ClientSeed: `{self.pf.client_seed}`\n"
             f"Nonce: `{self.pf.nonce}`"
-        )
\ No newline at end of file
+        )
+
+session_store.register_type("blackjack", BlackjackGame)
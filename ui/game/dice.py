@@ -2,86 +2,109 @@ import discord
 from discord import File
 import random
 import asyncio
+import os
 
-from database.db import update_user_balance
+from database.async_db import credit_balance
 from utils.emojis import DICE_EMOJI, PNC_EMOJI_STR, WIN_EMOJI   
 from utils.embed import create_embed
 from utils.logs import send_casino_log
 from utils.color import BASE_COLOR_CODE
-from config import DICE_FOLDER, CURRENCY_NAME
-
-ongoing_games = {}
-class ContinueButton(discord.ui.View):
-    def __init__(self, user_id, bet_amount, point):
-        super().__init__(timeout=None)
+from config import CURRENCY_NAME
+from ui.dice_composites import composite_name, composite_path
+from ui.components import GameButton, game_view, route
+from ui.media import media_url
+from ui.sessions import session_store
+
+def attach_dice(embed, kind, die1, die2):
+    """2つのダイスの合成画像を embed に載せる。kind は roll（転がり中）か result（結果）
+
+    メディアが登録済みならURLを使い None を返す。未登録なら添付する File を返す。
+    """
+    url = media_url(composite_name(kind, die1, die2))
+    if url:
+        embed.set_image(url=url)
+        return None
+
+    path = composite_path(kind, die1, die2)
+    filename = os.path.basename(path)
+    embed.set_image(url=f"attachment://{filename}")
+    return File(path, filename=filename)
+
+class DiceSession:
+    """ポイントが決まって続行待ちのゲーム"""
+    __slots__ = ("user_id", "bet", "point", "session_id")
+
+    def __init__(self, user_id, bet, point):
         self.user_id = user_id
-        self.bet_amount = bet_amount
+        self.bet = bet
         self.point = point
-
-    @discord.ui.button(emoji=DICE_EMOJI, style=discord.ButtonStyle.success)
-    async def continue_game(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("あなたのゲームではありません。", ephemeral=True)
-            return
-
-        def roll():
-            return random.randint(1, 6), random.randint(1, 6)
-
-        die1, die2 = roll()
-        total = die1 + die2
-
-        gif_path1 = f"{DICE_FOLDER}/gif/{die1}.gif"
-        gif_path2 = f"{DICE_FOLDER}/gif/{die2}.gif"
-        gif_files = [File(gif_path1, filename="dice1.gif"), File(gif_path2, filename="dice2.gif")]
-
-        rolling_embed = create_embed(f"{CURRENCY_NAME}ダイス 続行", f"### 目標ポイント[**{self.point}**]\nサイコロを振っています...", BASE_COLOR_CODE)
-        rolling_embed.set_author(
-            name=interaction.user.name,
-            icon_url=interaction.user.display_avatar.url
+        self.session_id = None
+
+    def to_state(self):
+        return {"user_id": self.user_id, "bet": self.bet, "point": self.point}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["user_id"], state["bet"], state["point"])
+
+session_store.register_type("dice", DiceSession)
+
+def continue_view(session) -> discord.ui.View:
+    return game_view(GameButton("dice", session.session_id, "roll", emoji=DICE_EMOJI, style=discord.ButtonStyle.success))
+
+@route("dice", "roll")
+async def continue_game(interaction: discord.Interaction, session: DiceSession, _arg):
+    def roll():
+        return random.randint(1, 6), random.randint(1, 6)
+
+    die1, die2 = roll()
+    total = die1 + die2
+
+    rolling_embed = create_embed(f"{CURRENCY_NAME}ダイス 続行", f"### 目標ポイント[**{session.point}**]\nサイコロを振っています...", BASE_COLOR_CODE)
+    rolling_embed.set_author(
+        name=interaction.user.name,
+        icon_url=interaction.user.display_avatar.url
+    )
+    rolling_embed.set_thumbnail(url=media_url("thumb/dice"))
+    file = attach_dice(rolling_embed, "roll", die1, die2)
+    await interaction.response.edit_message(embed=rolling_embed, attachments=[file] if file else [], view=None)
+
+    await asyncio.sleep(1.5)
+
+    embed_color = discord.Color.from_str("#26ffd4")
+    description = f"### 目標ポイント[**{session.point}**]\n# {die1} + {die2} = **{total}**"
+    result_text = ""
+    next_view = None
+
+    if total == session.point:
+        winnings = session.bet * 2
+        await session_store.finish("dice", session.session_id)
+        await credit_balance(session.user_id, winnings)
+        result_text = f"\n\n### {PNC_EMOJI_STR}`{winnings}` **WIN**"
+
+        await send_casino_log(
+            interaction=interaction,
+            winorlose="WIN",
+            emoji=WIN_EMOJI,
+            price=winnings - session.bet,
+            description="",
+            color=discord.Color.from_str("#26ffd4")
         )
-        rolling_embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1219916908485283880/1389815902278647818/ChatGPT_Image_202572_12_51_52.png")
-        await interaction.response.edit_message(embed=rolling_embed, attachments=gif_files, view=None)
-
-        await asyncio.sleep(1.5)
-
-        result_path1 = f"{DICE_FOLDER}/png/{die1}.png"
-        result_path2 = f"{DICE_FOLDER}/png/{die2}.png"
-        result_files = [File(result_path1, filename="die1.png"), File(result_path2, filename="die2.png")]
-
-        embed_color = discord.Color.from_str("#26ffd4")
-        description = f"### 目標ポイント[**{self.point}**]\n# {die1} + {die2} = **{total}**"
-        result_text = ""
-        next_view = None
-
-        if total == self.point:
-            winnings = self.bet_amount * 2
-            update_user_balance(self.user_id, winnings)
-            result_text = f"\n\n### {PNC_EMOJI_STR}`{winnings}` **WIN**"
-
-            await send_casino_log(
-                interaction=interaction,
-                winorlose="WIN",
-                emoji=WIN_EMOJI,
-                price=winnings - self.bet_amount,
-                description="",
-                color=discord.Color.from_str("#26ffd4")
-            )
-
-            ongoing_games.pop(self.user_id, None)
-
-        elif total == 7:
-            embed_color = discord.Color.red()
-            result_text = f"\n\n7が出て敗北しました。\n### {PNC_EMOJI_STR}`{self.bet_amount}` **LOSE**"
-            ongoing_games.pop(self.user_id, None)
-
-        else:
-            result_text = "\n\n### まだ勝負はついていません。\nもう一度ボタンを押して続けてください。"
-            next_view = ContinueButton(self.user_id, self.bet_amount, self.point)
-
-        final_embed = create_embed(f"{CURRENCY_NAME}ダイス 継続結果", description + result_text, embed_color)
-        final_embed.set_author(
-            name=interaction.user.name,
-            icon_url=interaction.user.display_avatar.url
-        )
-        final_embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1219916908485283880/1389815902278647818/ChatGPT_Image_202572_12_51_52.png")
-        await interaction.edit_original_response(embed=final_embed, attachments=result_files, view=next_view)
\ No newline at end of file
+
+    elif total == 7:
+        embed_color = discord.Color.red()
+        result_text = f"\n\n7が出て敗北しました。\n### {PNC_EMOJI_STR}`{session.bet}` **LOSE**"
+        await session_store.finish("dice", session.session_id)
+
+    else:
+        result_text = "\n\n### まだ勝負はついていません。\nもう一度ボタンを押して続けてください。"
+        next_view = continue_view(session)
+
+    final_embed = create_embed(f"{CURRENCY_NAME}ダイス 継続結果", description + result_text, embed_color)
+    final_embed.set_author(
+        name=interaction.user.name,
+        icon_url=interaction.user.display_avatar.url
+    )
+    final_embed.set_thumbnail(url=media_url("thumb/dice"))
+    file = attach_dice(final_embed, "result", die1, die2)
+    await interaction.edit_original_response(embed=final_embed, attachments=[file] if file else [], view=next_view)
\ No newline at end of file
@@ -1,67 +1,74 @@
 import discord
 import random
 
-from database.db import update_user_balance
+from database.async_db import credit_balance
 from utils.emojis import PNC_EMOJI_STR, WIN_EMOJI
 from utils.logs import send_casino_log
-from config import FRONT_IMG, BACK_IMG, THUMBNAIL_URL, CURRENCY_NAME
+from config import CURRENCY_NAME
+from ui.components import GameButton, game_view, route
+from ui.media import media_url
+from ui.sessions import session_store
 
-class CoinFlipView(discord.ui.View):
-    def __init__(self, user, bet):
-        super().__init__(timeout=None)
-        self.user = user
-        self.bet = bet
-        self.add_item(CoinFlipButton("表", user, bet))
-        self.add_item(CoinFlipButton("裏", user, bet))
+SIDES = ("表", "裏")
+
+class FlipSession:
+    __slots__ = ("user_id", "bet", "session_id")
 
-class CoinFlipButton(discord.ui.Button):
-    def __init__(self, label, user, bet):
-        super().__init__(style=discord.ButtonStyle.secondary, label=label)
-        self.label = label
-        self.user = user
+    def __init__(self, user_id, bet):
+        self.user_id = user_id
         self.bet = bet
+        self.session_id = None
 
-    async def callback(self, interaction: discord.Interaction):
-        if interaction.user.id != self.user.id:
-            embed = discord.Embed(
-                description="❌ あなたのゲームじゃないヨ！",
-                color=discord.Color.red()
-            )
-            await interaction.response.send_message(embed=embed, ephemeral=True)
-            return
+    def to_state(self):
+        return {"user_id": self.user_id, "bet": self.bet}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["user_id"], state["bet"])
 
-        win = random.random() < 0.5
-        outcome = self.label if win else ("表" if self.label == "裏" else "裏")
-        win = (outcome == self.label)
+session_store.register_type("flip", FlipSession)
 
-        embed = discord.Embed(
-            title=f"{CURRENCY_NAME}フリップ",
-            description=(
-                f"あなたの選択: **{self.label}**\n"
-                f"結果: **{outcome}**\n"
-                f"### {PNC_EMOJI_STR}`{self.bet}` {'**WIN**' if win else '**LOSE**'}"
-            ),
-            color=discord.Color.from_str("#26ffd4") if win else discord.Color.from_str("#ff3d74")
-        )
-        embed.set_author(name=f"{self.user.name}", icon_url=self.user.display_avatar.url)
-        embed.set_thumbnail(url=THUMBNAIL_URL)
-        embed.set_image(url=FRONT_IMG if outcome == "表" else BACK_IMG)
+def coin_flip_view(session) -> discord.ui.View:
+    return game_view(*(
+        GameButton("flip", session.session_id, "pick", i, style=discord.ButtonStyle.secondary, label=label)
+        for i, label in enumerate(SIDES)
+    ))
 
-        if win:
-            update_user_balance(self.user.id, self.bet)
-            try:
-                await send_casino_log(
-                    interaction,
-                    winorlose="WIN",
-                    emoji=WIN_EMOJI,
-                    price=self.bet * 2,
-                    description="",
-                    color=discord.Color.from_str("#26ffd4"),
-                )
-            except Exception as e:
-                print(f"[ERROR] send_casino_log failed: {e}")
-        else:
-            update_user_balance(self.user.id, -self.bet)
+@route("flip", "pick")
+async def on_pick(interaction: discord.Interaction, session: FlipSession, side):
+    if side not in (0, 1) or await session_store.finish("flip", session.session_id) is None:
+        await interaction.response.send_message("❌ **無効な操作です！**", ephemeral=True)
+        return
+
+    label = SIDES[side]
+    win = random.random() < 0.5
+    outcome = label if win else SIDES[1 - side]
+
+    embed = discord.Embed(
+        title=f"{CURRENCY_NAME}フリップ",
+        description=(
+            f"あなたの選択: **{label}**\n"
+            f"結果: **{outcome}**\n"
+            f"### {PNC_EMOJI_STR}`{session.bet}` {'**WIN**' if win else '**LOSE**'}"
+        ),
+        color=discord.Color.from_str("#26ffd4") if win else discord.Color.from_str("#ff3d74")
+    )
+    embed.set_author(name=f"{interaction.user.name}", icon_url=interaction.user.display_avatar.url)
+    embed.set_thumbnail(url=media_url("thumb/flip"))
+    embed.set_image(url=media_url("flip/front" if outcome == "表" else "flip/back"))
+
+    if win:
+        await credit_balance(session.user_id, session.bet * 2)
+        try:
+            await send_casino_log(
+                interaction,
+                winorlose="WIN",
+                emoji=WIN_EMOJI,
+                price=session.bet * 2,
+                description="",
+                color=discord.Color.from_str("#26ffd4"),
+            )
+        except Exception as e:
+            print(f"[ERROR] send_casino_log failed: {e}")
 
-        self.view.clear_items()
-        await interaction.response.edit_message(embed=embed, view=self.view)
\ No newline at end of file
+    await interaction.response.edit_message(embed=embed, view=None)
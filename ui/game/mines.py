@@ -1,34 +1,81 @@
 import asyncio
-import hashlib
 import secrets
+from typing import NamedTuple, Optional
+
 import discord
 
-from database.db import get_user_balance, update_user_balance, save_pf_params
+from database.async_db import credit_balance, save_pf_params
 from utils.stake_mines import get_stake_multiplier
-from utils.logs import send_casino_log, log_transaction
+from utils.logs import send_casino_log, log_transaction_async
 from utils.emojis import MINE_EMOJI, DIAMOND_EMOJI, MINE_EMOJI_TEXT, DIAMOND_EMOJI_TEXT, PNC_EMOJI_STR, WIN_EMOJI
-from utils.sys import generate_server_seed, hash_server_seed, get_hmac_sha256
+from utils.sys import generate_server_seed, hash_server_seed
 from utils.color import BASE_COLOR_CODE
 from config import CURRENCY_NAME
+from ui.components import GameButton, game_view, route
+from ui.media import media_url
+from ui.sessions import session_store
+from ui.pf import HashEngine, derive_mines, mask_to_positions
 
 GRID_SIZE = 5
+CELLS = GRID_SIZE * GRID_SIZE
+ALL_CELLS = (1 << CELLS) - 1
+ROW_MASK = (1 << GRID_SIZE) - 1
+BLANK_LABEL = "‎"
+
+# 盤面はマス (x, y) をビット x * GRID_SIZE + y とする25ビットの整数で持つ。
+# 表示用の文字列とボタンの状態は、ビットの組み合わせから引けるよう事前に作っておく
+
+def _cell_text(revealed, mine):
+    if not revealed:
+        return "⬜"
+    return MINE_EMOJI_TEXT if mine else DIAMOND_EMOJI_TEXT
+
+# 1行分の (開いたマス5ビット << 5 | 爆弾5ビット) → 表示文字列
+_ROW_TEXT = [
+    " ".join(_cell_text(rev >> col & 1, mine >> col & 1) for col in range(GRID_SIZE)) + "\n"
+    for rev in range(1 << GRID_SIZE) for mine in range(1 << GRID_SIZE)
+]
+
+def grid_text(revealed: int, mines: int) -> str:
+    return "".join(
+        _ROW_TEXT[(revealed >> shift & ROW_MASK) << GRID_SIZE | (mines >> shift & ROW_MASK)]
+        for shift in range(0, CELLS, GRID_SIZE)
+    )
 
-def create_mines_embed(game, reveal_all=False, result=None, payout=None):
-    grid_display = ""
-    for x in range(GRID_SIZE):
-        row = []
-        for y in range(GRID_SIZE):
-            if reveal_all:
-                row.append(DIAMOND_EMOJI_TEXT if (x, y) not in game.mines else MINE_EMOJI_TEXT)
-            elif (x, y) in game.revealed:
-                row.append(DIAMOND_EMOJI_TEXT if (x, y) not in game.mines else MINE_EMOJI_TEXT)
-            else:
-                row.append("⬜")
-        grid_display += " ".join(row) + "\n"
-
-    total_tiles = GRID_SIZE * GRID_SIZE
-    total_revealed = len(game.revealed)
-    remaining_gems = total_tiles - game.mine_count - total_revealed
+class CellState(NamedTuple):
+    style: discord.ButtonStyle
+    label: Optional[str]
+    emoji: Optional[str]
+    disabled: bool
+
+HIDDEN = CellState(discord.ButtonStyle.secondary, BLANK_LABEL, None, False)
+GEM_OPEN = CellState(discord.ButtonStyle.secondary, None, DIAMOND_EMOJI, True)
+MINE_OPEN = CellState(discord.ButtonStyle.secondary, None, MINE_EMOJI, True)
+
+# 表示モードごとの [開いたか][爆弾か] → ボタンの状態
+CELL_STATES = {
+    "playing": ((HIDDEN, HIDDEN), (GEM_OPEN, MINE_OPEN)),
+    # 爆弾を踏んだとき: 全マスを開き、爆弾は赤
+    "lost": (
+        (GEM_OPEN, CellState(discord.ButtonStyle.danger, None, MINE_EMOJI, True)),
+        (GEM_OPEN, CellState(discord.ButtonStyle.danger, None, MINE_EMOJI, True)),
+    ),
+    # キャッシュアウト後: 開いたマスはそのまま、他は空白で押せない
+    "ended": (
+        (HIDDEN._replace(disabled=True), HIDDEN._replace(disabled=True)),
+        (GEM_OPEN, MINE_OPEN),
+    ),
+}
+
+def cell_states(revealed: int, mines: int, mode: str) -> list[CellState]:
+    table = CELL_STATES[mode]
+    return [table[revealed >> cell & 1][mines >> cell & 1] for cell in range(CELLS)]
+
+def create_mines_embed(game, user, reveal_all=False, result=None, payout=None):
+    revealed = ALL_CELLS if reveal_all else game.revealed
+    grid_display = grid_text(revealed, game.mines)
+
+    remaining_gems = CELLS - game.mine_count - game.revealed.bit_count()
 
     profit = (payout if payout is not None else game.current_reward) - game.bet
     displayed_profit = max(profit, 0)
@@ -42,10 +89,10 @@ def create_mines_embed(game, reveal_all=False, result=None, payout=None):
 
     embed = discord.Embed(title=f"{CURRENCY_NAME}マインズ", color=embed_color)
     embed.set_author(
-        name=f"{game.user.name}",
-        icon_url=game.user.display_avatar.url
+        name=f"{user.name}",
+        icon_url=user.display_avatar.url
     )
-    embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1219916908485283880/1386292653318209647/ChatGPT_Image_2025622_19_31_53.png?ex=68592d24&is=6857dba4&hm=b8949b8e92394ebf1d2ef1f159fa408153e462c6c519eead391d8bfc52fb6740&")
+    embed.set_thumbnail(url=media_url("thumb/mines"))
     if not (result and payout is not None):
         embed.add_field(name="**掛け金**", value=f"{PNC_EMOJI_STR}`{game.bet}`", inline=False)
         embed.add_field(name="**Mines**", value=f"`{game.mine_count}`", inline=True)
@@ -59,21 +106,9 @@ def create_mines_embed(game, reveal_all=False, result=None, payout=None):
     return embed
 
 async def update_mines_board(interaction, game):
-    embed = create_mines_embed(game)
-    view = MinesView(game.user_id, game)
-
-    for child in view.children:
-        if isinstance(child, MinesButton):
-            if (child.x, child.y) in game.revealed:
-                if (child.x, child.y) in game.mines:
-                    child.style = discord.ButtonStyle.secondary
-                    child.label = None
-                    child.emoji = MINE_EMOJI
-                else:
-                    child.style = discord.ButtonStyle.secondary
-                    child.label = None
-                    child.emoji = DIAMOND_EMOJI
-                child.disabled = True
+    """盤面のビットからボタンを作り直して編集する"""
+    embed = create_mines_embed(game, interaction.user)
+    view = mines_view(game)
     try:
         await interaction.response.edit_message(embed=embed, view=view)
     except discord.errors.InteractionResponded:
@@ -81,7 +116,7 @@ async def update_mines_board(interaction, game):
 
 async def end_mines_game(interaction, game, result, payout, edit_cashout: bool = True):
     reveal_all = result == "ハズレを引いた！"
-    embed = create_mines_embed(game, reveal_all=reveal_all, result=result, payout=payout)
+    embed = create_mines_embed(game, interaction.user, reveal_all=reveal_all, result=result, payout=payout)
 
     # 🔐 PF情報
     embed.add_field(name="🔐Provably Fair", value=(
@@ -92,31 +127,19 @@ async def end_mines_game(interaction, game, result, payout, edit_cashout: bool =
     ), inline=False)
 
     embed.add_field(name="🧭 Bombs (Mines)", value=", ".join(
-        f"({x},{y})" for x, y in sorted(game.mines)
+        f"({x},{y})" for x, y in game.mine_positions()
     ), inline=False)
 
     embed.set_footer(text="検証方法：SHA‑256(Hash確認)、HMAC＋ derive_mine_positions()で爆弾再現可")
 
     try:
-        save_pf_params(game.user_id, game.client_seed, game.server_seed, game.nonce + 1)
+        await save_pf_params(game.user_id, game.client_seed, game.server_seed, game.nonce + 1)
     except Exception as e:
         print(f"[ERROR] failed to save PF params: {e}")
 
 
     if reveal_all:
-        view = MinesView(game.user_id, game)
-        for child in view.children:
-            if isinstance(child, MinesButton):
-                pos = (child.x, child.y)
-                child.disabled = True
-                if pos in game.mines:
-                    child.style = discord.ButtonStyle.danger
-                    child.label = None
-                    child.emoji = MINE_EMOJI
-                else:
-                    child.style = discord.ButtonStyle.secondary
-                    child.label = None
-                    child.emoji = DIAMOND_EMOJI
+        view = mines_view(game, mode="lost")
         try:
             await interaction.response.edit_message(embed=embed, view=view)
         except discord.errors.InteractionResponded:
@@ -124,24 +147,7 @@ async def end_mines_game(interaction, game, result, payout, edit_cashout: bool =
 
     else:
         try:
-            view = MinesView(game.user_id, game)
-            for child in view.children:
-                pos = (child.x, child.y)
-                child.disabled = True 
-
-                if pos in game.revealed:
-                    if pos in game.mines:
-                        child.style = discord.ButtonStyle.secondary
-                        child.label = None
-                        child.emoji = MINE_EMOJI
-                    else:
-                        child.style = discord.ButtonStyle.secondary
-                        child.label = None
-                        child.emoji = DIAMOND_EMOJI
-                else:
-                    child.style = discord.ButtonStyle.secondary
-                    child.label = "‎"
-                    child.emoji = None
+            view = mines_view(game, mode="ended")
 
             if game.message_id:
                 original_game_msg = await interaction.channel.fetch_message(game.message_id)
@@ -152,179 +158,177 @@ async def end_mines_game(interaction, game, result, payout, edit_cashout: bool =
 
     if edit_cashout and result == "ハズレを引いた！" and hasattr(game, "cashout_message_id"):
         cashout_embed = discord.Embed(description="ゲームが終了しました。", color=BASE_COLOR_CODE) 
-        cashout_view = discord.ui.View()
-        cashout_view.add_item(CashoutButton(game.user_id, game, disabled=True))
         try:
             channel = interaction.channel
             msg = await channel.fetch_message(game.cashout_message_id)
-            await msg.edit(embed=cashout_embed, view=cashout_view)
+            await msg.edit(embed=cashout_embed, view=cashout_view(game, disabled=True))
         except discord.errors.NotFound:
             print("[ERROR] Cashout message not found.")
         except Exception as e:
             print(f"[ERROR] Failed to edit cashout message: {e}")
 
-def derive_mine_positions(hmac_hex: str, grid_size: int, mine_count: int):
-    positions = list(range(grid_size * grid_size))
-    selected = []
-    i = 0
-    pool = hmac_hex
-    while len(selected) < mine_count:
-        if i * 4 + 4 > len(pool):
-            pool += hashlib.sha256(pool.encode()).hexdigest()
-        seg = pool[i*4:(i+1)*4]
-        idx = int(seg, 16) % len(positions)
-        selected.append(positions.pop(idx))
-        i += 1
-    return {(pos // grid_size, pos % grid_size) for pos in selected}
-
 class MinesGame:
-    def __init__(self, user: discord.User, bet: int, mine_count: int, client_seed: str = None, nonce: int = 0):
-        self.user = user
-        self.user_id = user.id
+    __slots__ = (
+        "user_id", "bet", "mine_count", "client_seed", "nonce", "server_seed", "server_seed_hash",
+        "mines", "revealed", "finished", "consecutive_wins", "payout_multiplier", "current_reward",
+        "cashout_message_id", "message_id", "session_id",
+    )
+
+    def __init__(self, user_id: int, bet: int, mine_count: int, client_seed: str = None, nonce: int = 0, server_seed: str = None):
+        self.user_id = user_id
         self.bet = bet
         self.mine_count = mine_count
         self.client_seed = client_seed or secrets.token_hex(8)
         self.nonce = nonce
 
-        self.server_seed = generate_server_seed()
+        self.server_seed = server_seed or generate_server_seed()
         self.server_seed_hash = hash_server_seed(self.server_seed)
-        self.hmac = get_hmac_sha256(self.server_seed, self.client_seed, self.nonce)
-        self.mines = derive_mine_positions(self.hmac, GRID_SIZE, mine_count)
+        engine = HashEngine(self.server_seed)
+        self.mines = derive_mines(engine, self.client_seed, self.nonce, CELLS, mine_count)
 
-        self.revealed = set()
+        self.revealed = 0
         self.finished = False
         self.consecutive_wins = 0
         self.payout_multiplier = 1.0
         self.current_reward = 0
         self.cashout_message_id = None
         self.message_id = None
+        self.session_id = None
 
     def reveal(self, x, y):
-        if self.finished or (x, y) in self.revealed:
+        bit = 1 << (x * GRID_SIZE + y)
+        if self.finished or self.revealed & bit:
             return None
 
-        self.revealed.add((x, y))
-        if (x, y) in self.mines:
+        if self.mines & bit:
             self.finished = True
-            all_pos = [(i, j) for i in range(GRID_SIZE) for j in range(GRID_SIZE)]
-            for i, j in all_pos:
-                if (i, j) not in self.revealed:
-                    self.revealed.add((i, j))
+            self.revealed = ALL_CELLS
             return "lose"
 
-        self.consecutive_wins += 1
+        self.revealed |= bit
+        self._update_reward()
+        return "win"
+
+    def _update_reward(self):
+        self.consecutive_wins = self.revealed.bit_count()
         self.payout_multiplier = get_stake_multiplier(self.mine_count, self.consecutive_wins)
         self.current_reward = round(self.bet * self.payout_multiplier)
-        return "win"
 
     def cashout(self):
         if self.finished:
             return None
         self.finished = True
-        all_pos = [(i, j) for i in range(GRID_SIZE) for j in range(GRID_SIZE)]
-        for i, j in all_pos:
-            if (i, j) not in self.revealed:
-                self.revealed.add((i, j))
+        self.revealed = ALL_CELLS
         return round(self.current_reward)
 
+    def cashout_amount(self):
+        """放置で期限切れになったときの払い戻し。まだ開いていなければ掛け金を返す"""
+        return round(self.current_reward) if self.revealed else self.bet
+
+    def mine_positions(self):
+        return sorted(mask_to_positions(self.mines, GRID_SIZE))
+
+    def to_state(self):
+        """保存用。爆弾の位置はシードから、配当は開いたマスから導き直せるので持たない"""
+        return {
+            "user_id": self.user_id, "bet": self.bet, "mine_count": self.mine_count,
+            "client_seed": self.client_seed, "server_seed": self.server_seed, "nonce": self.nonce,
+            "revealed": self.revealed, "message_id": self.message_id, "cashout_message_id": self.cashout_message_id,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        game = cls(
+            state["user_id"], state["bet"], state["mine_count"],
+            client_seed=state["client_seed"], nonce=state["nonce"], server_seed=state["server_seed"],
+        )
+        game.revealed = state["revealed"]
+        game._update_reward()
+        game.message_id = state["message_id"]
+        game.cashout_message_id = state["cashout_message_id"]
+        return game
+
     def get_provably_fair_info(self):
         return {
             "server_seed_hash": self.server_seed_hash,
             "server_seed": self.server_seed,
             "client_seed": self.client_seed,
             "nonce": self.nonce,
-            "mine_positions": sorted(self.mines)
+            "mine_positions": self.mine_positions()
         }
 
-class MinesView(discord.ui.View):
-    def __init__(self, user_id, game):
-        super().__init__(timeout=None) 
-        self.user_id = user_id
-        self.game = game
+session_store.register_type("mines", MinesGame)
 
-        for row in range(GRID_SIZE):
-            for col in range(GRID_SIZE):
-                self.add_item(MinesButton(user_id, game, row, col))
+def mines_view(game, mode="playing") -> discord.ui.View:
+    return game_view(*(
+        GameButton(
+            "mines", game.session_id, "reveal", cell,
+            style=state.style, label=state.label, emoji=state.emoji, disabled=state.disabled,
+            row=cell // GRID_SIZE,
+        )
+        for cell, state in enumerate(cell_states(game.revealed, game.mines, mode))
+    ))
 
-class MinesButton(discord.ui.Button):
-    def __init__(self, user_id, game, x, y):
-        super().__init__(style=discord.ButtonStyle.secondary, label="‎", row=x)
-        self.user_id = user_id
-        self.game = game
-        self.x = x
-        self.y = y
-        
-
-    async def callback(self, interaction: discord.Interaction):
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("❌ **このゲームの参加者ではありません！**", ephemeral=True)
-            return
-
-        if self.game.finished:
-            await interaction.response.send_message("❌ **ゲームはすでに終了しています！**", ephemeral=True)
-            return
-
-        result = self.game.reveal(self.x, self.y)
-
-        if result == "lose":
-            payout = 0
-            
-            log_transaction(self.user_id, "mines", self.game.bet, payout)
-            await end_mines_game(interaction, self.game, "ハズレを引いた！", payout)
-        elif result == "win":
-            await update_mines_board(interaction, self.game)
-        else:
-            await interaction.response.send_message("❌ **無効な操作です！**", ephemeral=True)
-
-class CashoutButton(discord.ui.Button):
-    def __init__(self, user_id, game, disabled=False):
-        super().__init__(style=discord.ButtonStyle.success, label="出金", disabled=disabled, custom_id=f"cashout:{user_id}")
-        self.user_id = user_id
-        self.game = game
-
-    async def callback(self, interaction: discord.Interaction):
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("**この出金ボタンはあなたのものではありません！**", ephemeral=True)
-            return
-
-        if self.game.finished:
-            await interaction.response.send_message(embed=discord.Embed(title="出金不可", description="**すでにゲームが終了しています！**", color=discord.Color.red()), ephemeral=True)
-            return
-
-        payout = self.game.cashout()
-        update_user_balance(self.user_id, payout)
-        log_transaction(self.user_id, "mines", self.game.bet, payout)
-        await send_casino_log(
-            interaction, winorlose="WIN", emoji=WIN_EMOJI, price=payout,
-            description="",
-            color=discord.Color.from_str("#26ffd4"),
+def cashout_view(game, disabled=False) -> discord.ui.View:
+    return game_view(
+        GameButton("mines", game.session_id, "cashout", style=discord.ButtonStyle.success, label="出金", disabled=disabled)
+    )
+
+@route("mines", "reveal")
+async def on_reveal(interaction: discord.Interaction, game: MinesGame, cell: Optional[int]):
+    if game.finished:
+        await interaction.response.send_message("❌ **ゲームはすでに終了しています！**", ephemeral=True)
+        return
+
+    result = game.reveal(cell // GRID_SIZE, cell % GRID_SIZE) if cell is not None and 0 <= cell < CELLS else None
+
+    if result == "lose":
+        payout = 0
+        await session_store.finish("mines", game.session_id)
+        await log_transaction_async(game.user_id, "mines", game.bet, payout)
+        await end_mines_game(interaction, game, "ハズレを引いた！", payout)
+    elif result == "win":
+        await update_mines_board(interaction, game)
+    else:
+        await interaction.response.send_message("❌ **無効な操作です！**", ephemeral=True)
+
+@route("mines", "cashout")
+async def on_cashout(interaction: discord.Interaction, game: MinesGame, _arg: Optional[int]):
+    if game.finished:
+        await interaction.response.send_message(embed=discord.Embed(title="出金不可", description="**すでにゲームが終了しています！**", color=discord.Color.red()), ephemeral=True)
+        return
+
+    payout = game.cashout()
+    await session_store.finish("mines", game.session_id)
+    new_balance = await credit_balance(game.user_id, payout)
+    await log_transaction_async(game.user_id, "mines", game.bet, payout)
+    await send_casino_log(
+        interaction, winorlose="WIN", emoji=WIN_EMOJI, price=payout,
+        description="",
+        color=discord.Color.from_str("#26ffd4"),
+    )
+
+    # ✅ 非同期でまとめて実行
+    async def send_ephemeral():
+        await interaction.response.send_message(
+            embed=discord.Embed(
+                description=f"### {PNC_EMOJI_STR}`{payout}` **WIN**\n\n**現在の残高**: {PNC_EMOJI_STR}`{new_balance}`",
+                color=discord.Color.green()
+            ),
+            # ephemeral=True
         )
-        new_balance = get_user_balance(self.user_id)
-
-        # ✅ 非同期でまとめて実行
-        async def send_ephemeral():
-            await interaction.response.send_message(
-                embed=discord.Embed(
-                    description=f"### {PNC_EMOJI_STR}`{payout}` **WIN**\n\n**現在の残高**: {PNC_EMOJI_STR}`{new_balance}`",
-                    color=discord.Color.green()
-                ),
-                # ephemeral=True
-            )
-
-        async def edit_game_embed():
-            await end_mines_game(interaction, self.game, "勝ったね!", payout, edit_cashout=False)
-
-        async def disable_cashout_button():
-            try:
-                original_message = await interaction.channel.fetch_message(interaction.message.id)
-                new_view = discord.ui.View()
-                new_view.add_item(CashoutButton(self.user_id, self.game, disabled=True))
-                await original_message.edit(view=new_view)
-            except Exception as e:
-                print(f"[ERROR] Failed to disable cashout button after payout: {e}")
-
-        await asyncio.gather(
-            send_ephemeral(),
-            edit_game_embed(),
-            disable_cashout_button()
-        )
\ No newline at end of file
+
+    async def edit_game_embed():
+        await end_mines_game(interaction, game, "勝ったね!", payout, edit_cashout=False)
+
+    async def disable_cashout_button():
+        try:
+            await interaction.message.edit(view=cashout_view(game, disabled=True))
+        except Exception as e:
+            print(f"[ERROR] Failed to disable cashout button after payout: {e}")
+
+    await asyncio.gather(
+        send_ephemeral(),
+        edit_game_embed(),
+        disable_cashout_button()
+    )
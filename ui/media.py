@@ -0,0 +1,234 @@
+"""静的メディアのレジストリ。
+
+ダイスのアニメーションやゲームのサムネイルなど変化しない画像は、MEDIA_CHANNEL_ID の
+チャンネルへ一度だけアップロードし、そのCDN URLを bot_state に記録して使い回す。
+Discord の添付URLは ex= の期限つきなので、期限が近づいたら保存先のメッセージを
+取得し直して新しいURLに差し替える。
+
+ローカルファイルは内容のハッシュが変わったときだけアップロードし直す。
+既存のCDN URLしかない画像は refresh-urls で有効なURLを得てから取り込む。
+保存先が未設定か、まだ同期していないときは url() が None（ローカルファイル）または
+元のURLを返すので、呼び出し側はファイル添付で送る。
+"""
+import asyncio
+import hashlib
+import os
+import time
+from io import BytesIO
+from typing import Any, NamedTuple, Optional
+from urllib.parse import parse_qs, urlparse
+
+import aiohttp
+import discord
+from discord.http import Route
+
+import config
+from bot import bot
+from database import async_db
+from ui.dice_composites import DICE_FACES, KIND_EXTENSIONS, composite_name, composite_path
+
+MAX_FILES_PER_MESSAGE = 10
+
+
+class MediaSource(NamedTuple):
+    name: str
+    path: Optional[str] = None  # ローカルファイル
+    url: Optional[str] = None  # 既存のCDN URL（期限切れでも refresh-urls で取り直せる）
+
+    @property
+    def filename(self) -> str:
+        ext = os.path.splitext(self.path or urlparse(self.url).path)[1]
+        return self.name.replace("/", "_") + ext
+
+
+MEDIA_SOURCES: list[MediaSource] = [
+    *[
+        MediaSource(composite_name(kind, a, b), path=composite_path(kind, a, b))
+        for kind in KIND_EXTENSIONS for a in DICE_FACES for b in DICE_FACES
+    ],
+    MediaSource("flip/gif", url=config.FLIP_GIF_URL),
+    MediaSource("flip/front", url=config.FRONT_IMG),
+    MediaSource("flip/back", url=config.BACK_IMG),
+    MediaSource("thumb/flip", url=config.THUMBNAIL_URL),
+    MediaSource("thumb/dice", url=config.DICE_THUMBNAIL_URL),
+    MediaSource("thumb/blackjack", url=config.BLACKJACK_THUMBNAIL_URL),
+    MediaSource("thumb/mines", url=config.MINES_THUMBNAIL_URL),
+    MediaSource("thumb/rps", url=config.RPS_THUMBNAIL_URL),
+]
+
+
+def url_expires_at(url: str) -> Optional[int]:
+    """CDN URL の ex=（16進のUNIX時刻）を返す。付いていなければ None"""
+    values = parse_qs(urlparse(url).query).get("ex")
+    if not values:
+        return None
+    try:
+        return int(values[0], 16)
+    except ValueError:
+        return None
+
+
+def _read_file(path: str) -> tuple[bytes, str]:
+    with open(path, "rb") as f:
+        data = f.read()
+    return data, hashlib.sha256(data).hexdigest()
+
+
+class MediaRegistry:
+    def __init__(self, sources: list[MediaSource]):
+        self.sources = {source.name: source for source in sources}
+        self.records: dict[str, dict[str, Any]] = {}
+        self.uploads = 0
+        self.refreshes = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def url(self, name: str) -> Optional[str]:
+        record = self.records.get(name)
+        if record is not None:
+            return record["url"]
+        return self.sources[name].url
+
+    def start(self) -> None:
+        """同期して、以後は定期的にURLを更新する（on_ready から呼ぶ。2回目以降は何もしない）"""
+        if not config.MEDIA_CHANNEL_ID:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except (discord.HTTPException, aiohttp.ClientError, OSError) as e:
+                print(f"[WARN] メディアの同期に失敗しました: {e}")
+            await asyncio.sleep(config.MEDIA_REFRESH_INTERVAL_MINUTES * 60)
+
+    async def _channel(self) -> discord.abc.Messageable:
+        channel = bot.get_channel(config.MEDIA_CHANNEL_ID)
+        if channel is None:
+            channel = await bot.fetch_channel(config.MEDIA_CHANNEL_ID)
+        return channel
+
+    async def sync(self) -> None:
+        """未登録・変更済みのメディアをアップロードし、期限の近いURLを更新する"""
+        async with self._lock:
+            if not self.records:
+                stored = await async_db.get_media_records()
+                self.records = {name: record for name, record in stored.items() if name in self.sources}
+
+            channel = await self._channel()
+            await self._refresh_expiring(channel)
+
+            pending = []
+            for source in self.sources.values():
+                record = self.records.get(source.name)
+                if source.path:
+                    data, digest = await asyncio.to_thread(_read_file, source.path)
+                    if record is None or record.get("sha256") != digest:
+                        pending.append((source, data, {"sha256": digest}))
+                elif record is None or record.get("source_url") != source.url:
+                    data = await self._download_remote(source)
+                    if data is not None:
+                        pending.append((source, data, {"source_url": source.url}))
+
+            if pending:
+                await self._upload(channel, pending)
+                print(f"[LOG] メディアを{len(pending)}件アップロードしました")
+
+    async def _upload(self, channel, pending: list[tuple[MediaSource, bytes, dict[str, Any]]]) -> None:
+        for i in range(0, len(pending), MAX_FILES_PER_MESSAGE):
+            chunk = pending[i:i + MAX_FILES_PER_MESSAGE]
+            files = [discord.File(BytesIO(data), filename=source.filename) for source, data, _ in chunk]
+            message = await channel.send(files=files)
+            attachments = {attachment.filename: attachment for attachment in message.attachments}
+            for source, _, extra in chunk:
+                attachment = attachments.get(source.filename)
+                if attachment is None:
+                    print(f"[WARN] アップロードしたメディア {source.name} が見つかりません")
+                    continue
+                record = {
+                    "url": attachment.url,
+                    "expires_at": url_expires_at(attachment.url),
+                    "channel_id": channel.id,
+                    "message_id": message.id,
+                    "filename": source.filename,
+                    **extra,
+                }
+                self.records[source.name] = record
+                await async_db.save_media_record(source.name, record)
+                self.uploads += 1
+
+    async def _refresh_expiring(self, channel) -> None:
+        """期限が MEDIA_REFRESH_MARGIN_HOURS 以内のURLを、保存先のメッセージから取り直す"""
+        deadline = time.time() + config.MEDIA_REFRESH_MARGIN_HOURS * 3600
+        by_message: dict[int, list[str]] = {}
+        for name, record in self.records.items():
+            expires_at = record.get("expires_at")
+            if expires_at is not None and expires_at < deadline:
+                by_message.setdefault(record["message_id"], []).append(name)
+
+        for message_id, names in by_message.items():
+            try:
+                message = await channel.fetch_message(message_id)
+            except discord.NotFound:
+                # 保存先のメッセージが消えていれば、この後の同期でアップロードし直す
+                for name in names:
+                    self.records.pop(name, None)
+                    await async_db.delete_media_record(name)
+                continue
+
+            attachments = {attachment.filename: attachment for attachment in message.attachments}
+            for name in names:
+                record = self.records[name]
+                attachment = attachments.get(record["filename"])
+                if attachment is None:
+                    self.records.pop(name, None)
+                    await async_db.delete_media_record(name)
+                    continue
+                record["url"] = attachment.url
+                record["expires_at"] = url_expires_at(attachment.url)
+                await async_db.save_media_record(name, record)
+                self.refreshes += 1
+
+    async def _download_remote(self, source: MediaSource) -> Optional[bytes]:
+        """期限切れのCDN URLを refresh-urls で有効にしてからダウンロードする"""
+        url = source.url
+        try:
+            data = await bot.http.request(
+                Route("POST", "/attachments/refresh-urls"), json={"attachment_urls": [url]}
+            )
+            refreshed = data.get("refreshed_urls") or []
+            if refreshed:
+                url = refreshed[0].get("refreshed") or url
+
+            async with bot.http_session.get(url) as resp:
+                resp.raise_for_status()
+                return await resp.read()
+        except (discord.HTTPException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"[WARN] メディア {source.name} を取得できません。元のURLを使用します: {e}")
+            return None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "registered": len(self.records),
+            "sources": len(self.sources),
+            "uploads": self.uploads,
+            "refreshes": self.refreshes,
+        }
+
+
+media_registry = MediaRegistry(MEDIA_SOURCES)
+
+
+def media_url(name: str) -> Optional[str]:
+    return media_registry.url(name)
@@ -1,25 +1,168 @@
-import hmac
+"""Provably Fair の導出エンジン。
+
+各ゲームの結果は HMAC-SHA256(server_seed, メッセージ) から導く。HashEngine は
+server_seed で鍵付けしたHMACを1回だけ作り、メッセージごとに .copy() して使う。
+ゲーム開始時に必要な分（ブラックジャックの1シュー、じゃんけん20ラウンド、爆弾の配置）を
+まとめて導出する。計算式は以前の実装と同じで、既存のシードから同じ結果を再現できる。
+
+- ブラックジャック: HMAC(server, "client:nonce:cursor") を 2**256 で割り 52 を掛けた整数部
+- じゃんけん: HMAC(server, "client:nonce") の先頭4バイトを 0xFFFFFFFF で割り 3 を掛けた整数部
+- マインズ: HMAC(server, "client:nonce") を2バイトずつ区切り、残りマス数で割った余りで選ぶ。
+  足りなくなったら、それまでの16進文字列全体の SHA-256 を後ろに足す
+"""
 import hashlib
+import hmac
 import secrets
+from typing import Optional
+
+from utils.sys import generate_server_seed, hash_server_seed
+
+SUITS = ["S", "H", "D", "C"]
+RANKS = ["A"] + [str(n) for n in range(2, 11)] + ["J", "Q", "K"]
+RPS_HANDS = ["rock", "paper", "scissors"]
+
+# 1ゲームで使い切れないだけのカード枚数（ディーラーとプレイヤー合わせても届かない）
+SHOE_SIZE = 32
+RPS_MAX_ROUNDS = 20
+
+
+def generate_client_seed() -> str:
+    return secrets.token_hex(8)
+
+
+class HashEngine:
+    """server_seed で鍵付けしたHMAC-SHA256"""
+
+    __slots__ = ("_base",)
+
+    def __init__(self, server_seed: str):
+        self._base = hmac.new(server_seed.encode(), digestmod=hashlib.sha256)
+
+    def digest(self, message: bytes) -> bytes:
+        h = self._base.copy()
+        h.update(message)
+        return h.digest()
+
+    def digests(self, prefix: bytes, start: int, count: int) -> list[bytes]:
+        """prefix に start から count 個の連番を付けたメッセージのダイジェスト"""
+        base = self._base.copy()
+        base.update(prefix)
+        out = []
+        for i in range(start, start + count):
+            h = base.copy()
+            h.update(str(i).encode())
+            out.append(h.digest())
+        return out
+
+
+def card_index(digest: bytes) -> int:
+    return int(int.from_bytes(digest, "big") / 2**256 * 52)
+
+
+def card_from_index(idx: int) -> tuple[str, str]:
+    rank = RANKS[idx % 13]
+    return rank + SUITS[idx // 13], rank
+
+
+def derive_shoe(engine: HashEngine, client_seed: str, nonce: int, start: int = 0, count: int = SHOE_SIZE) -> list[int]:
+    """cursor が start から count 枚分のカード番号（0-51）"""
+    prefix = f"{client_seed}:{nonce}:".encode()
+    return [card_index(d) for d in engine.digests(prefix, start, count)]
+
+
+def rps_hand(digest: bytes) -> str:
+    num = int.from_bytes(digest[:4], "big") / 0xFFFFFFFF
+    # 先頭4バイトが全て 0xFF のときだけ 3 になるので最後の手に丸める
+    return RPS_HANDS[min(int(num * 3), len(RPS_HANDS) - 1)]
+
+
+def derive_rps_hands(engine: HashEngine, client_seed: str, nonce: int, count: int = RPS_MAX_ROUNDS) -> list[str]:
+    """nonce から count ラウンド分の相手の手"""
+    prefix = f"{client_seed}:".encode()
+    return [rps_hand(d) for d in engine.digests(prefix, nonce, count)]
+
+
+def _nth_set_bit(mask: int, n: int) -> int:
+    """下から n 番目（0始まり）に立っているビットの位置"""
+    for _ in range(n):
+        mask &= mask - 1
+    return (mask & -mask).bit_length() - 1
+
+
+def derive_mine_mask(digest: bytes, cells: int, mine_count: int) -> int:
+    """爆弾のマスのビットマスク（ビット i がマス i）"""
+    remaining = (1 << cells) - 1
+    mask = 0
+    pool = digest
+    # 追加ブロックは「それまでの16進文字列全体」の SHA-256 なので、文字列を逐次ハッシュしておく
+    pool_hash = hashlib.sha256(digest.hex().encode())
+    offset = 0
+    for picked in range(mine_count):
+        if offset + 2 > len(pool):
+            block = pool_hash.copy().digest()
+            pool += block
+            pool_hash.update(block.hex().encode())
+        seg = int.from_bytes(pool[offset:offset + 2], "big")
+        offset += 2
+        pos = _nth_set_bit(remaining, seg % (cells - picked))
+        remaining &= ~(1 << pos)
+        mask |= 1 << pos
+    return mask
+
+
+def derive_mines(engine: HashEngine, client_seed: str, nonce: int, cells: int, mine_count: int) -> int:
+    return derive_mine_mask(engine.digest(f"{client_seed}:{nonce}".encode()), cells, mine_count)
+
+
+def mask_to_positions(mask: int, grid_size: int) -> set[tuple[int, int]]:
+    return {(pos // grid_size, pos % grid_size) for pos in range(grid_size * grid_size) if mask >> pos & 1}
+
+
+def derive_mine_positions(hmac_hex: str, grid_size: int, mine_count: int) -> set[tuple[int, int]]:
+    """HMACの16進文字列から爆弾の位置を再現する（検証用）"""
+    mask = derive_mine_mask(bytes.fromhex(hmac_hex), grid_size * grid_size, mine_count)
+    return mask_to_positions(mask, grid_size)
+
 
 class ProvablyFairParams:
+    __slots__ = (
+        "client_seed", "server_seed", "server_seed_hash", "nonce", "engine",
+        "_shoe", "_shoe_nonce", "_hands", "_hands_nonce",
+    )
+
     def __init__(self, client_seed=None, server_seed=None, nonce=0):
-        self.client_seed = client_seed or secrets.token_hex(8)
-        self.server_seed = server_seed or secrets.token_hex(32)
-        self.server_seed_hash = hashlib.sha256(self.server_seed.encode()).hexdigest()
+        self.client_seed = client_seed or generate_client_seed()
+        self.server_seed = server_seed or generate_server_seed()
+        self.server_seed_hash = hash_server_seed(self.server_seed)
         self.nonce = nonce
+        self.engine = HashEngine(self.server_seed)
+        self._shoe: Optional[list[int]] = None
+        self._shoe_nonce = nonce
+        self._hands: Optional[list[str]] = None
+        self._hands_nonce = nonce
 
     def get_card_index(self, cursor: int) -> int:
-        msg = f"{self.client_seed}:{self.nonce}:{cursor}".encode()
-        digest = hmac.new(self.server_seed.encode(), msg, hashlib.sha256).digest()
-        number = int.from_bytes(digest, 'big') / 2**256
-        return int(number * 52)
+        if self._shoe is None or self._shoe_nonce != self.nonce:
+            self._shoe = derive_shoe(self.engine, self.client_seed, self.nonce)
+            self._shoe_nonce = self.nonce
+        if cursor < len(self._shoe):
+            return self._shoe[cursor]
+        return card_index(self.engine.digest(f"{self.client_seed}:{self.nonce}:{cursor}".encode()))
 
     def get_card(self, cursor: int):
-        suits = ["S", "H", "D", "C"]
-        ranks = ["A"] + [str(n) for n in range(2, 11)] + ["J", "Q", "K"]
-        idx = self.get_card_index(cursor)
-        return ranks[idx % 13] + suits[idx // 13], ranks[idx % 13]
+        return card_from_index(self.get_card_index(cursor))
+
+    def get_opponent_hand(self) -> str:
+        """じゃんけんの相手の手。開始時の nonce から RPS_MAX_ROUNDS 分をまとめて導出しておく"""
+        if self._hands is None:
+            self._hands = derive_rps_hands(self.engine, self.client_seed, self._hands_nonce)
+        offset = self.nonce - self._hands_nonce
+        if 0 <= offset < len(self._hands):
+            return self._hands[offset]
+        return rps_hand(self.engine.digest(f"{self.client_seed}:{self.nonce}".encode()))
+
+    def get_pf_info(self):
+        return f"ServerSeed: `{self.server_seed}`\nClientSeed: `{self.client_seed}`\nNonce: `{self.nonce}`"
 
     def get_pf_embed_field(self):
         return (
@@ -27,4 +170,4 @@ class ProvablyFairParams:
             f"Seed: `{self.server_seed}`\n"
             f"Client: `{self.client_seed}`\n"
             f"Nonce: `{self.nonce}`"
-        )
\ No newline at end of file
+        )
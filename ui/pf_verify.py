@@ -0,0 +1,229 @@
+"""Provably Fair のオフライン検証ツール。
+
+1行1ラウンドのJSONLか pf_params コレクションを読み、ui.pf と同じ式で結果を再計算して
+server_seed_hash と記録された結果を照合する。照合はプロセスプールでまとめて行う。
+
+    python -m ui.pf_verify file rounds.jsonl [--workers 8] [--mismatches out.jsonl]
+    python -m ui.pf_verify mongo --game blackjack [--cards 6]
+    python -m ui.pf_verify mongo --game mines [--mine-count 3]
+
+レコードの形式（結果のキーは省略可。省略したものは再計算だけ行い、--emit で書き出せる）:
+
+    {"game": "blackjack", "server_seed": ..., "server_seed_hash": ..., "client_seed": ..., "nonce": 3,
+     "cards": ["AS", "10H", ...]}
+    {"game": "mines", ..., "mine_count": 3, "mines": [[0, 4], [2, 1], [3, 3]]}
+    {"game": "rps", ..., "hands": ["rock", "paper"]}   # nonce から連続するラウンドの相手の手
+
+pf_params には各ユーザーの直近のシードと「次の」nonce しかないので、mongo では nonce-1 の
+ラウンドを --game の式で再計算して出力する（照合するのはハッシュのみ）。地雷数も残っていないので、
+mines は --mine-count を指定したときだけ配置を再計算する。
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Iterable, Iterator, Optional, TextIO
+
+from ui.pf import (
+    HashEngine,
+    card_from_index,
+    derive_mines,
+    derive_rps_hands,
+    derive_shoe,
+    hash_server_seed,
+    mask_to_positions,
+)
+
+GAMES = ("blackjack", "mines", "rps")
+MINES_GRID_SIZE = 5
+CHUNK_SIZE = 5000
+# 実行中に抱えるチャンク数（ワーカー数あたり）。大きなファイルでもメモリを一定に保つ
+INFLIGHT_PER_WORKER = 4
+# 結果の記録がないレコードで再計算する数
+DEFAULT_CARDS = 6
+DEFAULT_RPS_ROUNDS = 1
+
+
+def recompute(
+    record: dict[str, Any],
+    cards: int = DEFAULT_CARDS,
+    rounds: int = DEFAULT_RPS_ROUNDS,
+    mine_count: Optional[int] = None,
+) -> dict[str, Any]:
+    """record のシードから結果を再計算する。記録された結果があればその長さに合わせる。
+    地雷数が記録にも引数にも無い mines は再計算できないので空を返す（ハッシュだけを照合する）"""
+    engine = HashEngine(record["server_seed"])
+    client_seed = record["client_seed"]
+    nonce = int(record["nonce"])
+    game = record["game"]
+
+    if game == "blackjack":
+        count = len(record["cards"]) if "cards" in record else cards
+        return {"cards": [card_from_index(i)[0] for i in derive_shoe(engine, client_seed, nonce, 0, count)]}
+    if game == "mines":
+        if record.get("mine_count"):
+            mine_count = int(record["mine_count"])
+        elif "mines" in record:
+            mine_count = len(record["mines"])
+        elif mine_count is None:
+            return {}
+        mask = derive_mines(engine, client_seed, nonce, MINES_GRID_SIZE * MINES_GRID_SIZE, mine_count)
+        return {"mine_count": mine_count, "mines": sorted(mask_to_positions(mask, MINES_GRID_SIZE))}
+    if game == "rps":
+        count = len(record["hands"]) if "hands" in record else rounds
+        return {"hands": derive_rps_hands(engine, client_seed, nonce, count)}
+    raise ValueError(f"未対応のゲームです: {game}")
+
+
+def verify_record(
+    record: dict[str, Any],
+    cards: int = DEFAULT_CARDS,
+    rounds: int = DEFAULT_RPS_ROUNDS,
+    mine_count: Optional[int] = None,
+) -> tuple[dict[str, Any], list[str]]:
+    """(再計算した結果, 不一致のフィールド) を返す"""
+    problems = []
+    expected_hash = record.get("server_seed_hash")
+    if expected_hash and hash_server_seed(record["server_seed"]) != expected_hash:
+        problems.append("server_seed_hash")
+
+    computed = recompute(record, cards, rounds, mine_count)
+    if "cards" in record and [str(c) for c in record["cards"]] != computed["cards"]:
+        problems.append("cards")
+    if "mines" in record and sorted(tuple(p) for p in record["mines"]) != [tuple(p) for p in computed["mines"]]:
+        problems.append("mines")
+    if "hands" in record and list(record["hands"]) != computed["hands"]:
+        problems.append("hands")
+    return computed, problems
+
+
+def verify_chunk(
+    lines: list[str], cards: int, rounds: int, mine_count: Optional[int], emit: bool
+) -> tuple[int, list[dict[str, Any]], list[dict[str, Any]]]:
+    """ワーカーで実行する。(件数, 不一致, 再計算結果) を返す。行は JSON 文字列のまま受け取る"""
+    mismatches = []
+    emitted = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+            computed, problems = verify_record(record, cards, rounds, mine_count)
+        except (ValueError, KeyError, TypeError) as e:
+            mismatches.append({"line": line.strip()[:200], "problems": ["invalid"], "error": str(e)})
+            continue
+        if problems:
+            mismatches.append({**record, "problems": problems, "computed": computed})
+        if emit:
+            emitted.append({**record, **computed})
+    return len(lines), mismatches, emitted
+
+
+def _chunks(lines: Iterable[str], size: int) -> Iterator[list[str]]:
+    it = iter(lines)
+    while chunk := list(itertools.islice(it, size)):
+        yield chunk
+
+
+def _read_jsonl(path: str) -> Iterator[str]:
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line in f:
+            if line.strip():
+                yield line
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def _read_pf_params(game: str) -> Iterator[str]:
+    from database.db import pf_collection
+
+    projection = {"_id": 0, "user_id": 1, "client_seed": 1, "server_seed": 1, "nonce": 1, "server_seed_hash": 1}
+    for doc in pf_collection.find({"server_seed": {"$exists": True}}, projection, batch_size=CHUNK_SIZE):
+        nonce = doc.get("nonce", 0)
+        if nonce <= 0 or not doc.get("client_seed"):
+            continue
+        # 保存されているのは次のゲームの nonce
+        yield json.dumps({**doc, "game": game, "nonce": nonce - 1})
+
+
+def run(
+    lines: Iterable[str],
+    workers: int,
+    cards: int = DEFAULT_CARDS,
+    rounds: int = DEFAULT_RPS_ROUNDS,
+    mine_count: Optional[int] = None,
+    mismatch_out: Optional[TextIO] = None,
+    emit_out: Optional[TextIO] = None,
+) -> tuple[int, int]:
+    """lines を検証し (件数, 不一致件数) を返す。不一致と再計算結果は指定先へJSONLで書く"""
+    total = 0
+    bad = 0
+    emit = emit_out is not None
+
+    def collect(result: tuple[int, list[dict[str, Any]], list[dict[str, Any]]]) -> None:
+        nonlocal total, bad
+        count, mismatches, emitted = result
+        total += count
+        bad += len(mismatches)
+        for entry in mismatches:
+            (mismatch_out or sys.stdout).write(json.dumps(entry, ensure_ascii=False) + "\n")
+        for entry in emitted:
+            emit_out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    if workers <= 1:
+        for chunk in _chunks(lines, CHUNK_SIZE):
+            collect(verify_chunk(chunk, cards, rounds, mine_count, emit))
+        return total, bad
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        inflight: set[Future] = set()
+        for chunk in _chunks(lines, CHUNK_SIZE):
+            if len(inflight) >= workers * INFLIGHT_PER_WORKER:
+                done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future.result())
+            inflight.add(pool.submit(verify_chunk, chunk, cards, rounds, mine_count, emit))
+        for future in inflight:
+            collect(future.result())
+    return total, bad
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Provably Fair のオフライン検証")
+    sub = parser.add_subparsers(dest="source", required=True)
+    file_parser = sub.add_parser("file", help="JSONLファイル（- で標準入力）を検証")
+    file_parser.add_argument("path")
+    mongo_parser = sub.add_parser("mongo", help="pf_params コレクションの直近ラウンドを再計算")
+    mongo_parser.add_argument("--game", choices=GAMES, required=True)
+    for p in (file_parser, mongo_parser):
+        p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        p.add_argument("--cards", type=int, default=DEFAULT_CARDS, help="結果の記録がないときに出すカード枚数")
+        p.add_argument("--rounds", type=int, default=DEFAULT_RPS_ROUNDS, help="結果の記録がないときに出すじゃんけんのラウンド数")
+        p.add_argument("--mine-count", type=int, choices=range(1, 25), metavar="1-24", help="地雷数の記録がないときに使う地雷数")
+        p.add_argument("--mismatches", help="不一致の書き出し先（省略時は標準出力）")
+        p.add_argument("--emit", help="再計算した結果の書き出し先")
+    args = parser.parse_args()
+
+    lines = _read_jsonl(args.path) if args.source == "file" else _read_pf_params(args.game)
+    mismatch_out = open(args.mismatches, "w", encoding="utf-8") if args.mismatches else None
+    emit_out = open(args.emit, "w", encoding="utf-8") if args.emit else None
+    start = time.perf_counter()
+    try:
+        total, bad = run(lines, args.workers, args.cards, args.rounds, args.mine_count, mismatch_out, emit_out)
+    finally:
+        for f in (mismatch_out, emit_out):
+            if f is not None:
+                f.close()
+
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed * 60 if elapsed > 0 else 0
+    print(f"[✓] {total}件を検証しました（不一致 {bad}件, {elapsed:.1f}秒, {rate:,.0f}件/分）", file=sys.stderr)
+    if bad:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
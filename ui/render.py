@@ -0,0 +1,113 @@
+"""画像描画をイベントループの外で実行するサービス。
+
+Pillow の合成とエンコードは RENDER_MODE に応じてスレッドプールかプロセスプールで行う。
+待ち行列は RENDER_MAX_PENDING 件までで、溢れた場合は RenderQueueFull を送出する。
+呼び出し側はこれを受けて画像なしのテキスト表示に切り替える。
+
+プロセスプールに渡す関数と引数は pickle できる必要がある（モジュールのトップレベル関数）。
+
+描画の途中結果はゲームオブジェクトには持たせず、ui.render_cache の layer_cache（全体で容量に上限がある）で共有する。
+じゃんけんの履歴の層は1つ短い履歴の層に新しいセルだけを描き足し、ブラックジャックの背景はディーラーごとに1枚を使い回す。
+"""
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+import config
+from ui.assets import preload_assets
+
+T = TypeVar("T")
+
+
+class RenderQueueFull(Exception):
+    """描画待ちが上限に達している"""
+
+
+def _timed_call(func: Callable[..., T], *args: Any) -> tuple[T, float]:
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class RenderStats:
+    __slots__ = ("count", "total_ms", "max_ms", "wait_ms")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.wait_ms = 0.0
+
+    def record(self, render_ms: float, wait_ms: float) -> None:
+        self.count += 1
+        self.total_ms += render_ms
+        self.max_ms = max(self.max_ms, render_ms)
+        self.wait_ms += wait_ms
+
+
+class RenderService:
+    def __init__(self, mode: str, workers: int, max_pending: int):
+        if mode not in ("thread", "process"):
+            print(f"[WARN] RENDER_MODE の値 '{mode}' が無効です。thread を使用します。")
+            mode = "thread"
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.pending = 0
+        self.rejected = 0
+        self.stats: dict[str, RenderStats] = {}
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=preload_assets)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+        return self._executor
+
+    async def run(self, name: str, func: Callable[..., T], *args: Any) -> T:
+        """func(*args) をワーカーで実行して結果を返す。待ちが溢れていれば RenderQueueFull"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise RenderQueueFull(name)
+
+        self.pending += 1
+        submitted = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, render_seconds = await loop.run_in_executor(self._get_executor(), _timed_call, func, *args)
+        finally:
+            self.pending -= 1
+
+        total_ms = (time.perf_counter() - submitted) * 1000
+        render_ms = render_seconds * 1000
+        self.stats.setdefault(name, RenderStats()).record(render_ms, max(total_ms - render_ms, 0.0))
+        return result
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "renders": {
+                name: {
+                    "count": s.count,
+                    "avg_ms": s.total_ms / s.count if s.count else 0.0,
+                    "max_ms": s.max_ms,
+                    "avg_wait_ms": s.wait_ms / s.count if s.count else 0.0,
+                }
+                for name, s in self.stats.items()
+            },
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+render_service = RenderService(config.RENDER_MODE, config.RENDER_WORKERS, config.RENDER_MAX_PENDING)
@@ -0,0 +1,81 @@
+"""ゲーム画面の内容アドレス型キャッシュ。
+
+キーはゲーム状態を正規化したタプル（手札のコード、伏せ札の有無、履歴など）で、
+同じ状態なら誰が遊んでいても同じ画像になることを利用する。
+
+- layer_cache: アバターと名前を載せる前の画像（全ユーザー共通）。描画ワーカー側で使う
+- frame_cache: アバターまで載せてエンコードした結果。イベントループ側で引き、
+  当たれば描画もエンコードも行わない
+
+どちらも値の大きさの合計で上限を決めるLRU。
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from PIL import Image
+
+import config
+
+
+def image_nbytes(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+class RenderCache:
+    def __init__(self, name: str, max_bytes: int):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """キャッシュ済みの値を返す。返り値は共有されるので書き換えないこと"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, nbytes: int) -> None:
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, nbytes)
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_mb": self.size / 1024 / 1024,
+                "max_mb": self.max_bytes / 1024 / 1024,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+layer_cache = RenderCache("layer", config.RENDER_LAYER_CACHE_MB * 1024 * 1024)
+frame_cache = RenderCache("frame", config.RENDER_FRAME_CACHE_MB * 1024 * 1024)
@@ -0,0 +1,362 @@
+"""進行中のゲームのセッション。
+
+ボタンの custom_id にはゲーム名とセッションIDだけを入れ、ゲームの状態はここから引く。
+メッセージごとに View オブジェクトを保持しないので、ボタンの数だけメモリが増えることはない。
+
+セッションはゲームごとに最後に操作された順で並べておき、SESSION_TTL_SECONDS の間
+操作のないものを先頭から取り除く。取り除いたセッションは SESSION_EXPIRY_POLICY に従い
+掛け金を返す（refund）、その時点の払い戻し額を返す（cashout）、没収する（forfeit）のいずれかで清算する。
+
+再起動で進行中のゲームを失わないよう、セッションを1件1ドキュメントで LIVE_SESSIONS_COLLECTION に
+保存しておく。変更のあったセッションだけを SESSION_SNAPSHOT_INTERVAL_SECONDS ごとにまとめて書き
+（開始はすぐに）、終了時にも書く。ゲームを終えるときは finish() でドキュメントを消してから払い戻すので、
+清算済みのセッションが再起動で戻ることはない。同じセッションへの書き込みは前のものが終わるまで待たせ、
+順番が入れ替わらないようにする。起動時に読み戻せば、ボタンの custom_id はセッションIDで引くので、
+元のメッセージのボタンがそのまま使える。
+各ゲームのセッションクラスは to_state() / from_state() を持ち、register_type() で登録する。
+"""
+import asyncio
+import datetime
+import secrets
+import sys
+import time
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Iterable, Optional
+
+import discord
+from PIL import Image
+
+import config
+from database import async_db
+from database.async_db import credit_balance
+from ui.render_cache import image_nbytes
+
+# custom_id に入れるセッションIDの長さ（バイト）。16進で12文字
+SESSION_ID_BYTES = 6
+
+SessionKey = tuple[str, str]
+
+
+class _Entry:
+    __slots__ = ("session", "last_active")
+
+    def __init__(self, session: Any, last_active: float):
+        self.session = session
+        self.last_active = last_active
+
+
+def expiry_payout(game: str, session: Any) -> int:
+    """期限切れで返す額。refund は掛け金、cashout はセッションの cashout_amount()"""
+    policy = config.SESSION_EXPIRY_POLICY.get(game, "forfeit")
+    if policy == "refund":
+        return session.bet
+    if policy == "cashout":
+        return session.cashout_amount()
+    return 0
+
+
+def session_nbytes(obj: Any, _seen: Optional[set[int]] = None) -> int:
+    """セッションが抱えているおおよそのバイト数。Discord のユーザーなど共有のオブジェクトは数えない"""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen or isinstance(obj, (discord.abc.User, type)):
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, Image.Image):
+        return image_nbytes(obj)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(session_nbytes(k, seen) + session_nbytes(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(session_nbytes(item, seen) for item in obj)
+    elif not isinstance(obj, (str, bytes, int, float, bool)) and obj is not None:
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if hasattr(obj, name):
+                    size += session_nbytes(getattr(obj, name), seen)
+        if hasattr(obj, "__dict__"):
+            size += session_nbytes(vars(obj), seen)
+    return size
+
+
+def document_id(game: str, session_id: str) -> str:
+    return f"{game}:{session_id}"
+
+
+class SessionStore:
+    def __init__(self):
+        self._sessions: dict[str, OrderedDict[str, _Entry]] = {}
+        self._types: dict[str, type] = {}
+        self.expired: dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._persist_task: Optional[asyncio.Task] = None
+        # 保存していない変更のあるセッションと、消せなかったドキュメント
+        self._dirty: set[SessionKey] = set()
+        self._undeleted: set[SessionKey] = set()
+        # 書き込み中のセッション。同じセッションへの次の書き込みは、これが終わるまで待つ
+        self._writing: set[SessionKey] = set()
+        self._written = asyncio.Condition()
+        self._wake = asyncio.Event()
+        self._stop = asyncio.Event()
+        self.writes = 0
+        self.deletes = 0
+
+    def register_type(self, game: str, cls: type) -> None:
+        """保存するセッションのクラス（to_state / from_state を持つ）"""
+        self._types[game] = cls
+
+    def mark_changed(self, game: str, session_id: Optional[str], immediate: bool = False) -> None:
+        if session_id is None or game not in self._types or self._entry(game, session_id) is None:
+            return
+        self._dirty.add((game, session_id))
+        if immediate:
+            self._wake.set()
+
+    def _game(self, game: str) -> OrderedDict[str, _Entry]:
+        sessions = self._sessions.get(game)
+        if sessions is None:
+            sessions = self._sessions[game] = OrderedDict()
+        return sessions
+
+    def _entry(self, game: str, session_id: str) -> Optional[_Entry]:
+        sessions = self._sessions.get(game)
+        return sessions.get(session_id) if sessions is not None else None
+
+    def add(self, game: str, session: Any) -> str:
+        """session に session_id を付けて登録し、そのIDを返す"""
+        sessions = self._game(game)
+        session_id = secrets.token_hex(SESSION_ID_BYTES)
+        while session_id in sessions:
+            session_id = secrets.token_hex(SESSION_ID_BYTES)
+        session.session_id = session_id
+        sessions[session_id] = _Entry(session, time.monotonic())
+        self.mark_changed(game, session_id, immediate=True)
+        return session_id
+
+    def get(self, game: str, session_id: str) -> Optional[Any]:
+        """セッションを返し、最後に操作された時刻を更新する"""
+        entry = self._entry(game, session_id)
+        if entry is None:
+            return None
+        entry.last_active = time.monotonic()
+        self._sessions[game].move_to_end(session_id)
+        return entry.session
+
+    def remove(self, game: str, session_id: Optional[str]) -> Optional[Any]:
+        """メモリから取り除く。保存済みのドキュメントは消さないので、ゲームを終えるときは finish() を使う"""
+        sessions = self._sessions.get(game)
+        if session_id is None or sessions is None:
+            return None
+        entry = sessions.pop(session_id, None)
+        if entry is None:
+            return None
+        self._dirty.discard((game, session_id))
+        return entry.session
+
+    async def finish(self, game: str, session_id: Optional[str]) -> Optional[Any]:
+        """ゲームを終える。セッションを取り除き、払い戻しや結果の表示の前に保存済みのドキュメントを消す"""
+        session = self.remove(game, session_id)
+        if session is not None and game in self._types:
+            await self._delete([(game, session_id)])
+        return session
+
+    def count(self, game: Optional[str] = None) -> int:
+        if game is not None:
+            return len(self._sessions.get(game, ()))
+        return sum(len(sessions) for sessions in self._sessions.values())
+
+    @property
+    def unsaved(self) -> int:
+        return len(self._dirty) + len(self._undeleted)
+
+    def pop_idle(self, now: Optional[float] = None) -> list[tuple[str, Any]]:
+        """TTL を過ぎたセッションを取り除いて (ゲーム, セッション) で返す"""
+        now = time.monotonic() if now is None else now
+        idle = []
+        for game, sessions in self._sessions.items():
+            deadline = now - config.SESSION_TTL_SECONDS.get(game, config.SESSION_DEFAULT_TTL_SECONDS)
+            # 操作された順に並んでいるので、期限内のものに当たったら止める
+            while sessions:
+                session_id, entry = next(iter(sessions.items()))
+                if entry.last_active > deadline:
+                    break
+                del sessions[session_id]
+                self._dirty.discard((game, session_id))
+                idle.append((game, entry.session))
+        return idle
+
+    async def expire_idle(self) -> int:
+        idle = self.pop_idle()
+        # 清算した後に残ったドキュメントから戻すと二重に払うので、払う前に消す
+        await self._delete([(game, session.session_id) for game, session in idle if game in self._types])
+        for game, session in idle:
+            if hasattr(session, "finished"):
+                session.finished = True
+            payout = expiry_payout(game, session)
+            self.expired[game] = self.expired.get(game, 0) + 1
+            if payout > 0:
+                try:
+                    await credit_balance(session.user_id, payout)
+                except Exception as e:
+                    print(f"[ERROR] 期限切れの {game} セッションを清算できません (user={session.user_id}, {payout}): {e}")
+                    continue
+            print(f"[LOG] 放置された {game} セッションを終了しました (user={session.user_id}, 返金 {payout})")
+        return len(idle)
+
+    @asynccontextmanager
+    async def _exclusive(self, keys: set[SessionKey]) -> AsyncIterator[None]:
+        """keys への書き込みを、先に始まった同じセッションへの書き込みが終わってから行う"""
+        async with self._written:
+            await self._written.wait_for(lambda: self._writing.isdisjoint(keys))
+            self._writing |= keys
+        try:
+            yield
+        finally:
+            async with self._written:
+                self._writing -= keys
+                self._written.notify_all()
+
+    def _document(self, game: str, session_id: str, session: Any) -> dict[str, Any]:
+        return {
+            "_id": document_id(game, session_id),
+            "game": game,
+            "session_id": session_id,
+            "user_id": session.user_id,
+            "state": session.to_state(),
+            "updated_at": datetime.datetime.now(datetime.timezone.utc),
+        }
+
+    async def _save(self, keys: set[SessionKey]) -> None:
+        async with self._exclusive(keys):
+            # 待っている間に終わったものや、先に書かれたものは除く
+            pending = keys & self._dirty
+            self._dirty -= pending
+            docs = []
+            for game, session_id in pending:
+                entry = self._entry(game, session_id)
+                if entry is not None:
+                    docs.append(self._document(game, session_id, entry.session))
+            try:
+                await async_db.save_live_sessions(docs)
+            except Exception:
+                self._dirty |= {key for key in pending if self._entry(*key) is not None}
+                raise
+            self.writes += len(docs)
+
+    async def _delete(self, keys: Iterable[SessionKey]) -> None:
+        keys = set(keys) | self._undeleted
+        if not keys:
+            return
+        async with self._exclusive(keys):
+            try:
+                await async_db.delete_live_sessions([document_id(game, session_id) for game, session_id in keys])
+            except Exception as e:
+                # 残ったままだと再起動で清算済みのゲームが戻るので、次の保存でもう一度消す
+                self._undeleted |= keys
+                print(f"[WARN] 終了したセッションを削除できません（{len(keys)}件、後で再試行します）: {e}")
+                return
+            self._undeleted -= keys
+            self.deletes += len(keys)
+
+    async def save(self, game: str, session_id: Optional[str]) -> None:
+        """このセッションをすぐに書く。失敗したら次の定期保存に任せる"""
+        self.mark_changed(game, session_id)
+        if session_id is None or game not in self._types:
+            return
+        try:
+            await self._save({(game, session_id)})
+        except Exception as e:
+            print(f"[WARN] セッションを保存できません ({game}:{session_id}): {e}")
+
+    async def flush(self) -> None:
+        """未保存の変更をすべて書く"""
+        if self._undeleted:
+            await self._delete(())
+        if self._dirty:
+            await self._save(set(self._dirty))
+
+    async def load(self) -> int:
+        """保存されたセッションを読み戻し、その件数を返す（起動時、ボタンを受け付ける前に呼ぶ）"""
+        now = time.monotonic()
+        restored = 0
+        skipped: Counter[str] = Counter()
+        for doc in await async_db.get_live_sessions():
+            game = doc.get("game")
+            cls = self._types.get(game)
+            if cls is None:
+                skipped[game] += 1
+                continue
+            try:
+                session = cls.from_state(doc["state"])
+                session_id = doc["session_id"]
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"[ERROR] {doc.get('_id')} のセッションを復元できません (user={doc.get('user_id')}): {e}")
+                continue
+            session.session_id = session_id
+            self._game(game)[session_id] = _Entry(session, now)
+            restored += 1
+        for game, count in skipped.items():
+            print(f"[WARN] 未登録のゲーム {game} のセッション {count}件を読み飛ばします")
+        return restored
+
+    def start(self) -> None:
+        """期限切れの清算と定期保存を始める（on_ready から呼ぶ。2回目以降は何もしない）"""
+        self._stop.clear()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        if self._persist_task is None or self._persist_task.done():
+            self._persist_task = asyncio.create_task(self._persist())
+
+    async def stop(self) -> None:
+        """定期処理を止め、未保存の変更があれば書き出す"""
+        # 清算や保存の途中で止めると、ドキュメントを消したのに払っていないセッションが残る。
+        # キャンセルせず、今の清算・書き込みが終わったところで抜けさせる
+        self._stop.set()
+        self._wake.set()
+        for task in (self._task, self._persist_task):
+            if task is not None:
+                await task
+        self._task = None
+        self._persist_task = None
+        await self.flush()
+
+    async def _persist(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._wake.wait(), config.SESSION_SNAPSHOT_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[WARN] セッションを保存できません: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._stop.wait(), config.SESSION_SWEEP_INTERVAL_SECONDS)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.expire_idle()
+            except Exception as e:
+                print(f"[WARN] セッションの清算に失敗しました: {e}")
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """ゲームごとの件数・おおよそのバイト数・期限切れ件数"""
+        games = sorted(set(self._sessions) | set(self.expired) | set(config.SESSION_TTL_SECONDS))
+        return {
+            game: {
+                "live": self.count(game),
+                "bytes": sum(session_nbytes(entry.session) for entry in self._sessions.get(game, {}).values()),
+                "expired": self.expired.get(game, 0),
+                "ttl": int(config.SESSION_TTL_SECONDS.get(game, config.SESSION_DEFAULT_TTL_SECONDS)),
+            }
+            for game in games
+        }
+
+
+session_store = SessionStore()
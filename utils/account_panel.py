@@ -3,7 +3,7 @@ from discord.errors import NotFound
 
 from bot import bot
 import config
-from database.db import get_account_panel_message_id, save_account_panel_message_id
+from database.async_db import get_account_panel_message_id, save_account_panel_message_id
 
 from commands.account import AccountView
 
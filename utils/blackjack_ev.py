@@ -0,0 +1,194 @@
+"""ブラックジャックの厳密な期待値と基本戦略。
+
+ui/game/blackjack.py の規則をそのまま計算する:
+- カードは52枚から復元抽出（無限デッキ）。A=1/13、2〜9 各1/13、10点札 4/13
+- ディーラーは17以上でスタンド（ソフト17もスタンド）。ホールカードの確認（ピーク）はない
+- プレイヤーはヒットかスタンドのみ（ダブル・スプリット・サレンダーなし）
+- 最初の2枚で21（ブラックジャック）の勝ちは 3:2。ディーラーが21なら枚数に関係なく引き分け
+- プレイヤーがバーストした時点で負け
+
+ディーラーの最終合計の確率は (ハードの合計, Aの有無) ごとにメモ化した動的計画法で求め、
+プレイヤーの各状態の価値は max(スタンド, ヒット) を同じくメモ化して求める。
+規則を BlackjackRules で変えれば、シミュレーションなしで期待値を比較できる。
+
+    python -m utils.blackjack_ev [--hit-soft-17] [--blackjack-payout 1.2] [--stand-on 17]
+"""
+import argparse
+import time
+from functools import lru_cache
+from typing import Any, NamedTuple
+
+# 点数（Aは1）ごとの出る確率
+CARD_PROBS: tuple[tuple[int, float], ...] = tuple((v, 1 / 13) for v in range(1, 10)) + ((10, 4 / 13),)
+UPCARDS = (2, 3, 4, 5, 6, 7, 8, 9, 10, 1)
+UPCARD_LABELS = ("2", "3", "4", "5", "6", "7", "8", "9", "10", "A")
+# stand_on の範囲。1枚目だけでは止まらない（Aを11と数えても11）ように12以上とする
+STAND_ON_RANGE = range(12, 22)
+
+
+class BlackjackRules(NamedTuple):
+    stand_on: int = 17
+    hit_soft_17: bool = False
+    blackjack_payout: float = 1.5
+    # True ならプレイヤーのブラックジャックはディーラーの3枚以上の21に勝つ
+    blackjack_beats_21: bool = False
+
+
+CURRENT_RULES = BlackjackRules()
+
+
+def best_total(hard: int, has_ace: bool) -> int:
+    """calculate_hand と同じ（Aを11として数えられるなら数える）"""
+    return hard + 10 if has_ace and hard + 10 <= 21 else hard
+
+
+def _is_soft(hard: int, has_ace: bool) -> bool:
+    return has_ace and hard + 10 <= 21
+
+
+def dealer_finals(rules: BlackjackRules) -> tuple[int, ...]:
+    """ディーラーが引き終えたときの合計（stand_on〜21）。dealer_outcomes はこの順にバーストを足した確率を返す"""
+    if rules.stand_on not in STAND_ON_RANGE:
+        raise ValueError(f"stand_on は {STAND_ON_RANGE.start}〜{STAND_ON_RANGE.stop - 1} で指定してください: {rules.stand_on}")
+    return tuple(range(rules.stand_on, 22))
+
+
+@lru_cache(maxsize=None)
+def dealer_outcomes(rules: BlackjackRules, hard: int, has_ace: bool) -> tuple[float, ...]:
+    """この状態から引き終えたときの [stand_on, ..., 21, バースト] の確率"""
+    finals = dealer_finals(rules)
+    if hard > 21:
+        return (0.0,) * len(finals) + (1.0,)
+    total = best_total(hard, has_ace)
+    must_hit = total < rules.stand_on or (
+        rules.hit_soft_17 and total == 17 and _is_soft(hard, has_ace)
+    )
+    if not must_hit:
+        out = [0.0] * (len(finals) + 1)
+        out[finals.index(total)] = 1.0
+        return tuple(out)
+
+    out = [0.0] * (len(finals) + 1)
+    for value, prob in CARD_PROBS:
+        for i, p in enumerate(dealer_outcomes(rules, hard + value, has_ace or value == 1)):
+            out[i] += prob * p
+    return tuple(out)
+
+
+def dealer_distribution(rules: BlackjackRules, upcard: int) -> tuple[float, ...]:
+    """見えているカードが upcard のときのディーラーの最終結果の確率（ホールカードも復元抽出）"""
+    return dealer_outcomes(rules, upcard, upcard == 1)
+
+
+def stand_ev(rules: BlackjackRules, total: int, upcard: int, blackjack: bool = False) -> float:
+    dist = dealer_distribution(rules, upcard)
+    if blackjack:
+        # ブラックジャックは負けない。ディーラーの21とは引き分け（blackjack_beats_21 なら勝ち）
+        tie = 0.0 if rules.blackjack_beats_21 else dist[-2]
+        return (1 - tie) * rules.blackjack_payout
+
+    ev = dist[-1]
+    for final, p in zip(dealer_finals(rules), dist):
+        if total > final:
+            ev += p
+        elif total < final:
+            ev -= p
+    return ev
+
+
+@lru_cache(maxsize=None)
+def player_value(rules: BlackjackRules, hard: int, has_ace: bool, upcard: int) -> tuple[float, bool]:
+    """(最適な期待値, ヒットすべきか)。2枚の21（ブラックジャック）は initial_value で扱う"""
+    stand = stand_ev(rules, best_total(hard, has_ace), upcard)
+    hit = 0.0
+    for value, prob in CARD_PROBS:
+        next_hard = hard + value
+        if next_hard > 21:
+            hit -= prob
+        else:
+            hit += prob * player_value(rules, next_hard, has_ace or value == 1, upcard)[0]
+    return (hit, True) if hit > stand else (stand, False)
+
+
+def initial_value(rules: BlackjackRules, first: int, second: int, upcard: int) -> float:
+    hard = first + second
+    has_ace = first == 1 or second == 1
+    value, _ = player_value(rules, hard, has_ace, upcard)
+    if best_total(hard, has_ace) == 21:
+        value = max(value, stand_ev(rules, 21, upcard, blackjack=True))
+    return value
+
+
+@lru_cache(maxsize=16)
+def expected_value(rules: BlackjackRules = CURRENT_RULES) -> float:
+    """1ゲームあたりの期待値（掛け金1あたり）。負なら胴元有利"""
+    ev = 0.0
+    for upcard, p_up in CARD_PROBS:
+        for first, p1 in CARD_PROBS:
+            for second, p2 in CARD_PROBS:
+                ev += p_up * p1 * p2 * initial_value(rules, first, second, upcard)
+    return ev
+
+
+@lru_cache(maxsize=16)
+def strategy_table(rules: BlackjackRules = CURRENT_RULES) -> dict[str, dict[int, str]]:
+    """{"hard": {合計: "HHSS..."}, "soft": {...}}。文字はディーラーのアップカード 2〜10, A の順。
+    結果はキャッシュされ共有されるので書き換えないこと"""
+    def row(hard: int, has_ace: bool) -> str:
+        return "".join("H" if player_value(rules, hard, has_ace, up)[1] else "S" for up in UPCARDS)
+
+    return {
+        "hard": {total: row(total, False) for total in range(4, 21)},
+        # ソフト合計 12〜20 は「A + (合計-11)」
+        "soft": {total: row(total - 10, True) for total in range(12, 21)},
+    }
+
+
+def format_strategy(table: dict[str, dict[int, str]]) -> str:
+    header = "      " + " ".join(f"{label:>2}" for label in UPCARD_LABELS)
+    lines = [header]
+    for kind, prefix in (("hard", "H"), ("soft", "S")):
+        for total, moves in table[kind].items():
+            lines.append(f"{prefix}{total:<4} " + " ".join(f"{m:>2}" for m in moves))
+    return "\n".join(lines)
+
+
+def analyze(rules: BlackjackRules = CURRENT_RULES) -> dict[str, Any]:
+    """期待値・基本戦略・バースト率をまとめる。計算結果はキャッシュされ、elapsed_ms は毎回の所要時間"""
+    start = time.perf_counter()
+    ev = expected_value(rules)
+    table = strategy_table(rules)
+    dealer_bust = {
+        label: dealer_distribution(rules, up)[-1] for label, up in zip(UPCARD_LABELS, UPCARDS)
+    }
+    return {
+        "rules": rules._asdict(),
+        "ev": ev,
+        "house_edge": -ev,
+        "rtp": 1 + ev,
+        "strategy": table,
+        "dealer_bust": dealer_bust,
+        "elapsed_ms": (time.perf_counter() - start) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ブラックジャックの厳密な期待値と基本戦略")
+    parser.add_argument(
+        "--stand-on", type=int, choices=STAND_ON_RANGE, metavar=f"{STAND_ON_RANGE.start}-{STAND_ON_RANGE.stop - 1}",
+        default=CURRENT_RULES.stand_on,
+    )
+    parser.add_argument("--hit-soft-17", action="store_true")
+    parser.add_argument("--blackjack-payout", type=float, default=CURRENT_RULES.blackjack_payout)
+    parser.add_argument("--blackjack-beats-21", action="store_true")
+    args = parser.parse_args()
+
+    rules = BlackjackRules(args.stand_on, args.hit_soft_17, args.blackjack_payout, args.blackjack_beats_21)
+    result = analyze(rules)
+    print(f"期待値: {result['ev']:+.5f} / ハウスエッジ: {result['house_edge'] * 100:.3f}% / RTP: {result['rtp'] * 100:.3f}%")
+    print(f"計算時間: {result['elapsed_ms']:.1f}ms")
+    print(format_strategy(result["strategy"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,8 @@ import discord
 
 from bot import bot
 import config
-from database.db import financial_transactions_collection
+from database import async_db
+from database.db import push_financial_transaction
 
 async def send_casino_log(
     interaction: discord.Interaction,
@@ -41,33 +42,57 @@ async def send_casino_log(
     except Exception as e:
         print(f"[ERROR] Failed to send casino log: {e}")
 
-def log_financial_transaction(
-    user_id: int,
+def _build_transaction(
     transaction_type: str,
     amount: int,
-    net_amount: int = None
-) -> None:
+    net_amount: Optional[int] = None
+) -> Optional[dict]:
     if transaction_type not in ["payin", "payout", "exchange"]:
         print(f"[WARN] log_financial_transaction: 無効なトランザクションタイプ '{transaction_type}' はスキップされました")
-        return
-    
+        return None
+
     if net_amount is None:
         net_amount = amount
-    
-    transaction = {
+
+    return {
         "type": transaction_type,
         "amount": amount,
         "net_amount": net_amount,
         "timestamp": datetime.datetime.now()
     }
 
-    financial_transactions_collection.update_one(
-        {"user_id": user_id},
-        {"$push": {"transactions": transaction}},
-        upsert=True
-    )
+
+def log_financial_transaction(
+    user_id: int,
+    transaction_type: str,
+    amount: int,
+    net_amount: int = None
+) -> None:
+    transaction = _build_transaction(transaction_type, amount, net_amount)
+    if transaction is None:
+        return
+
+    push_financial_transaction(user_id, transaction)
+
+
+async def log_financial_transaction_async(
+    user_id: int,
+    transaction_type: str,
+    amount: int,
+    net_amount: int = None
+) -> None:
+    transaction = _build_transaction(transaction_type, amount, net_amount)
+    if transaction is None:
+        return
+
+    await async_db.push_financial_transaction(user_id, transaction)
 
 
 def log_transaction(user_id: int, type: str, amount: int, payout: int) -> None:
      if type in ["payin", "payout"]:
-        log_financial_transaction(user_id, type, amount, payout)
\ No newline at end of file
+        log_financial_transaction(user_id, type, amount, payout)
+
+
+async def log_transaction_async(user_id: int, type: str, amount: int, payout: int) -> None:
+    if type in ["payin", "payout"]:
+        await log_financial_transaction_async(user_id, type, amount, payout)
@@ -0,0 +1,359 @@
+"""ゲームごとの還元率（RTP）のシミュレーションと、配当表の検証。
+
+各ゲームの1ラウンドを NumPy の配列演算でまとめて進める（BATCH_SIZE ラウンドずつ）。
+戦略は「マインズで k 個開けたらキャッシュアウト」「じゃんけんで k 勝したらキャッシュアウト」の形。
+各ラウンドの受取額から RTP と分散に加え、BLOCK_ROUNDS ラウンドごとの胴元の損益の分布（最大エクスポージャー）を出す。
+
+配当表の検証は閉じた式の確率（マインズは超幾何、クラップスは 244/495 など）と表を突き合わせ、
+単調でない箇所や目標RTPから外れた箇所を報告する。フリップとダイスは RTP が 1 以上（胴元の取り分がない）なら報告する。
+
+NumPy が必要（ボット本体は使わない）: pip install numpy
+
+    python -m utils.rtp_sim validate
+    python -m utils.rtp_sim simulate --rounds 100000000 [--game mines] [--seed 1]
+
+配当の規則は各ゲームの実装に合わせてある:
+- フリップ: 1/2 で掛け金の2倍（ui/game/flip.py）
+- ダイス: 7,11 で勝ち、2,3,12 で負け、それ以外はポイントが出るまで振り直し 7 で負け。勝ちは2倍
+- マインズ: k 個目で round(bet * get_stake_multiplier(m, k))
+- じゃんけん: w 勝で int(bet * 1.96 * 2**(w-1))。引き分けでは nonce が進まず相手は同じ手を出すので、
+  引き分けの次は必ず勝てる。ここではそれを使うプレイヤー（1回の勝負で 1/3 勝ち、1/3 引き分けから勝ち、
+  1/3 負け）を想定する。引き分けも含めた履歴が RPS_AUTO_CASHOUT_HISTORY 件に達した勝ちで自動キャッシュアウト
+"""
+import argparse
+import time
+from fractions import Fraction
+from typing import Any, Callable, NamedTuple, Optional
+
+import numpy as np
+
+from ui.pf import RPS_MAX_ROUNDS
+from utils.stake_mines import STAKE_MINES_MULTIPLIERS, STAKE_MINES_MULTIPLIERS_REDUCED, get_stake_multiplier
+
+MINES_CELLS = 25
+FLIP_PAYOUT = 2
+DICE_PAYOUT = 2
+RPS_BASE_MULTIPLIER = 1.96
+# commands/rps.py の自動キャッシュアウト（len(session.history) >= 20。引き分けも数える）
+RPS_AUTO_CASHOUT_HISTORY = 20
+DEFAULT_BET = 100
+
+BATCH_SIZE = 1 << 20
+BLOCK_ROUNDS = 1000
+
+# 配当表の目標RTP（元の表は Stake と同じ 1% 控除、REDUCED はさらに 0.95 倍）
+STAKE_TARGET_RTP = 0.99
+REDUCED_TARGET_RTP = STAKE_TARGET_RTP * 0.95
+RTP_TOLERANCE = 0.01
+
+
+# --- 閉じた式 ---
+
+def mines_success_prob(mine_count: int, picks: int) -> Fraction:
+    """mine_count 個の爆弾があるとき、picks 個続けて安全なマスを開ける確率"""
+    prob = Fraction(1)
+    safe = MINES_CELLS - mine_count
+    for i in range(picks):
+        prob *= Fraction(safe - i, MINES_CELLS - i)
+    return prob
+
+
+def dice_win_prob() -> Fraction:
+    """クラップス（パスライン）の勝率 244/495"""
+    ways = {total: 6 - abs(total - 7) for total in range(2, 13)}
+    prob = Fraction(ways[7] + ways[11], 36)
+    for point in (4, 5, 6, 8, 9, 10):
+        prob += Fraction(ways[point], 36) * Fraction(ways[point], ways[point] + ways[7])
+    return prob
+
+
+def rps_payout(wins: int, bet: int = DEFAULT_BET) -> int:
+    if wins == 0:
+        return bet
+    return int(bet * RPS_BASE_MULTIPLIER * (2 ** (wins - 1)))
+
+
+def rps_cashout_outcomes(target_wins: int) -> dict[int, Fraction]:
+    """target_wins 勝でのキャッシュアウトを狙ったときの、終了時の勝ち数ごとの確率（負けは含まない）。
+    引き分けの次は必ず勝つので、勝ちごとに履歴は1件（そのまま勝ち）か2件（引き分けてから勝ち）増える"""
+    outcomes: dict[int, Fraction] = {}
+    states = {(0, 0): Fraction(1)}
+    while states:
+        next_states: dict[tuple[int, int], Fraction] = {}
+        for (wins, history), prob in states.items():
+            for length in (1, 2):
+                key = (wins + 1, history + length)
+                if key[0] >= target_wins or key[1] >= RPS_AUTO_CASHOUT_HISTORY:
+                    outcomes[key[0]] = outcomes.get(key[0], Fraction(0)) + prob / 3
+                else:
+                    next_states[key] = next_states.get(key, Fraction(0)) + prob / 3
+        states = next_states
+    return outcomes
+
+
+def rps_rtp(target_wins: int, bet: int = DEFAULT_BET) -> float:
+    outcomes = rps_cashout_outcomes(target_wins)
+    return float(sum(prob * rps_payout(wins, bet) for wins, prob in outcomes.items()) / bet)
+
+
+def mines_payout(mine_count: int, picks: int, bet: int = DEFAULT_BET) -> int:
+    return round(bet * get_stake_multiplier(mine_count, picks))
+
+
+class Strategy(NamedTuple):
+    game: str
+    label: str
+    expected_rtp: float  # 閉じた式
+    max_payout: int  # 受取額の最大（bet あたりではなく額）
+    bet: int
+    simulate: Callable[[np.random.Generator, int], np.ndarray]  # n ラウンドの受取額（int64 配列、負けは0）
+
+
+def _fixed_payout(
+    simulate: Callable[[np.random.Generator, int], np.ndarray], payout: int
+) -> Callable[[np.random.Generator, int], np.ndarray]:
+    """勝敗（bool 配列）を返す simulate を、受取額を返すものにする"""
+    def wrapped(rng: np.random.Generator, n: int) -> np.ndarray:
+        return np.where(simulate(rng, n), np.int64(payout), np.int64(0))
+    return wrapped
+
+
+# --- シミュレーション（1バッチ分の勝敗か受取額を返す） ---
+
+def _simulate_flip(rng: np.random.Generator, n: int) -> np.ndarray:
+    return rng.random(n, dtype=np.float32) < 0.5
+
+
+# 合計ごとの出目の組み合わせ数（2-12）
+_DICE_WAYS = np.array([0, 0] + [6 - abs(total - 7) for total in range(2, 13)], dtype=np.int8)
+# 2つのダイスの36通りの出目の合計（1回の乱数で2つ振る）
+_DICE_TOTALS = np.array([a + b for a in range(1, 7) for b in range(1, 7)], dtype=np.int8)
+
+
+def _simulate_dice(rng: np.random.Generator, n: int) -> np.ndarray:
+    totals = _DICE_TOTALS[rng.integers(0, 36, size=n, dtype=np.uint8)]
+    won = (totals == 7) | (totals == 11)
+    point = ~won & (totals != 2) & (totals != 3) & (totals != 12)
+    # ポイントの後は「ポイントか7が出た振り」だけが決着に効くので、その
+    # ways[point] + 6 通りの出目から1つ引けば振り直しを繰り返したのと同じになる
+    ways = _DICE_WAYS[totals].astype(np.float32)
+    won |= point & (rng.random(n, dtype=np.float32) * (ways + 6) < ways)
+    return won
+
+
+def _simulate_mines(mine_count: int, picks: int) -> Callable[[np.random.Generator, int], np.ndarray]:
+    # 「picks 個開けて全て安全」と「爆弾 mine_count 個が全て開けたマス以外に置かれる」は同じ事象なので、
+    # 少ない方の回数だけ1つずつ置いて（開けて）いく
+    if picks <= mine_count:
+        steps, free = picks, MINES_CELLS - mine_count
+    else:
+        steps, free = mine_count, MINES_CELLS - picks
+
+    def simulate(rng: np.random.Generator, n: int) -> np.ndarray:
+        alive = np.ones(n, dtype=bool)
+        idx = None
+        for i in range(steps):
+            if idx is None:
+                alive &= rng.random(n, dtype=np.float32) * (MINES_CELLS - i) < (free - i)
+                # 生き残りが減ったら以後は残りの分だけ乱数を引く
+                if i % 4 == 3:
+                    idx = np.flatnonzero(alive)
+                    if idx.size > n // 2:
+                        idx = None
+            else:
+                hit = rng.random(idx.size, dtype=np.float32) * (MINES_CELLS - i) >= (free - i)
+                alive[idx[hit]] = False
+                idx = idx[~hit]
+        return alive
+
+    return simulate
+
+
+def _simulate_rps(target_wins: int, bet: int) -> Callable[[np.random.Generator, int], np.ndarray]:
+    # 勝ち数ごとの受取額（0勝で終わるのは負けだけ）
+    payouts = np.array([0] + [rps_payout(wins, bet) for wins in range(1, RPS_MAX_ROUNDS + 1)], dtype=np.int64)
+
+    def simulate(rng: np.random.Generator, n: int) -> np.ndarray:
+        final_wins = np.zeros(n, dtype=np.int64)
+        idx = np.arange(n)
+        wins = np.zeros(n, dtype=np.int64)
+        history = np.zeros(n, dtype=np.int64)
+        # 1回の勝負ごとに、続いているゲームだけ進める。0: 負け、1: そのまま勝ち、2: 引き分けてから勝ち
+        while idx.size:
+            r = rng.integers(0, 3, size=idx.size, dtype=np.uint8)
+            alive = r != 0
+            idx, r = idx[alive], r[alive]
+            wins = wins[alive] + 1
+            history = history[alive] + r
+            done = (wins >= target_wins) | (history >= RPS_AUTO_CASHOUT_HISTORY)
+            final_wins[idx[done]] = wins[done]
+            idx, wins, history = idx[~done], wins[~done], history[~done]
+        return payouts[final_wins]
+
+    return simulate
+
+
+def default_strategies(bet: int = DEFAULT_BET) -> list[Strategy]:
+    strategies = [
+        Strategy("flip", "flip", 0.5 * FLIP_PAYOUT, bet * FLIP_PAYOUT, bet, _fixed_payout(_simulate_flip, bet * FLIP_PAYOUT)),
+        Strategy(
+            "dice", "dice", float(dice_win_prob()) * DICE_PAYOUT, bet * DICE_PAYOUT, bet,
+            _fixed_payout(_simulate_dice, bet * DICE_PAYOUT),
+        ),
+    ]
+    for wins in (1, 2, 3, 5, 10, RPS_MAX_ROUNDS):
+        strategies.append(Strategy(
+            "rps", f"rps cashout@{wins}", rps_rtp(wins, bet), rps_payout(wins, bet), bet, _simulate_rps(wins, bet)
+        ))
+    for mine_count in (1, 3, 5, 10, 24):
+        for picks in (1, 3, 5, 10, 24):
+            if picks > MINES_CELLS - mine_count:
+                continue
+            payout = mines_payout(mine_count, picks, bet)
+            strategies.append(Strategy(
+                "mines", f"mines m={mine_count} cashout@{picks}",
+                float(mines_success_prob(mine_count, picks)) * payout / bet, payout, bet,
+                _fixed_payout(_simulate_mines(mine_count, picks), payout),
+            ))
+    return strategies
+
+
+def simulate(strategy: Strategy, rounds: int, rng: np.random.Generator, block_rounds: int = BLOCK_ROUNDS) -> dict[str, Any]:
+    """rounds ラウンド分を BATCH_SIZE ずつ進め、RTP・分散・ブロックごとの胴元損益を返す"""
+    batch = max(block_rounds, BATCH_SIZE // block_rounds * block_rounds)
+    wins = 0
+    paid = 0
+    # 受取額（bet 単位）の2乗の和。分散に使う
+    paid_sq = 0.0
+    played = 0
+    block_net: list[np.ndarray] = []
+    start = time.perf_counter()
+    while played < rounds:
+        n = min(batch, rounds - played)
+        payouts = strategy.simulate(rng, n)
+        wins += int(np.count_nonzero(payouts))
+        paid += int(payouts.sum())
+        paid_sq += float(np.square(payouts / strategy.bet).sum())
+        full = n // block_rounds * block_rounds
+        if full:
+            block_paid = payouts[:full].reshape(-1, block_rounds).sum(axis=1)
+            # 胴元から見た損益（プラスが胴元の利益）
+            block_net.append(block_rounds * strategy.bet - block_paid)
+        played += n
+    elapsed = time.perf_counter() - start
+
+    rtp = paid / played / strategy.bet
+    net = np.concatenate(block_net) if block_net else np.zeros(1, dtype=np.int64)
+    return {
+        "label": strategy.label,
+        "rounds": played,
+        "seconds": elapsed,
+        "win_rate": wins / played,
+        "rtp": rtp,
+        "expected_rtp": strategy.expected_rtp,
+        # 1ラウンドあたりの収支（bet 単位）の分散
+        "variance": paid_sq / played - rtp ** 2,
+        "max_payout": strategy.max_payout,
+        "block_rounds": block_rounds,
+        "block_net_p1": float(np.percentile(net, 1)),
+        "block_net_p50": float(np.percentile(net, 50)),
+        "block_net_worst": int(net.min()),
+    }
+
+
+# --- 配当表の検証 ---
+
+def validate_mines_table(table: dict[int, list[float]], target_rtp: float, tolerance: float = RTP_TOLERANCE) -> list[str]:
+    issues = []
+    for mine_count, multipliers in sorted(table.items()):
+        expected_len = MINES_CELLS - mine_count
+        if len(multipliers) != expected_len:
+            issues.append(f"m={mine_count}: 段数が {len(multipliers)}（正しくは {expected_len}）")
+        for i, multiplier in enumerate(multipliers):
+            picks = i + 1
+            if i > 0 and multiplier <= multipliers[i - 1]:
+                issues.append(f"m={mine_count} k={picks}: {multiplier} が前の段 {multipliers[i - 1]} 以下（単調でない）")
+            if picks > expected_len:
+                continue
+            rtp = multiplier * float(mines_success_prob(mine_count, picks))
+            if abs(rtp - target_rtp) > tolerance:
+                fair = 1 / float(mines_success_prob(mine_count, picks))
+                issues.append(
+                    f"m={mine_count} k={picks}: RTP {rtp:.4f}（目標 {target_rtp:.4f}、{multiplier} → 妥当値 {fair * target_rtp:.4f}）"
+                )
+    return issues
+
+
+def validate_rps_ladder(bet: int = DEFAULT_BET) -> list[str]:
+    """引き分けの後に同じ手が出ることを使うプレイヤーに対して、各キャッシュアウト地点の RTP を調べる"""
+    issues = []
+    for wins in range(1, RPS_MAX_ROUNDS + 1):
+        rtp = rps_rtp(wins, bet)
+        if rtp > 1:
+            issues.append(f"rps cashout@{wins}: RTP {rtp:.4f} が 1 を超えています（引き分けの次は相手が同じ手を出すため必ず勝てる）")
+    return issues
+
+
+def validate_house_edge(game: str, rtp: float) -> list[str]:
+    if rtp >= 1:
+        return [f"{game}: RTP {rtp:.4f} が 1 以上です（胴元の取り分がありません）"]
+    return []
+
+
+def validation_report() -> list[tuple[str, list[str], Optional[float]]]:
+    """(名前, 問題のリスト, 閉じた式のRTP) のリスト"""
+    flip_rtp = 0.5 * FLIP_PAYOUT
+    dice_rtp = float(dice_win_prob()) * DICE_PAYOUT
+    return [
+        ("STAKE_MINES_MULTIPLIERS", validate_mines_table(STAKE_MINES_MULTIPLIERS, STAKE_TARGET_RTP), None),
+        ("STAKE_MINES_MULTIPLIERS_REDUCED", validate_mines_table(STAKE_MINES_MULTIPLIERS_REDUCED, REDUCED_TARGET_RTP), None),
+        ("rps ladder", validate_rps_ladder(), rps_rtp(1)),
+        ("flip", validate_house_edge("flip", flip_rtp), flip_rtp),
+        ("dice", validate_house_edge("dice", dice_rtp), dice_rtp),
+    ]
+
+
+def format_result(result: dict[str, Any]) -> str:
+    rate = result["rounds"] / result["seconds"] / 1e6 if result["seconds"] else 0.0
+    return (
+        f"{result['label']:<28} RTP {result['rtp']:.5f}（理論 {result['expected_rtp']:.5f}） "
+        f"分散 {result['variance']:.3f} 最大配当 {result['max_payout']:,} "
+        f"{result['block_rounds']}回ごとの胴元損益 p50 {result['block_net_p50']:,.0f} "
+        f"p1 {result['block_net_p1']:,.0f} 最悪 {result['block_net_worst']:,} "
+        f"({result['rounds']:,}回, {result['seconds']:.1f}秒, {rate:.0f}M回/秒)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="RTPシミュレーションと配当表の検証")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("validate", help="配当表を閉じた式の確率と突き合わせる")
+    sim = sub.add_parser("simulate", help="戦略ごとにシミュレーションする")
+    sim.add_argument("--rounds", type=int, default=100_000_000)
+    sim.add_argument("--game", choices=["flip", "dice", "mines", "rps"])
+    sim.add_argument("--bet", type=int, default=DEFAULT_BET)
+    sim.add_argument("--block", type=int, default=BLOCK_ROUNDS)
+    sim.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.command == "validate":
+        failed = False
+        for name, issues, rtp in validation_report():
+            suffix = f"（RTP {rtp:.4f}）" if rtp is not None else ""
+            print(f"[{'OK' if not issues else 'NG'}] {name}{suffix}")
+            for issue in issues:
+                print(f"    {issue}")
+            failed = failed or bool(issues)
+        if failed:
+            raise SystemExit(1)
+        return
+
+    rng = np.random.default_rng(args.seed)
+    for strategy in default_strategies(args.bet):
+        if args.game and strategy.game != args.game:
+            continue
+        print(format_result(simulate(strategy, args.rounds, rng, args.block)), flush=True)
+
+
+if __name__ == "__main__":
+    main()